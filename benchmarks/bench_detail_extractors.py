@@ -0,0 +1,107 @@
+"""Micro-benchmark for the realtor.com detail page extractors.
+
+Runs every extractor in functions/detail_extractors.py over the same HTML
+fixtures and reports parse time and peak Python memory per page. Point
+--fixtures at a directory of saved detail pages (*.html); without it a set of
+synthetic pages shaped like realtor.com listings is generated.
+
+    python benchmarks/bench_detail_extractors.py --fixtures saved_pages/ --repeat 20
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+
+from detail_extractors import EXTRACTORS  # noqa: E402
+
+
+def synthetic_page(beds, baths, rent, filler_kb=400, seed=0):
+    """A page with a large head, the listing facts near the top of the body and a long tail"""
+    script = '{"props": {"pageProps": {"property": {' + ','.join(
+        f'"field_{i}": "{"x" * 40}"' for i in range(filler_kb * 8)
+    ) + '}}}}'
+    nav = ''.join(f'<li class="nav-item"><a href="/section/{i}">Section {i}</a></li>' for i in range(200))
+    gallery = ''.join(f'<div class="photo"><img src="https://ap.rdcpix.com/{seed}-{i}.jpg" alt="Photo {i}"></div>' for i in range(60))
+    facts = (
+        '<ul class="property-meta">'
+        f'<li data-testid="property-meta-beds"><span data-testid="meta-value">{beds}</span><span>bed</span></li>'
+        f'<li data-testid="property-meta-baths"><span data-testid="meta-value">{baths}</span><span>bath</span></li>'
+        '</ul>'
+        f'<div class="price-section"><div class="price-details"><span>{rent}</span><span>/mo</span></div></div>'
+    )
+    tail = ''.join(
+        f'<section class="detail-block"><h3>Feature {i}</h3><p>{"Lorem ipsum dolor sit amet. " * 10}</p></section>'
+        for i in range(filler_kb // 2)
+    )
+    return (
+        '<!DOCTYPE html><html><head><title>Listing</title>'
+        f'<script id="__NEXT_DATA__" type="application/json">{script}</script>'
+        f'</head><body><nav><ul>{nav}</ul></nav><main>{gallery}{facts}{tail}</main></body></html>'
+    ).encode('utf-8')
+
+
+def load_fixtures(fixtures_dir):
+    if fixtures_dir:
+        paths = sorted(glob.glob(os.path.join(fixtures_dir, '*.html')))
+        if not paths:
+            sys.exit(f"No *.html fixtures found in {fixtures_dir}")
+        return [(os.path.basename(p), open(p, 'rb').read()) for p in paths]
+    samples = [('Studio', '1', '$1,850'), ('2', '1', '$3,200'), ('3', '2.5', '$4,950'), ('1', '1', '$2,400')]
+    return [(f'synthetic-{i}', synthetic_page(*sample, seed=i)) for i, sample in enumerate(samples)]
+
+
+def bench(extractor, fixtures, repeat):
+    timings = []
+    for _ in range(repeat):
+        for _, html in fixtures:
+            start = time.perf_counter()
+            extractor(html)
+            timings.append(time.perf_counter() - start)
+
+    peaks = []
+    for _, html in fixtures:
+        tracemalloc.start()
+        extractor(html)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return timings, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fixtures', help='directory of saved detail pages (*.html)')
+    parser.add_argument('--repeat', type=int, default=10, help='passes over the fixtures per extractor')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    total_kb = sum(len(html) for _, html in fixtures) / 1024
+    print(f"{len(fixtures)} fixtures, {total_kb:.0f} KB total, {args.repeat} passes\n")
+
+    # Every extractor has to agree before timing means anything
+    reference = [EXTRACTORS['bs4'](html) for _, html in fixtures]
+    for name, extractor in EXTRACTORS.items():
+        for (fixture, html), expected in zip(fixtures, reference):
+            got = extractor(html)
+            if got != expected:
+                sys.exit(f"{name} disagrees with bs4 on {fixture}: {got} != {expected}")
+
+    print(f"{'extractor':<10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>9}")
+    results = {}
+    for name, extractor in EXTRACTORS.items():
+        timings, peaks = bench(extractor, fixtures, args.repeat)
+        ms = sorted(t * 1000 for t in timings)
+        results[name] = statistics.mean(ms)
+        print(f"{name:<10} {statistics.mean(ms):>9.2f} {ms[len(ms) // 2]:>9.2f} "
+              f"{ms[min(len(ms) - 1, int(len(ms) * 0.99))]:>9.2f} {max(peaks) / 1024:>9.0f}")
+
+    if 'fast' in results and 'bs4' in results:
+        print(f"\nfast is {results['bs4'] / results['fast']:.1f}x faster than bs4")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Cold-start import cost of the functions entry module, per function.
+
+Runs `python -X importtime` in a fresh interpreter for each code path:
+importing main.py alone (what deploy-time discovery pays), then main.py plus
+the modules each function loads on its first invocation. Each function is
+imported with FUNCTION_TARGET set to its name, as on its Cloud Run service,
+so the model preload counts where the instance would pay for it.
+Reports total import seconds and the heaviest top-level imports.
+
+Save a baseline and compare later runs against it to catch regressions:
+
+    cd functions && python ../benchmarks/bench_importtime.py --save importtime.json
+    cd functions && python ../benchmarks/bench_importtime.py --baseline importtime.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'functions')
+
+# What each function imports lazily on its first call; keep in step with main.py
+FUNCTION_IMPORTS = {
+    'main': [],
+    'test_predictions': ['ml_model.predict', 'lightgbm', 'firebase_admin.firestore'],
+    'scheduled_function': [
+        'ml_model.predict', 'lightgbm', 'firebase_admin.firestore',
+        'homeharvest', 'ingest', 'detail_scraper', 'http_cache', 'aggregates', 'sharding', 'locations',
+        'rent_history', 'property_query', 'pipeline', 'retention', 'listing_schema',
+    ],
+    'predict_rent': ['prediction_batcher', 'ml_model.predict', 'lightgbm'],
+    'query_properties': ['property_query', 'firebase_admin.firestore'],
+    'rent_trends': ['rent_history', 'property_query', 'firebase_admin.firestore'],
+}
+
+
+def function_env(target=None):
+    """The environment an instance serving `target` imports main.py in (None: deploy-time discovery)"""
+    env = {k: v for k, v in os.environ.items() if k not in ('PRELOAD_MODEL', 'FUNCTION_TARGET', 'K_SERVICE')}
+    if target is not None:
+        env.update(FUNCTION_TARGET=target, K_SERVICE=target.replace('_', '-'))
+    return env
+
+
+def top_level_imports(statement, target=None):
+    """{module: cumulative microseconds} for the top-level imports `statement` triggers"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=FUNCTIONS_DIR, env=function_env(target),
+        check=True, capture_output=True, text=True,
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Top-level imports are the ones without indentation
+        if not name.startswith('  '):
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure(path, repeat, startup_modules):
+    """Median total import microseconds plus the top-level modules of the median run"""
+    statement = '; '.join(['import main'] + [f'import {module}' for module in FUNCTION_IMPORTS[path]])
+    runs = []
+    for _ in range(repeat):
+        modules = top_level_imports(statement, target=None if path == 'main' else path)
+        runs.append({name: us for name, us in modules.items() if name not in startup_modules})
+    runs.sort(key=lambda r: sum(r.values()))
+    median = runs[len(runs) // 2]
+    return {'total_us': sum(median.values()), 'modules': median}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per code path')
+    parser.add_argument('--top', type=int, default=5, help='heaviest top-level imports to list')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a file written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs the baseline')
+    args = parser.parse_args()
+
+    # Modules the interpreter imports before running anything (site, encodings, ...)
+    startup_modules = set(top_level_imports('pass'))
+    results = {path: measure(path, args.repeat, startup_modules) for path in FUNCTION_IMPORTS}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for path, result in results.items():
+        line = f"{path:<20} {result['total_us'] / 1e6:6.3f}s"
+        if baseline and path in baseline:
+            before = baseline[path]['total_us']
+            change = result['total_us'] / before - 1
+            line += f"  ({change:+.0%} vs baseline {before / 1e6:.3f}s)"
+            if change > args.tolerance:
+                regressions.append(path)
+        print(line)
+        heaviest = sorted(result['modules'].items(), key=lambda item: -item[1])[:args.top]
+        print('    ' + ', '.join(f"{name} {us / 1e6:.3f}s" for name, us in heaviest))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"Import time regressed by more than {args.tolerance:.0%} for: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
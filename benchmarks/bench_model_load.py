@@ -0,0 +1,92 @@
+"""Cold-start cost of loading the rent model: legacy joblib bundle vs the artifact.
+
+Each format is loaded in a fresh interpreter. The imports the loader needs
+(lightgbm, which pulls in scikit-learn, and joblib for the legacy bundle) are
+timed separately from deserializing the model itself. Reports wall time and
+the resident memory each phase added.
+
+    cd functions && python ../benchmarks/bench_model_load.py --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'functions', 'ml_model')
+FORMATS = {
+    'joblib': os.path.join(MODEL_DIR, 'rent_prediction_model.joblib'),
+    'artifact': os.path.join(MODEL_DIR, 'rent_prediction_model.json'),
+}
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def load_once(fmt):
+    sys.path.insert(0, os.path.dirname(MODEL_DIR))
+    import numpy  # noqa: F401  both paths need it; keep it out of the comparison
+    import pandas  # noqa: F401
+
+    before = rss_mb()
+    start = time.perf_counter()
+    import lightgbm  # noqa: F401
+    if fmt == 'joblib':
+        import joblib
+        import sklearn.preprocessing  # noqa: F401
+        load = joblib.load
+    else:
+        from ml_model.artifact import load_artifact as load
+    imported, import_rss = time.perf_counter(), rss_mb()
+
+    load(FORMATS[fmt])
+    return {
+        'import_seconds': imported - start,
+        'import_rss_mb': import_rss - before,
+        'load_seconds': time.perf_counter() - imported,
+        'load_rss_mb': rss_mb() - import_rss,
+    }
+
+
+def size_on_disk(fmt):
+    if fmt == 'joblib':
+        return os.path.getsize(FORMATS[fmt])
+    with open(FORMATS[fmt]) as f:
+        model_file = json.load(f)['model_file']
+    return os.path.getsize(FORMATS[fmt]) + os.path.getsize(os.path.join(MODEL_DIR, model_file))
+
+
+def median(runs, key):
+    return sorted(r[key] for r in runs)[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per format')
+    parser.add_argument('--format', choices=FORMATS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.format:
+        print(json.dumps(load_once(args.format)))
+        return
+
+    for fmt, path in FORMATS.items():
+        if not os.path.exists(path):
+            print(f"{fmt:<9} missing {path}")
+            continue
+        runs = [
+            json.loads(subprocess.run([sys.executable, __file__, '--format', fmt],
+                                      check=True, capture_output=True, text=True).stdout)
+            for _ in range(args.repeat)
+        ]
+        print(f"{fmt:<9} {size_on_disk(fmt) / 1024:6.1f} KB on disk | "
+              f"imports {median(runs, 'import_seconds') * 1000:6.1f} ms +{median(runs, 'import_rss_mb'):.1f} MB | "
+              f"deserialize {median(runs, 'load_seconds') * 1000:6.1f} ms +{median(runs, 'load_rss_mb'):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
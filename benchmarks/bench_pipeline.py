@@ -0,0 +1,274 @@
+"""Offline end-to-end benchmark of the scheduled ingest pipeline.
+
+Replays current_properties.json as the scrape_property output and runs it
+through ingest.run_ingest with an in-memory Firestore (functions/tests/fake_firestore.py) and
+a local stub HTTP server standing in for realtor.com detail pages. It reports
+per-stage seconds, listings/sec, p50/p99 per-listing latency and peak RSS. The
+fixture can be scaled synthetically (--scales 1,10,100); each scale runs in
+its own process so peak RSS isn't carried over from the previous one.
+
+    python benchmarks/bench_pipeline.py --scales 1,10 --rpc-latency-ms 20 --http-latency-ms 150
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'functions'))
+sys.path.insert(0, BENCH_DIR)
+
+import pandas as pd  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+
+from bench_detail_extractors import synthetic_page  # noqa: E402
+from tests.fake_firestore import FakeFirestore  # noqa: E402
+
+DEFAULT_FIXTURE = os.path.join(REPO_DIR, 'current_properties.json')
+
+# Fields the scraped detail page supplies; homeharvest doesn't have them
+DETAIL_FIELDS = ('beds', 'baths', 'rent')
+
+
+def load_fixture(path, scale):
+    """The fixture as a scrape_property-shaped DataFrame, replicated `scale` times"""
+    with open(path) as f:
+        records = json.load(f)
+
+    rows = []
+    for copy_index in range(scale):
+        for record in records:
+            row = {k: v for k, v in record.items() if k not in DETAIL_FIELDS and not k.startswith(('predict', 'rent_prediction', 'model_version', 'content_fingerprint'))}
+            # homeharvest hands back plain dates
+            row['list_date'] = str(record.get('list_date', ''))[:10]
+            if copy_index:
+                row['property_url'] = re.sub(r'(\d+)$', lambda m: f"{m.group(1)}{copy_index:03d}", record['property_url'])
+                row['latitude'] = record['latitude'] + copy_index * 1e-5
+                row['longitude'] = record['longitude'] - copy_index * 1e-5
+            rows.append(row)
+
+    details = {re.search(r'(\d+)$', r['property_url']).group(1): tuple(r.get(f, 'N/A') for f in DETAIL_FIELDS)
+               for r in records}
+    return pd.DataFrame(rows), details
+
+
+def start_stub_server(details, page_kb, latency):
+    """Serve realtor-shaped detail pages keyed by the listing id at the end of the URL"""
+    # Build the page once and fill in each listing's facts per request, so the
+    # stub's own cost stays out of the measurement
+    template = synthetic_page('{BEDS}', '{BATHS}', '{RENT}', filler_kb=page_kb)
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real site; HTTP/1.0 would reconnect on every request
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            listing_id = re.search(r'_M(\d+)$', self.path).group(1)
+            # Synthetic copies share the original listing's details
+            beds, baths, rent = details.get(listing_id) or details.get(listing_id[:-3], ('N/A', 'N/A', 'N/A'))
+            body = (template.replace(b'{BEDS}', beds.encode())
+                    .replace(b'{BATHS}', baths.encode())
+                    .replace(b'{RENT}', rent.encode()))
+            if latency:
+                time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StubRedirectAdapter(HTTPAdapter):
+    """Sends every request to the stub server instead of realtor.com"""
+
+    def __init__(self, stub_base, **kwargs):
+        self.stub_base = stub_base
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = re.sub(r'^https?://[^/]+', self.stub_base, request.url)
+        return super().send(request, **kwargs)
+
+
+def firestore_size(value):
+    """Stored size in bytes, by Firestore's documented storage-size rules"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, (list, tuple)):
+        return sum(firestore_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(firestore_size(k) + firestore_size(v) for k, v in value.items())
+    # Numbers, timestamps and anything else the client stores in 8 bytes
+    return 8
+
+
+def document_sizes(collection):
+    """(mean stored bytes per document, bytes of the JSON export of the collection)"""
+    docs = collection._docs
+    if not docs:
+        return 0, 0
+    stored = [firestore_size(f"projects/p/databases/(default)/documents/properties/{doc_id}") + firestore_size(data) + 32
+              for doc_id, data in docs.items()]
+    export = json.dumps([dict(data, id=doc_id) for doc_id, data in docs.items()], default=str)
+    return round(sum(stored) / len(stored)), len(export.encode('utf-8'))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_once(args):
+    from detail_scraper import DetailScraper, create_session
+    from ingest import run_ingest
+    from ml_model.predict import warm_model
+    from property_store import PropertyStore
+
+    warm_model()
+
+    run_start = time.perf_counter()
+    properties, details = load_fixture(args.fixture, args.scale)
+    scrape_seconds = time.perf_counter() - run_start
+
+    server = start_stub_server(details, args.page_kb, args.http_latency_ms / 1000)
+    session = create_session(pool_size=args.workers)
+    adapter = StubRedirectAdapter(f"http://127.0.0.1:{server.server_port}",
+                                  pool_connections=args.workers, pool_maxsize=args.workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    scraper = DetailScraper(max_workers=args.workers, requests_per_second=args.rps, session=session)
+
+    fetch_latencies = []
+    fetch = scraper.fetch
+
+    def timed_fetch(url):
+        start = time.perf_counter()
+        try:
+            return fetch(url)
+        finally:
+            fetch_latencies.append(time.perf_counter() - start)
+    scraper.fetch = timed_fetch
+
+    db = FakeFirestore(rpc_latency=args.rpc_latency_ms / 1000)
+    written_at = {}
+    collection = db.collection('properties')
+    apply_set = collection._apply_set
+
+    def recording_set(doc_id, data, merge):
+        apply_set(doc_id, data, merge)
+        written_at[doc_id] = time.perf_counter()
+    collection._apply_set = recording_set
+
+    store = PropertyStore(db)
+    runs = []
+    for label in ('cold', 'warm') if args.warm else ('cold',):
+        fetch_latencies.clear()
+        written_at.clear()
+        start = time.perf_counter()
+        summary = run_ingest(properties, store, scraper.fetch, fetch_workers=args.workers)
+        elapsed = time.perf_counter() - start
+        stage_seconds = dict(summary['stage_seconds'])
+        if label == 'cold':
+            stage_seconds = dict(scrape=round(scrape_seconds, 4), **stage_seconds)
+        end_to_end = [t - start for t in written_at.values()]
+        doc_bytes, export_bytes = document_sizes(collection)
+        runs.append({
+            'run': label,
+            'listings': len(properties),
+            'seconds': round(elapsed, 3),
+            'listings_per_sec': round(len(properties) / elapsed, 1) if elapsed else None,
+            'stage_seconds': stage_seconds,
+            'fetch_p50_ms': round(percentile(fetch_latencies, 50) * 1000, 1),
+            'fetch_p99_ms': round(percentile(fetch_latencies, 99) * 1000, 1),
+            'latency_p50_ms': round(percentile(end_to_end, 50) * 1000, 1),
+            'latency_p99_ms': round(percentile(end_to_end, 99) * 1000, 1),
+            'doc_bytes': doc_bytes,
+            'export_bytes': export_bytes,
+            'rpcs': dict(db.rpc_counts),
+            'counts': {k: v for k, v in summary.items() if k != 'stage_seconds'},
+        })
+        db.rpc_counts.clear()
+
+    server.shutdown()
+    # ru_maxrss is in KB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'scale': args.scale, 'peak_rss_mb': round(peak_rss_mb, 1), 'runs': runs}
+
+
+def print_report(result):
+    print(f"\nscale {result['scale']}x, peak RSS {result['peak_rss_mb']} MB")
+    for run in result['runs']:
+        print(f"  {run['run']:<5} {run['listings']} listings in {run['seconds']}s "
+              f"({run['listings_per_sec']}/s), per-listing p50 {run['latency_p50_ms']} ms "
+              f"p99 {run['latency_p99_ms']} ms, detail fetch p50 {run['fetch_p50_ms']} ms "
+              f"p99 {run['fetch_p99_ms']} ms")
+        print(f"        stages: {run['stage_seconds']}")
+        print(f"        stored document mean {run['doc_bytes']} B, JSON export {run['export_bytes'] / 1e6:.2f} MB")
+        print(f"        rpcs: {run['rpcs']}  counts: {run['counts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE)
+    parser.add_argument('--scales', default='1', help='comma separated fixture multipliers, e.g. 1,10,100')
+    parser.add_argument('--scale', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='print the raw result as JSON')
+    parser.add_argument('--workers', type=int, default=8, help='detail scrape concurrency')
+    parser.add_argument('--rps', type=float, default=1000.0, help='detail scrape rate limit')
+    parser.add_argument('--page-kb', type=int, default=100, help='size of each stub detail page')
+    parser.add_argument('--http-latency-ms', type=float, default=0.0)
+    parser.add_argument('--rpc-latency-ms', type=float, default=0.0)
+    parser.add_argument('--warm', action='store_true', help='run a second pass where nothing changed')
+    parser.add_argument('--log', action='store_true', help='keep INFO logging on')
+    args = parser.parse_args()
+
+    if not args.log:
+        logging.disable(logging.INFO)
+
+    if args.scale is not None:
+        result = run_once(args)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_report(result)
+        return
+
+    passthrough = [
+        '--fixture', args.fixture, '--workers', str(args.workers), '--rps', str(args.rps),
+        '--page-kb', str(args.page_kb), '--http-latency-ms', str(args.http_latency_ms),
+        '--rpc-latency-ms', str(args.rpc_latency_ms),
+    ] + (['--warm'] if args.warm else []) + (['--log'] if args.log else [])
+    results = []
+    for scale in [int(s) for s in args.scales.split(',')]:
+        output = subprocess.run(
+            [sys.executable, __file__, '--scale', str(scale), '--json'] + passthrough,
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        if not args.json:
+            print_report(result)
+    if args.json:
+        print(json.dumps(results))
+
+if __name__ == '__main__':
+    main()
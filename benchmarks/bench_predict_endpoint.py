@@ -0,0 +1,181 @@
+"""Concurrent load test of the predict_rent endpoint.
+
+Each of --concurrency client threads sends --requests single-property POSTs
+back to back, built from listings in current_properties.json (jittered so the
+prediction cache can't answer them). The handler runs in process through a
+Flask test request, or against a running emulator/deployment with --url.
+Requests are run once unbatched (every request calling predict_rental_price
+directly, the per-request baseline) and once for each --windows batching
+window in milliseconds. Reports throughput, client-side p50/p90/p99 latency
+and how many requests shared each model call.
+
+    cd functions && python ../benchmarks/bench_predict_endpoint.py --concurrency 32 --windows 0,2,5,10
+    python benchmarks/bench_predict_endpoint.py --url http://127.0.0.1:5001/<project>/us-central1/predict_rent
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'functions'))
+
+DEFAULT_FIXTURE = os.path.join(REPO_DIR, 'current_properties.json')
+PAYLOAD_FIELDS = ('beds', 'baths', 'latitude', 'longitude', 'zip_code', 'style', 'days_on_mls', 'list_date')
+
+
+def load_payloads(path, count, seed=0):
+    with open(path) as f:
+        records = json.load(f)
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        record = records[i % len(records)]
+        payload = {k: record[k] for k in PAYLOAD_FIELDS if record.get(k) is not None}
+        payload['list_date'] = str(payload.get('list_date', ''))[:10] or None
+        payload['latitude'] = payload.get('latitude', 37.8715) + rng.uniform(-1e-3, 1e-3)
+        payload['longitude'] = payload.get('longitude', -122.2730) + rng.uniform(-1e-3, 1e-3)
+        payloads.append(payload)
+    return payloads
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def local_client(mode):
+    """call(payload) -> server-reported latency for one request against the in-process handler"""
+    import flask
+
+    import main
+
+    if mode == 'direct':
+        from ml_model.predict import predict_rental_price
+
+        def call(payload):
+            start = time.perf_counter()
+            predict_rental_price(payload)
+            return (time.perf_counter() - start) * 1000, 1
+        return call
+
+    os.environ['PREDICT_BATCH_WINDOW_MS'] = str(mode)
+    main._prediction_batcher = None
+    # The CORS wrapper needs the request context the functions runtime provides
+    app = flask.Flask(__name__)
+
+    def call(payload):
+        with app.test_request_context(method='POST', json=payload, headers={'Origin': 'http://localhost'}):
+            response = main.predict_rent(flask.request)
+        body = json.loads(response.get_data())
+        if response.status_code != 200:
+            raise RuntimeError(body)
+        return body['latency_ms'], body['batch']['requests']
+    return call
+
+
+def remote_client(url):
+    def call(payload):
+        request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            body = json.loads(response.read())
+        return body['latency_ms'], body['batch']['requests']
+    return call
+
+
+def run_load(call, payloads, concurrency, per_client):
+    latencies, server_latencies, shared, errors = [], [], [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency)
+
+    def client(offset):
+        barrier.wait()
+        for i in range(per_client):
+            payload = payloads[(offset * per_client + i) % len(payloads)]
+            start = time.perf_counter()
+            try:
+                server_ms, batch_requests = call(payload)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                server_latencies.append(server_ms)
+                shared.append(batch_requests)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p90_ms': round(percentile(latencies, 0.9), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'server_p50_ms': round(sorted(server_latencies)[len(server_latencies) // 2], 2),
+        'mean_requests_per_batch': round(sum(shared) / len(shared), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=50, help='requests per client thread')
+    parser.add_argument('--windows', default='0,2,5,10', help='batching windows to try, in milliseconds')
+    parser.add_argument('--url', help='load-test a running endpoint instead of the in-process handler')
+    parser.add_argument('--cache', action='store_true', help='leave the prediction cache on')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    # The unbatched path logs an ERROR for every listing it can't score
+    logging.disable(logging.ERROR)
+    if not args.cache:
+        os.environ['PREDICTION_CACHE_SIZE'] = '0'
+    payloads = load_payloads(args.fixture, args.concurrency * args.requests)
+
+    if args.url:
+        modes = [('remote', lambda: remote_client(args.url))]
+    else:
+        from ml_model.predict import warm_model
+
+        warm_model()
+        modes = [('direct', lambda: local_client('direct'))]
+        modes += [(f"window={w}ms", lambda w=w: local_client(w)) for w in args.windows.split(',')]
+
+    results = {}
+    for name, make_client in modes:
+        # Each batched mode gets a fresh batcher with its own window
+        call = make_client()
+        # A short warm-up so thread start and first-call costs don't land in the numbers
+        run_load(call, payloads, min(4, args.concurrency), 5)
+        results[name] = run_load(call, payloads, args.concurrency, args.requests)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{args.concurrency} clients x {args.requests} requests")
+    print(f"{'mode':<14}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'server p50':>12}{'req/batch':>11}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['requests_per_sec']:>9}{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['server_p50_ms']:>12}{r['mean_requests_per_batch']:>11}{r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
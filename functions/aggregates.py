@@ -0,0 +1,260 @@
+"""Dashboard aggregates kept in the `aggregates` collection.
+
+Each document (overall, by_zip, by_beds, by_style) holds running sums per group:
+listing count, count/sum/sum of squares of asking rent, predicted rent,
+asking-minus-predicted delta and days on MLS, plus an asking-rent histogram.
+Ingest only sends the difference a run made (listings added, changed or
+removed), applied with Firestore increments, so concurrent runs can't lose
+each other's updates. After applying, the derived `summary` map (means,
+standard deviations, rent quartiles, demand index) is recomputed from the
+sums; that's what clients read.
+"""
+import logging
+import math
+import re
+from datetime import datetime
+
+import metrics
+
+AGGREGATES_COLLECTION = 'aggregates'
+DIMENSIONS = ('overall', 'by_zip', 'by_beds', 'by_style')
+VALUE_FIELDS = ('rent', 'predicted', 'delta', 'days_on_mls')
+RENT_BUCKET_WIDTH = 250
+MAX_RENT_BUCKET = 20000
+
+
+def parse_rent(value):
+    """'$2,495/mo' or 2495.0 -> 2495.0; 'N/A', 'Contact For Price' and missing values -> None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) and value > 0 else None
+    match = re.search(r'\$?\s*([\d,]+(?:\.\d+)?)', str(value))
+    if not match:
+        return None
+    rent = float(match.group(1).replace(',', ''))
+    return rent if rent > 0 else None
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def beds_group(beds):
+    from ml_model.normalize import extract_first_number
+
+    count = int(extract_first_number(beds))
+    if count == 0:
+        return 'studio'
+    return '5+' if count >= 5 else str(count)
+
+
+def listing_values(property_data):
+    """The numbers a stored listing contributes to every group it belongs to"""
+    rent = parse_rent(property_data.get('rent'))
+    if rent is None:
+        rent = parse_rent(property_data.get('list_price'))
+    predicted = _number(property_data.get('predicted_rent')) if property_data.get('prediction_success') else None
+    return {
+        'rent': rent,
+        'predicted': predicted,
+        'delta': rent - predicted if rent is not None and predicted is not None else None,
+        'days_on_mls': _number(property_data.get('days_on_mls')),
+    }
+
+
+def listing_groups(property_data):
+    """(dimension, group) pairs a listing is counted in"""
+    return [
+        ('overall', 'all'),
+        ('by_zip', str(property_data.get('zip_code') or 'unknown')),
+        ('by_beds', beds_group(property_data.get('beds'))),
+        ('by_style', str(property_data.get('style') or 'unknown')),
+    ]
+
+
+class AggregateDelta:
+    """Changes to the aggregate sums made by one run, keyed by (dimension, group)"""
+
+    def __init__(self):
+        self.changes = {}
+        self.listings_added = 0
+        self.listings_removed = 0
+
+    def _apply(self, property_data, sign):
+        values = listing_values(property_data)
+        rent_bucket = None
+        if values['rent'] is not None:
+            rent_bucket = str(min(int(values['rent'] // RENT_BUCKET_WIDTH) * RENT_BUCKET_WIDTH, MAX_RENT_BUCKET))
+        for key in listing_groups(property_data):
+            fields = self.changes.setdefault(key, {})
+            fields['listings'] = fields.get('listings', 0) + sign
+            for name in VALUE_FIELDS:
+                value = values[name]
+                if value is None:
+                    continue
+                fields[f'{name}_count'] = fields.get(f'{name}_count', 0) + sign
+                fields[f'{name}_sum'] = fields.get(f'{name}_sum', 0.0) + sign * value
+                fields[f'{name}_sum_sq'] = fields.get(f'{name}_sum_sq', 0.0) + sign * value * value
+            if rent_bucket is not None:
+                histogram = fields.setdefault('rent_histogram', {})
+                histogram[rent_bucket] = histogram.get(rent_bucket, 0) + sign
+
+    def add(self, property_data):
+        self._apply(property_data, 1)
+        self.listings_added += 1
+
+    def remove(self, property_data):
+        self._apply(property_data, -1)
+        self.listings_removed += 1
+
+    def replace(self, old_data, new_data):
+        """A stored listing was rewritten; old_data may be None for a new listing"""
+        if old_data is not None:
+            self.remove(old_data)
+        self.add(new_data)
+
+    def __bool__(self):
+        return bool(self.changes)
+
+
+def _stats(sums, name):
+    count = sums.get(f'{name}_count', 0)
+    if count <= 0:
+        return None
+    mean = sums.get(f'{name}_sum', 0.0) / count
+    variance = max(sums.get(f'{name}_sum_sq', 0.0) / count - mean * mean, 0.0)
+    return {'count': count, 'mean': round(mean, 2), 'std': round(math.sqrt(variance), 2)}
+
+
+def _histogram_quantiles(histogram, quantiles=(0.25, 0.5, 0.75)):
+    """Approximate quantiles, interpolating linearly inside each histogram bucket"""
+    buckets = sorted((int(floor), count) for floor, count in (histogram or {}).items() if count > 0)
+    total = sum(count for _, count in buckets)
+    if not total:
+        return {}
+    result = {}
+    for q in quantiles:
+        target = q * total
+        seen = 0
+        for floor, count in buckets:
+            if seen + count >= target:
+                result[f'p{int(q * 100)}'] = round(floor + RENT_BUCKET_WIDTH * (target - seen) / count, 2)
+                break
+            seen += count
+    return result
+
+
+def summarize(groups, overall_days=None):
+    """Derived, client-facing stats for every group with at least one listing"""
+    summary = {}
+    for group, sums in groups.items():
+        if sums.get('listings', 0) <= 0:
+            continue
+        entry = {'listings': sums['listings']}
+        for name in VALUE_FIELDS:
+            stats = _stats(sums, name)
+            if stats:
+                entry[name] = stats
+        entry.update(_histogram_quantiles(sums.get('rent_histogram')))
+        if 'delta' in entry and 'predicted' in entry and entry['predicted']['mean']:
+            entry['delta_pct'] = round(entry['delta']['mean'] / entry['predicted']['mean'], 4)
+        # Demand index: how much faster than the market listings here go (>1 is hotter)
+        if overall_days and 'days_on_mls' in entry and entry['days_on_mls']['mean'] > 0:
+            entry['demand_index'] = round(overall_days / entry['days_on_mls']['mean'], 3)
+        summary[group] = entry
+    return summary
+
+
+class AggregateStore:
+    """Applies AggregateDeltas to the aggregates collection and rebuilds it when needed"""
+
+    def __init__(self, db, collection=AGGREGATES_COLLECTION, properties_collection='properties'):
+        self.db = db
+        self.collection = collection
+        self.properties_collection = properties_collection
+
+    def _ref(self, dimension):
+        return self.db.collection(self.collection).document(dimension)
+
+    @staticmethod
+    def _increments(fields, increment):
+        """Firestore increments for the non-zero changes in fields.
+
+        Zero changes (a listing that changed but stayed in the same group) are dropped,
+        and so are maps left empty, because merging an empty map would replace
+        the stored one.
+        """
+        increments = {}
+        for name, value in fields.items():
+            if isinstance(value, dict):
+                nested = AggregateStore._increments(value, increment)
+                if nested:
+                    increments[name] = nested
+            elif value:
+                increments[name] = increment(value)
+        return increments
+
+    def apply(self, delta):
+        """Add a run's changes to the stored sums, then refresh the summaries.
+
+        If the aggregates don't exist yet, they are built from every stored
+        listing instead, since a delta alone would only cover this run.
+        """
+        from google.cloud.firestore import Increment
+
+        if not self._ref('overall').get().exists:
+            logging.info("No aggregates stored yet, building them from every listing")
+            return self.rebuild()
+        if not delta:
+            return self.refresh_summaries()
+
+        batch = self.db.batch()
+        by_dimension = {}
+        for (dimension, group), fields in delta.changes.items():
+            increments = self._increments(fields, Increment)
+            if increments:
+                by_dimension.setdefault(dimension, {})[group] = increments
+        for dimension, groups in by_dimension.items():
+            batch.set(self._ref(dimension), {'groups': groups}, merge=True)
+        batch.commit()
+        metrics.incr('aggregates.groups_updated', len(delta.changes))
+        logging.info(f"Applied aggregate changes for {delta.listings_added} added and "
+                     f"{delta.listings_removed} removed listing versions across {len(delta.changes)} groups")
+        return self.refresh_summaries()
+
+    def refresh_summaries(self):
+        """Recompute each document's summary map from its stored sums"""
+        documents = {dimension: (self._ref(dimension).get().to_dict() or {}) for dimension in DIMENSIONS}
+        overall = summarize(documents['overall'].get('groups', {})).get('all', {})
+        overall_days = overall.get('days_on_mls', {}).get('mean')
+        now = datetime.now()
+        batch = self.db.batch()
+        summaries = {}
+        for dimension, document in documents.items():
+            summaries[dimension] = summarize(document.get('groups', {}), overall_days)
+            # Replace the summary map whole: a merge would keep entries for groups that have emptied
+            batch.set(self._ref(dimension), {'summary': summaries[dimension], 'updated_at': now},
+                      merge=['summary', 'updated_at'])
+        batch.commit()
+        return summaries
+
+    def rebuild(self):
+        """Recompute every sum from the properties collection, replacing what's stored"""
+        delta = AggregateDelta()
+        for snapshot in self.db.collection(self.properties_collection).stream():
+            delta.add(snapshot.to_dict())
+        by_dimension = {dimension: {} for dimension in DIMENSIONS}
+        for (dimension, group), fields in delta.changes.items():
+            by_dimension[dimension][group] = fields
+        batch = self.db.batch()
+        for dimension, groups in by_dimension.items():
+            batch.set(self._ref(dimension), {'groups': groups})
+        batch.commit()
+        metrics.incr('aggregates.rebuilds')
+        logging.info(f"Rebuilt aggregates from {delta.listings_added} listings")
+        return self.refresh_summaries()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import math
+from datetime import date, datetime
+
+# homeharvest fields that describe the listing itself. days_on_mls is left
+# out on purpose: it ticks up every day and would make every listing look
+# changed on every run.
+FINGERPRINT_FIELDS = (
+    'property_url', 'mls_id', 'status', 'style',
+    'street', 'unit', 'city', 'state', 'zip_code',
+    'beds', 'full_baths', 'half_baths', 'sqft', 'year_built',
+    'list_price', 'list_date', 'latitude', 'longitude',
+)
+
+FINGERPRINT_KEY = 'content_fingerprint'
+
+
+def _normalize(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        # Integer columns come back as floats once pandas has a NaN in them
+        return int(value) if value.is_integer() else round(value, 7)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # numpy scalars
+        return _normalize(value.item())
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value if isinstance(value, (str, int, bool)) else str(value)
+
+
+def listing_fingerprint(row):
+    """Stable hash over the FINGERPRINT_FIELDS of a homeharvest row (dict or Series)"""
+    values = {field: _normalize(row.get(field)) for field in FINGERPRINT_FIELDS}
+    payload = json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class ChangeSet:
+    """Listings from one scrape split by what needs to happen to them"""
+
+    def __init__(self):
+        self.new = []
+        self.changed = []
+        self.retry = []
+        self.unchanged = []
+        self.disappeared = []
+        # Unchanged listings stored before fingerprints existed; they only need
+        # the fingerprint written back
+        self.backfill = []
+
+    def counts(self):
+        return {
+            'new': len(self.new),
+            'changed': len(self.changed),
+            'retry': len(self.retry),
+            'unchanged': len(self.unchanged),
+            'disappeared': len(self.disappeared),
+            'backfill': len(self.backfill),
+        }
+
+
+def classify_listings(fingerprints, existing, stored_ids=None):
+    """Split scraped listings into new, changed, retry, unchanged and disappeared.
+
+    fingerprints maps doc id -> fingerprint for every scraped listing and
+    existing maps doc id -> stored document for the ones already in Firestore.
+    Stored listings with a failed prediction and the same content land in
+    `retry`. If stored_ids (every id in the collection) is given, the ones
+    missing from this scrape are reported as disappeared.
+    """
+    changes = ChangeSet()
+    for doc_id, fingerprint in fingerprints.items():
+        stored = existing.get(doc_id)
+        if stored is None:
+            changes.new.append(doc_id)
+            continue
+
+        stored_fingerprint = stored.get(FINGERPRINT_KEY)
+        if stored_fingerprint is not None and stored_fingerprint != fingerprint:
+            changes.changed.append(doc_id)
+        elif not stored.get('prediction_success'):
+            changes.retry.append(doc_id)
+        else:
+            changes.unchanged.append(doc_id)
+            if stored_fingerprint is None:
+                changes.backfill.append(doc_id)
+
+    if stored_ids is not None:
+        changes.disappeared = sorted(set(stored_ids) - set(fingerprints))
+    return changes
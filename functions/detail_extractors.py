@@ -0,0 +1,162 @@
+import codecs
+import logging
+import os
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+# Size of the chunks fed to the streaming parser; it stops as soon as all
+# three fields are found, so most of a large page is never parsed
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def parse_detail_html(content):
+    """Pull (beds, baths, rent) out of a realtor.com detail page with a full BeautifulSoup parse"""
+    soup = BeautifulSoup(content, 'html.parser')
+    return _details_from_soup(soup)
+
+
+def _details_from_soup(soup):
+    beds_tag = soup.find('li', {'data-testid': 'property-meta-beds'})
+    baths_tag = soup.find('li', {'data-testid': 'property-meta-baths'})
+    rent_tag = soup.find('div', {'class': 'price-details'})
+
+    beds = beds_tag.find('span', {'data-testid': 'meta-value'}).get_text().strip() if beds_tag else "N/A"
+    baths = baths_tag.find('span', {'data-testid': 'meta-value'}).get_text().strip() if baths_tag else "N/A"
+    rent = rent_tag.get_text().strip() if rent_tag else "N/A"
+
+    return beds, baths, rent
+
+
+class _DetailStreamParser(HTMLParser):
+    """Incremental parser that records the text of the beds/baths/price nodes.
+
+    Text is collected the way BeautifulSoup's get_text() does it: script and
+    style contents and comments are skipped, entities are unescaped.
+    """
+
+    _SKIP_TEXT_TAGS = ('script', 'style', 'template')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found = {}
+        self._capture = None  # (field, tag, depth, parts)
+        self._span_capture = None  # (tag depth, parts) for the meta-value span
+        self._skip_depth = 0
+
+    @property
+    def done(self):
+        return len(self.found) == 3
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TEXT_TAGS:
+            self._skip_depth += 1
+            return
+        attrs = dict(attrs)
+
+        if self._capture is not None:
+            field, capture_tag, depth, parts = self._capture
+            if tag == capture_tag:
+                self._capture = (field, capture_tag, depth + 1, parts)
+            if (field != 'rent' and tag == 'span' and self._span_capture is None
+                    and attrs.get('data-testid') == 'meta-value' and field not in self.found):
+                self._span_capture = (1, [])
+            elif self._span_capture is not None and tag == 'span':
+                span_depth, span_parts = self._span_capture
+                self._span_capture = (span_depth + 1, span_parts)
+            return
+
+        if tag == 'li' and attrs.get('data-testid') == 'property-meta-beds' and 'beds' not in self.found:
+            self._capture = ('beds', 'li', 1, [])
+        elif tag == 'li' and attrs.get('data-testid') == 'property-meta-baths' and 'baths' not in self.found:
+            self._capture = ('baths', 'li', 1, [])
+        elif tag == 'div' and 'rent' not in self.found and 'price-details' in (attrs.get('class') or '').split():
+            self._capture = ('rent', 'div', 1, [])
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._capture is None:
+            return
+
+        field, capture_tag, depth, parts = self._capture
+        if self._span_capture is not None and tag == 'span':
+            span_depth, span_parts = self._span_capture
+            if span_depth == 1:
+                self.found[field] = ''.join(span_parts).strip()
+                self._span_capture = None
+            else:
+                self._span_capture = (span_depth - 1, span_parts)
+
+        if tag != capture_tag:
+            return
+        if depth > 1:
+            self._capture = (field, capture_tag, depth - 1, parts)
+            return
+
+        if field == 'rent':
+            self.found['rent'] = ''.join(parts).strip()
+        elif field not in self.found:
+            # Same failure as calling .find('span').get_text() on a missing span
+            raise ValueError(f"No meta-value span inside the {field} item")
+        self._capture = None
+        self._span_capture = None
+
+    def handle_data(self, data):
+        if self._capture is None or self._skip_depth:
+            return
+        self._capture[3].append(data)
+        if self._span_capture is not None:
+            self._span_capture[1].append(data)
+
+
+def parse_detail_html_streaming(content, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream the page through a stdlib HTMLParser and stop once beds, baths and rent are found.
+
+    Returns None when the page ends before all three were seen, so the caller
+    can fall back to a full parse for the fields that are genuinely missing.
+    """
+    parser = _DetailStreamParser()
+    if isinstance(content, str):
+        chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    else:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunks = (decoder.decode(content[i:i + chunk_size]) for i in range(0, len(content), chunk_size))
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            return parser.found['beds'], parser.found['baths'], parser.found['rent']
+    return None
+
+
+def extract_details_fast(content):
+    """Streaming extraction with a BeautifulSoup fallback.
+
+    Any page the streaming parser can't fully resolve (a field is missing or
+    the markup trips it up) is re-parsed with parse_detail_html, so the result
+    is always what the full parse would have returned.
+    """
+    try:
+        details = parse_detail_html_streaming(content)
+        if details is not None:
+            return details
+    except Exception as e:
+        logging.debug(f"Streaming extraction failed, falling back to BeautifulSoup: {e}")
+    return parse_detail_html(content)
+
+
+EXTRACTORS = {
+    'fast': extract_details_fast,
+    'bs4': parse_detail_html,
+}
+
+
+def get_extractor(name=None):
+    """Extractor by name ('fast' or 'bs4'); defaults to DETAIL_EXTRACTOR or 'fast'"""
+    name = name or os.environ.get('DETAIL_EXTRACTOR', 'fast')
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown detail extractor {name!r}, expected one of {sorted(EXTRACTORS)}")
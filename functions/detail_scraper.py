@@ -0,0 +1,213 @@
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from detail_extractors import get_extractor
+import metrics
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',  # or the specific types you've seen in the network capture
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'en-US,en;q=0.9,es;q=0.8',
+    'Referer': 'https://www.realtor.com/',  # Adjust this based on your observation
+    'Origin': 'https://www.realtor.com',  # This might be necessary for some sites
+}
+
+MISSING_DETAILS = ("N/A", "N/A", "N/A")
+
+# Status codes that mean we're being throttled or blocked rather than a bad URL
+BLOCKED_STATUS_CODES = (403, 429)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def create_session(pool_size=10, headers=None):
+    """A keep-alive session whose connection pool is large enough for pool_size workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(headers or DEFAULT_HEADERS)
+    return session
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive blocked responses and stays open for `cooldown` seconds"""
+
+    def __init__(self, threshold=5, cooldown=60.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._clock() - self._opened_at >= self.cooldown:
+                # Half-open: let the next request through and see how it goes
+                self._opened_at = None
+                self._failures = self.threshold - 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_blocked(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold and self._opened_at is None:
+                self._opened_at = self._clock()
+                logging.warning(f"Circuit breaker opened after {self._failures} blocked responses")
+
+
+class DetailScraper:
+    """Fetches realtor.com detail pages concurrently over one pooled session.
+
+    Each host gets its own token bucket, transient failures are retried with
+    jittered exponential backoff, and repeated 403/429 responses open a circuit
+    breaker so the remaining URLs fail fast instead of hammering a site that
+    is blocking us.
+
+    With a ResponseCache, fresh pages are served from disk and stale ones are
+    revalidated with a conditional request. cache_mode='replay' never touches
+    the network: cache misses come back as missing details.
+    """
+
+    def __init__(self, max_workers=8, requests_per_second=4.0, burst=None, max_retries=2,
+                 backoff=1.0, timeout=10, breaker_threshold=5, breaker_cooldown=60.0,
+                 session=None, parser=None, cache=None, cache_mode='normal'):
+        if cache_mode not in ('normal', 'replay'):
+            raise ValueError(f"cache_mode must be 'normal' or 'replay', got {cache_mode!r}")
+        if cache_mode == 'replay' and cache is None:
+            raise ValueError("cache_mode='replay' needs a cache")
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.parser = parser or get_extractor()
+        self.cache = cache
+        self.cache_mode = cache_mode
+        self.session = session or create_session(pool_size=max_workers)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._sleep = time.sleep
+        self.stats = {'fetched': 0, 'failed': 0, 'retries': 0, 'blocked': 0, 'short_circuited': 0,
+                      'cache_hits': 0, 'not_modified': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+        metrics.incr(f"detail.{key}")
+
+    def _bucket_for(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+            return self._buckets[host]
+
+    def fetch(self, url):
+        """Fetch and parse one detail page, returning (beds, baths, rent)"""
+        with metrics.span('detail.fetch'):
+            return self._fetch(url)
+
+    def _fetch(self, url):
+        if not url:
+            return MISSING_DETAILS
+
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and (self.cache_mode == 'replay' or self.cache.is_fresh(cached)):
+            self._count('cache_hits')
+            return self.parser(cached.body)
+        if self.cache_mode == 'replay':
+            self._count('failed')
+            return MISSING_DETAILS
+        conditional_headers = cached.validator_headers() if cached is not None else {}
+
+        bucket = self._bucket_for(url)
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            if self.breaker.is_open:
+                self._count('short_circuited')
+                return MISSING_DETAILS
+
+            bucket.acquire()
+            try:
+                with self.session.get(url, headers=conditional_headers, timeout=self.timeout) as response:
+                    if response.status_code == 304 and cached is not None:
+                        self.breaker.record_success()
+                        self.cache.mark_revalidated(url)
+                        self._count('not_modified')
+                        return self.parser(cached.body)
+                    if response.status_code == 200:
+                        self.breaker.record_success()
+                        details = self.parser(response.content)
+                        if self.cache is not None:
+                            self.cache.put(url, response.content, response.headers.get('ETag'),
+                                           response.headers.get('Last-Modified'))
+                        self._count('fetched')
+                        return details
+                    if response.status_code in BLOCKED_STATUS_CODES:
+                        self._count('blocked')
+                        self.breaker.record_blocked()
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        logging.warning(f"Unexpected status code {response.status_code} for URL: {url}")
+                        break
+                    logging.warning(f"Retryable status code {response.status_code} for URL: {url}")
+            except requests.RequestException as e:
+                logging.warning(f"Request failed for {url}: {e}")
+            except Exception as e:
+                logging.error(f"Error scraping details from {url}: {e}")
+                break
+
+            if attempt < self.max_retries:
+                self._count('retries')
+                # Full jitter keeps workers from retrying in lockstep
+                self._sleep(random.uniform(0, delay))
+                delay *= 2
+
+        self._count('failed')
+        return MISSING_DETAILS
+
+    def close(self):
+        self.session.close()
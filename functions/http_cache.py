@@ -0,0 +1,136 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+# On Cloud Functions /tmp is an in-memory filesystem: everything cached there
+# counts against the instance's memory limit, next to pandas and the model.
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'detail_page_cache.sqlite')
+# Enough for a day of compressed detail pages; the file runs somewhat larger (indexes, WAL)
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class CachedResponse:
+    def __init__(self, url, body, etag, last_modified, fetched_at):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def age(self, now=None):
+        return (now or time.time()) - self.fetched_at
+
+    def validator_headers(self):
+        """Headers for a conditional request that revalidates this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """SQLite-backed cache of detail page bodies keyed by URL.
+
+    Entries younger than `ttl` seconds are served without touching the network;
+    older ones are revalidated with their ETag / Last-Modified. Bodies are
+    stored zlib-compressed, and once the stored size passes `max_bytes` the
+    least recently used entries are evicted. Keep `max_bytes` well inside the
+    instance's spare memory when the cache lives on a tmpfs.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=24 * 3600, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT,'
+            ' fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0}
+
+    def get(self, url):
+        """Return the CachedResponse for url (fresh or stale), or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self._conn.commit()
+            body, etag, last_modified, fetched_at = row
+            entry = CachedResponse(url, zlib.decompress(body), etag, last_modified, fetched_at)
+            self.stats['hits' if self.is_fresh(entry) else 'stale'] += 1
+        return entry
+
+    def is_fresh(self, entry):
+        return entry.age() < self.ttl
+
+    def put(self, url, body, etag=None, last_modified=None):
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at, accessed_at, size)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, compressed, etag, last_modified, now, now, len(compressed)),
+            )
+            self._total_bytes += len(compressed) - (old[0] if old else 0)
+            self.stats['stores'] += 1
+            self._evict()
+            self._conn.commit()
+
+    def mark_revalidated(self, url):
+        """A 304 came back: the stored body is current again"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            self._conn.commit()
+            self.stats['revalidated'] += 1
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT url, size FROM responses ORDER BY accessed_at LIMIT 64'
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self._total_bytes -= size
+                self.stats['evictions'] += 1
+
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        logging.info(f"Detail page cache {self.path}: {self.stats}")
@@ -0,0 +1,262 @@
+import logging
+import re
+import time
+import urllib.parse
+
+from ml_model.predict import predict_rental_prices_batch, batch_result_at
+from change_detection import classify_listings, FINGERPRINT_KEY
+from listing_schema import ListingTable
+from pipeline import Pipeline, Stage
+from property_query import query_fields
+from property_store import WriteReport
+import metrics
+
+def encode_url_for_firestore(url):
+    return urllib.parse.quote(url, safe='')
+
+def construct_detailed_url(original_url, street, city, state, zip_code):
+    # Assuming the original URL is of the format 'https://www.realtor.com/realestateandhomes-detail/2225339747'
+    # and the detailed URL should be 'https://www.realtor.com/realestateandhomes-detail/2724-Channing-Way_Berkeley_CA_94704_M22253-39747'
+    # We need to extract the last part of the original URL and append it after 'M'
+    unique_id_match = re.search(r"/(\d+)$", original_url)
+    if unique_id_match:
+        unique_id = f"M{unique_id_match.group(1)}"
+    else:
+        logging.error(f"Could not extract unique ID from URL: {original_url}")
+        return None
+
+    # Transform the street address into the format used in the detailed URLs
+    formatted_street = street.replace(" ", "-").replace(",", "").replace(".", "")
+
+    # Construct the URL in the desired format
+    url = f"https://www.realtor.com/realestateandhomes-detail/{formatted_street}_{city}_{state}_{zip_code}_{unique_id}"
+    return url
+
+def build_prediction_input(encoded_url, property_data):
+    """Prediction input for a scraped property, or None if its fields can't be used"""
+    try:
+        beds = property_data.get('beds', 'N/A')
+        baths = property_data.get('baths', 'N/A')
+        # listing_schema reads a missing days_on_mls as None; the model takes NaN for it
+        days_on_mls = property_data.get('days_on_mls', 0)
+        
+        prediction_input = {
+            'beds': beds,
+            'baths': float(baths.replace('N/A', '1')) if baths else 1.0,
+            'latitude': property_data.get('latitude', 37.8715),
+            'longitude': property_data.get('longitude', -122.2730),
+            'neighborhood': 'Central Berkeley',
+            'days_on_mls': float('nan') if days_on_mls is None else days_on_mls
+        }
+        if metrics.sample_log():
+            logging.info(f"Prediction input for {encoded_url}: {prediction_input}")
+        return prediction_input
+    except Exception as e:
+        logging.error(f"Error preparing prediction input for property {encoded_url}: {e}")
+        return None
+
+def run_ingest(properties, store, scrape_details, detect_disappeared=True, aggregate_delta=None, history=None,
+               fetch_workers=8, predict_batch_size=256, queue_size=64, time_budget=None):
+    """Store a homeharvest scrape: detail-scrape, predict and write whatever changed.
+
+    properties is the scrape_property DataFrame (only listing_schema's
+    columns are read and stored), store a PropertyStore and
+    scrape_details a callable mapping one detail URL to a (beds, baths, rent)
+    tuple; fetch_workers threads call it at once. Fetching, prediction (in
+    batches of up to predict_batch_size) and writes run as a streaming
+    pipeline. With time_budget seconds, listings not fetched by then are left
+    for the next run and everything in flight is still written.
+
+    If aggregate_delta (an aggregates.AggregateDelta) is
+    given, every listing version written replaces its previous one in it, and
+    if history (a rent_history.HistoryBatch) is given, what changed is recorded.
+    Returns a summary of listing counts and per-stage seconds, or None if
+    existing documents couldn't be read. `deferred` counts listings left
+    unfetched by the time budget and `errors` those a stage failed on; neither
+    was written.
+    """
+    timings = {}
+    stage_timer = metrics.current().stage_clock('ingest')
+
+    # Only the schema's columns, converted once per column rather than per row
+    listings = ListingTable.from_frame(properties)
+    encoded_urls = [encode_url_for_firestore(url) for url in listings.columns['property_url']]
+    timings['parse'] = stage_timer.lap('parse')
+
+    # Read every existing document up front instead of one get() per listing
+    try:
+        existing_properties = store.prefetch(encoded_urls)
+    except Exception as e:
+        logging.error(f"Failed to prefetch existing properties: {e}")
+        return None
+    timings['prefetch'] = stage_timer.lap('prefetch')
+
+    # Fingerprint every scraped listing so unchanged ones skip all further work
+    rows_by_id = {}
+    fingerprints = {}
+    for encoded_url, (index, listing, fingerprint) in zip(encoded_urls, listings.rows()):
+        rows_by_id[encoded_url] = (index, listing)
+        fingerprints[encoded_url] = fingerprint
+
+    stored_ids = None
+    if detect_disappeared:
+        try:
+            stored_ids = store.list_ids()
+        except Exception as e:
+            logging.warning(f"Could not list stored properties, skipping disappeared listings: {e}")
+
+    changes = classify_listings(fingerprints, existing_properties, stored_ids)
+    logging.info(f"Listing changes: {changes.counts()}")
+    for group, count in changes.counts().items():
+        metrics.incr(f"listings.{group}", count)
+
+    for encoded_url in changes.backfill:
+        store.update(encoded_url, {FINGERPRINT_KEY: fingerprints[encoded_url]})
+
+    # What each rewritten document held before this run, for the aggregates
+    previous_versions = {encoded_url: existing_properties[encoded_url] for encoded_url in changes.changed}
+    work = []
+    for encoded_url in changes.new + changes.changed:
+        index, listing = rows_by_id[encoded_url]
+        if listing['list_date'] is None:
+            logging.warning(f"Skipped property at index {index} without a valid list_date")
+            continue
+        try:
+            # New or changed property - get all details
+            original_url = listing['property_url']
+            street = listing['street']
+            city = listing['city']
+            state = listing['state']
+            zip_code = listing['zip_code']
+
+            detailed_url = construct_detailed_url(original_url, street, city, state, zip_code)
+            if detailed_url:
+                work.append((index, listing, encoded_url, detailed_url))
+            else:
+                logging.warning(f"Skipped scraping additional details for: {original_url}")
+                    
+        except Exception as e:
+            logging.error(f"Error processing property at index {index}: {e}")
+
+    # Stored properties whose last prediction failed get another try with their stored details
+    for encoded_url in changes.retry:
+        property_data = existing_properties[encoded_url]
+        previous_versions[encoded_url] = dict(property_data)
+        property_data[FINGERPRINT_KEY] = fingerprints[encoded_url]
+        work.append((None, None, encoded_url, property_data))
+
+    timings['classify'] = stage_timer.lap('classify')
+
+    def fetch_details(item):
+        index, listing, encoded_url, detail = item
+        if listing is None:
+            # A retry: the stored document already has its details
+            return encoded_url, detail, build_prediction_input(encoded_url, detail)
+        beds, baths, rent = scrape_details(detail)
+        try:
+            property_data = dict(listing)
+            property_data.update({'beds': beds, 'baths': baths, 'rent': rent})
+            property_data[FINGERPRINT_KEY] = fingerprints[encoded_url]
+            return encoded_url, property_data, build_prediction_input(encoded_url, property_data)
+        except Exception as e:
+            logging.error(f"Error processing property at index {index}: {e}")
+            return None
+
+    def predict(batch):
+        # Micro-batches keep one model call per batch while fetching continues
+        scorable = [i for i, (_, _, prediction_input) in enumerate(batch) if prediction_input is not None]
+        batch_result = None
+        if scorable:
+            try:
+                batch_result = predict_rental_prices_batch([batch[i][2] for i in scorable])
+            except Exception as e:
+                logging.error(f"Error running batch prediction: {e}")
+        batch_position = {batch_index: position for position, batch_index in enumerate(scorable)}
+
+        for i, (encoded_url, property_data, _) in enumerate(batch):
+            prediction_result = None
+            if i in batch_position:
+                prediction_result = batch_result_at(batch_result, batch_position[i])
+
+            if prediction_result:
+                property_data.update({
+                    'predicted_rent': prediction_result['predicted_rent'],
+                    'rent_prediction_range_low': prediction_result['confidence_range'][0],
+                    'rent_prediction_range_high': prediction_result['confidence_range'][1],
+                    'model_version': prediction_result['model_version'],
+                    'prediction_success': True
+                })
+                metrics.incr('predictions.succeeded')
+                if metrics.sample_log():
+                    logging.info(f"Prediction successful for property: {encoded_url}")
+            else:
+                property_data['prediction_success'] = False
+                metrics.incr('predictions.failed')
+                logging.warning(f"Prediction failed for property: {encoded_url}")
+
+            # Typed fields the query API filters on
+            property_data.update(query_fields(property_data))
+        return [(encoded_url, property_data) for encoded_url, property_data, _ in batch]
+
+    write_report = WriteReport()
+
+    def write(batch):
+        for encoded_url, property_data in batch:
+            store.set(encoded_url, property_data)
+        report = store.flush()
+        write_report.written += report.written
+        write_report.commits += report.commits
+        write_report.retries += report.retries
+        write_report.errors.update(report.errors)
+        for encoded_url, property_data in batch:
+            if encoded_url in report.errors:
+                continue
+            if aggregate_delta is not None:
+                aggregate_delta.replace(previous_versions.get(encoded_url), property_data)
+            if history is not None:
+                history.record(encoded_url, previous_versions.get(encoded_url), property_data)
+        return batch
+
+    # Fetch, predict and write overlap: each stage hands rows on as soon as they're done
+    pipeline = Pipeline(
+        [
+            Stage('detail_fetch', fetch_details, workers=fetch_workers, stop_at_deadline=True),
+            Stage('predict', predict, batch_size=predict_batch_size, max_wait=0.5),
+            Stage('write', write, batch_size=store.batch_size, max_wait=1.0),
+        ],
+        queue_size=queue_size,
+        deadline=None if time_budget is None else time.monotonic() + time_budget,
+    )
+    written = pipeline.run(work)
+    if store.pending_count():
+        # Nothing reached the write stage (e.g. only fingerprint backfills)
+        report = store.flush()
+        write_report.written += report.written
+        write_report.errors.update(report.errors)
+    timings['pipeline'] = stage_timer.lap('pipeline')
+    for name, stats in pipeline.stats.items():
+        timings[name] = stats['busy_seconds']
+
+    logging.info(f"Stored {write_report.written} properties, {write_report.failed} failed; "
+                 f"pipeline stages {pipeline.stats}")
+    metrics.incr('firestore.written', write_report.written)
+    metrics.incr('firestore.write_failures', write_report.failed)
+    if pipeline.skipped:
+        logging.warning(f"Time budget ran out: {pipeline.skipped} listings left for the next run")
+        metrics.incr('ingest.deferred', pipeline.skipped)
+    if pipeline.errors:
+        logging.warning(f"{pipeline.errors} listings dropped by failing pipeline stages")
+        metrics.incr('ingest.errors', pipeline.errors)
+
+    return dict(
+        changes.counts(),
+        scraped=len(properties),
+        dropped=listings.dropped,
+        predicted=len(written),
+        written=write_report.written,
+        write_failures=write_report.failed,
+        deferred=pipeline.skipped,
+        errors=pipeline.errors,
+        stage_seconds=timings,
+        pipeline=pipeline.stats,
+    )
@@ -0,0 +1,124 @@
+"""The listing fields ingest keeps from a homeharvest scrape, and their types.
+
+scrape_property returns about 30 columns, and many of them are empty for
+rentals or unused here (alt_photos, hoa_fee, lot_sqft, sold_price, ...).
+LISTING_SCHEMA names the ones a properties document stores, together with
+their types. ListingTable converts each of those columns once, column-wise,
+and hands out rows as plain dicts instead of one pandas Series per row.
+
+Missing values are None for str, int and date fields. Float fields keep NaN,
+which the prediction path scores as it always has. beds, baths and rent are
+not listed: the detail scrape supplies them.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from change_detection import FINGERPRINT_FIELDS, listing_fingerprint
+
+LISTING_SCHEMA = {
+    'property_url': 'str',
+    'mls_id': 'str',
+    'status': 'str',
+    'style': 'str',
+    'street': 'str',
+    'unit': 'str',
+    'city': 'str',
+    'state': 'str',
+    'zip_code': 'str',
+    'full_baths': 'int',
+    'half_baths': 'int',
+    'sqft': 'int',
+    'year_built': 'int',
+    'list_price': 'int',
+    'list_date': 'date',
+    'days_on_mls': 'int',
+    'latitude': 'float',
+    'longitude': 'float',
+    'primary_photo': 'str',
+}
+# Every raw column ingest reads: the schema plus what the fingerprint hashes
+LISTING_COLUMNS = tuple(dict.fromkeys(list(LISTING_SCHEMA) + list(FINGERPRINT_FIELDS)))
+# homeharvest's list_date format
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def select_listing_columns(properties):
+    """The scrape with only LISTING_COLUMNS, e.g. to keep shard payloads small"""
+    return properties[[c for c in LISTING_COLUMNS if c in properties.columns]]
+
+
+def _string(value):
+    if isinstance(value, str):
+        return value
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return str(value)
+
+
+def _strings(column):
+    return [_string(v) for v in column.tolist()]
+
+
+def _ints(column):
+    numbers = pd.to_numeric(column, errors='coerce').round().astype('Int64')
+    return numbers.astype(object).where(numbers.notna(), None).tolist()
+
+
+def _floats(column):
+    return pd.to_numeric(column, errors='coerce').astype(float).tolist()
+
+
+def _dates(column):
+    dates = pd.to_datetime(column, format=DATE_FORMAT, errors='coerce')
+    # Naive datetimes, with None for NaT
+    return dates.to_numpy().astype('datetime64[us]').astype(object).tolist()
+
+
+CONVERTERS = {'str': _strings, 'int': _ints, 'float': _floats, 'date': _dates}
+
+
+class ListingTable:
+    """A scrape's listings as typed columns, one list per LISTING_SCHEMA field.
+
+    Rows without a property_url are dropped; they have no document id.
+    """
+
+    def __init__(self, columns, index, fingerprints, dropped=0):
+        self.columns = columns
+        self.index = index
+        self.fingerprints = fingerprints
+        self.dropped = dropped
+
+    @classmethod
+    def from_frame(cls, properties):
+        n = len(properties)
+        columns = {}
+        for field, kind in LISTING_SCHEMA.items():
+            if field in properties.columns:
+                columns[field] = CONVERTERS[kind](properties[field])
+            else:
+                columns[field] = [float('nan') if kind == 'float' else None] * n
+
+        # Hash the raw values, so stored fingerprints stay valid whatever the coercion does
+        raw = [properties[f].tolist() if f in properties.columns else [None] * n for f in FINGERPRINT_FIELDS]
+        fingerprints = [listing_fingerprint(dict(zip(FINGERPRINT_FIELDS, values))) for values in zip(*raw)]
+
+        keep = [i for i in range(n) if columns['property_url'][i] is not None]
+        index = properties.index.tolist()
+        if len(keep) < n:
+            logging.warning(f"Dropping {n - len(keep)} listings without a property_url")
+            columns = {field: [values[i] for i in keep] for field, values in columns.items()}
+            fingerprints = [fingerprints[i] for i in keep]
+            index = [index[i] for i in keep]
+        return cls(columns, index, fingerprints, dropped=n - len(keep))
+
+    def __len__(self):
+        return len(self.index)
+
+    def rows(self):
+        """(index, listing dict, fingerprint) per listing"""
+        fields = list(self.columns)
+        for index, fingerprint, values in zip(self.index, self.fingerprints, zip(*self.columns.values())):
+            yield index, dict(zip(fields, values)), fingerprint
@@ -0,0 +1,171 @@
+"""Scraping several locations per run, each from its own high-water mark.
+
+Every location remembers when it was last scraped successfully (in the
+`scrape_locations` collection), so the next run asks homeharvest only for
+listings from the days since then instead of a full year. Every
+FULL_SCRAPE_EVERY_DAYS a location is scraped in full again, which picks up
+price and status changes on older listings. Locations run concurrently on a
+small thread pool; listings found by overlapping locations are merged by
+property_url.
+"""
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import metrics
+
+STATE_COLLECTION = 'scrape_locations'
+MAX_PAST_DAYS = 365
+# Days re-requested before the high-water mark, for listings indexed late
+OVERLAP_DAYS = 1
+FULL_SCRAPE_EVERY_DAYS = 7
+
+BERKELEY_ZIPS = ('94702', '94703', '94704', '94705', '94707', '94708', '94709', '94710', '94720')
+DEFAULT_LOCATIONS = BERKELEY_ZIPS + ('Oakland, CA', 'Albany, CA', 'Emeryville, CA')
+
+
+def parse_locations(setting):
+    """'94704; Oakland, CA' -> ['94704', 'Oakland, CA']; empty -> DEFAULT_LOCATIONS"""
+    locations = [location.strip() for location in (setting or '').split(';') if location.strip()]
+    return locations or list(DEFAULT_LOCATIONS)
+
+
+def location_id(location):
+    return re.sub(r'[^a-z0-9]+', '-', location.lower()).strip('-')
+
+
+def merge_listings(frames):
+    """Concatenate scrapes, keeping the first row for each property_url"""
+    import pandas as pd
+
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return pd.DataFrame()
+    merged = pd.concat(frames, ignore_index=True)
+    if 'property_url' not in merged:
+        return merged
+    # Rows without a URL can't be matched to anything; leave them alone
+    keep = merged['property_url'].isna() | ~merged.duplicated('property_url')
+    return merged[keep].reset_index(drop=True)
+
+
+def _naive(value):
+    return value.replace(tzinfo=None) if isinstance(value, datetime) else None
+
+
+class LocationScrape:
+    """What one run scraped; commit() records the new high-water marks"""
+
+    def __init__(self, properties, results, state_ref):
+        self.properties = properties
+        self.results = results
+        self._state_ref = state_ref
+
+    @property
+    def complete(self):
+        """Every location scraped its full window, so a listing missing from properties is really gone"""
+        return bool(self.results) and all(r['ok'] and r['full'] for r in self.results.values())
+
+    @property
+    def failed(self):
+        return [location for location, r in self.results.items() if not r['ok']]
+
+    def summary(self):
+        return {location: {k: v for k, v in r.items() if k != 'scraped_at'} for location, r in self.results.items()}
+
+    def marks(self):
+        """{location_id: new state} for each successful location, as commit() writes them"""
+        marks = {}
+        for location, result in self.results.items():
+            if not result['ok']:
+                continue
+            state = {'location': location, 'last_success': result['scraped_at'], 'last_count': result['listings']}
+            if result['full']:
+                state['last_full'] = result['scraped_at']
+            marks[location_id(location)] = state
+        return marks
+
+    def commit(self):
+        """Advance each successful location's mark; call once its listings are safely stored"""
+        for state in self.marks().values():
+            self._state_ref(state['location']).set(state, merge=True)
+
+
+def commit_marks(db, marks):
+    """Write marks saved from LocationScrape.marks(), e.g. once the sharded run that stores them completes"""
+    for doc_id, state in marks.items():
+        db.collection(STATE_COLLECTION).document(doc_id).set(state, merge=True)
+
+
+class LocationScraper:
+    """Scrapes a set of locations concurrently, each from its own high-water mark.
+
+    scrape(location, past_days) returns a homeharvest DataFrame and raises on
+    failure (main.retry_scrape_property); one failing location doesn't stop
+    the others.
+    """
+
+    def __init__(self, db, scrape, locations=DEFAULT_LOCATIONS, max_workers=3,
+                 full_every=timedelta(days=FULL_SCRAPE_EVERY_DAYS)):
+        self.db = db
+        self.scrape = scrape
+        self.locations = list(dict.fromkeys(locations))
+        self.max_workers = max(1, max_workers)
+        self.full_every = full_every
+
+    def _state_ref(self, location):
+        return self.db.collection(STATE_COLLECTION).document(location_id(location))
+
+    def load_state(self):
+        refs = [self._state_ref(location) for location in self.locations]
+        states = {snapshot.id: snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists}
+        return {location: states.get(location_id(location), {}) for location in self.locations}
+
+    def window(self, state, now):
+        """(past_days, full) to request for a location with this stored state"""
+        last_success, last_full = _naive(state.get('last_success')), _naive(state.get('last_full'))
+        if last_success is None or last_full is None or now - last_full >= self.full_every:
+            return MAX_PAST_DAYS, True
+        days = math.ceil((now - last_success).total_seconds() / 86400) + OVERLAP_DAYS
+        return min(max(days, 1), MAX_PAST_DAYS), False
+
+    def _scrape_one(self, location, past_days):
+        with metrics.span(f'scrape.{location_id(location)}'):
+            return self.scrape(location, past_days)
+
+    def run(self, now=None):
+        now = now or datetime.now()
+        try:
+            states = self.load_state()
+        except Exception as e:
+            logging.warning(f"Could not read scrape high-water marks, scraping every location in full: {e}")
+            states = {location: {} for location in self.locations}
+
+        windows = {location: self.window(states[location], now) for location in self.locations}
+        results = {}
+        frames = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {location: pool.submit(self._scrape_one, location, windows[location][0])
+                       for location in self.locations}
+            for location, future in futures.items():
+                past_days, full = windows[location]
+                try:
+                    frame = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to scrape {location}: {e}")
+                    metrics.incr('scrape.locations_failed')
+                    results[location] = {'ok': False, 'past_days': past_days, 'full': full, 'error': str(e)}
+                    continue
+                listings = 0 if frame is None else len(frame)
+                logging.info(f"Scraped {listings} listings for {location} (past {past_days} days)")
+                frames.append(frame)
+                results[location] = {'ok': True, 'past_days': past_days, 'full': full,
+                                     'listings': listings, 'scraped_at': now}
+
+        properties = merge_listings(frames)
+        scraped = sum(r.get('listings', 0) for r in results.values())
+        metrics.incr('scrape.duplicates', scraped - len(properties))
+        logging.info(f"{len(properties)} distinct listings from {scraped} scraped across {len(self.locations)} locations")
+        return LocationScrape(properties, results, self._state_ref)
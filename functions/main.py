@@ -1,69 +1,125 @@
 # Welcome to Cloud Functions for Firebase for Python!
 # Deploy with `firebase deploy`
 
-import firebase_admin
-from firebase_admin import credentials, firestore, initialize_app
-from firebase_functions import https_fn, pubsub_fn
-import requests
-import re
+# Heavy dependencies (pandas/lightgbm, homeharvest, bs4/requests, the Firestore
+# client) are imported inside the code paths that need them, so importing this
+# module stays cheap for deploy-time discovery and for functions that don't use
+# them. benchmarks/bench_importtime.py tracks the cost per function.
+from firebase_functions import https_fn, options, pubsub_fn
 import logging
-from bs4 import BeautifulSoup
-from homeharvest import scrape_property
+import os
+import threading
 import time
 from datetime import datetime, timedelta
-import urllib.parse
-from ml_model.predict import predict_rental_price
-import config
+from property_store import PropertyStore, MAX_BATCH_SIZE
+import metrics
 
 @https_fn.on_request()
 def test_predictions(req: https_fn.Request) -> https_fn.Response:
+    from ml_model.predict import get_model_stats, get_prediction_cache_stats
+
+    run = metrics.start_run('test_predictions')
+    with metrics.maybe_profile('test_predictions'):
+        response = update_all_predictions()
+    run.add('model_cache', get_model_stats())
+    run.add('prediction_cache', get_prediction_cache_stats())
+    run.emit()
+    return response
+
+def update_all_predictions():
+    from aggregates import AggregateDelta
+    from ml_model.predict import predict_rental_prices_batch, batch_result_at
+    from property_query import query_fields
+    from rent_history import HistoryBatch
+
     logging.info("Starting manual prediction update")
     
     try:
-        properties_ref = db.collection('properties').stream()
+        stream_timer = metrics.current().stage_clock('test_predictions')
+        properties_ref = get_db().collection('properties').stream()
         count = 0
         success = 0
+        unchanged = 0
         
+        docs = []
+        prediction_inputs = []
         for doc in properties_ref:
             count += 1
             property_data = doc.to_dict()
             
+            # Stored as None when the scrape had none; the model takes NaN
+            days_on_mls = property_data.get('days_on_mls', 0)
             # Force update all properties
-            try:
-                prediction_input = {
-                    'beds': property_data.get('beds', 'N/A'),
-                    'baths': property_data.get('baths', 'N/A'),
-                    'latitude': property_data.get('latitude', 37.8715),
-                    'longitude': property_data.get('longitude', -122.2730),
-                    'style': property_data.get('style', 'APARTMENT'),
-                    'zip_code': property_data.get('zip_code', '94704'),
-                    'days_on_mls': property_data.get('days_on_mls', 0)
-                }
-                
+            prediction_input = {
+                'beds': property_data.get('beds', 'N/A'),
+                'baths': property_data.get('baths', 'N/A'),
+                'latitude': property_data.get('latitude', 37.8715),
+                'longitude': property_data.get('longitude', -122.2730),
+                'style': property_data.get('style', 'APARTMENT'),
+                'zip_code': property_data.get('zip_code', '94704'),
+                'days_on_mls': float('nan') if days_on_mls is None else days_on_mls
+            }
+            
+            if metrics.sample_log():
                 logging.info(f"Processing property: {doc.id}")
                 logging.info(f"Prediction input: {prediction_input}")
-                
-                prediction_result = predict_rental_price(prediction_input)
+            
+            docs.append((doc.id, property_data))
+            prediction_inputs.append(prediction_input)
+        
+        stream_timer.lap('read')
+        
+        # Score every property with one model.predict call
+        batch_result = predict_rental_prices_batch(prediction_inputs) if prediction_inputs else None
+        stream_timer.lap('predict')
+        
+        store = get_property_store()
+        previous_versions = {}
+        for i, (doc_id, property_data) in enumerate(docs):
+            try:
+                prediction_result = batch_result_at(batch_result, i)
                 
                 if prediction_result:
-                    property_data.update({
+                    prediction_fields = {
                         'predicted_rent': prediction_result['predicted_rent'],
                         'rent_prediction_range_low': prediction_result['confidence_range'][0],
                         'rent_prediction_range_high': prediction_result['confidence_range'][1],
                         'model_version': prediction_result['model_version'],
                         'prediction_quality': prediction_result.get('prediction_quality', 'medium'),
                         'prediction_success': True
-                    })
-                    
-                    # Force update
-                    db.collection('properties').document(doc.id).set(property_data)
-                    logging.info(f"Updated property {doc.id}")
+                    }
+                    prediction_fields.update(query_fields({**property_data, **prediction_fields}))
                     success += 1
+                    
+                    # Only write documents whose prediction actually changed
+                    if all(property_data.get(key) == value for key, value in prediction_fields.items()):
+                        unchanged += 1
+                        continue
+                    previous_versions[doc_id] = dict(property_data)
+                    property_data.update(prediction_fields)
+                    store.set(doc_id, property_data)
                 
             except Exception as e:
-                logging.error(f"Error processing property {doc.id}: {e}")
+                logging.error(f"Error processing property {doc_id}: {e}")
+        
+        write_report = store.flush()
+        stream_timer.lap('write')
+        success -= write_report.failed
+
+        # Rewritten predictions change the predicted and delta sums, so they go into the aggregates too
+        aggregate_delta = AggregateDelta()
+        history = HistoryBatch()
+        for doc_id, property_data in docs:
+            if doc_id in previous_versions and doc_id not in write_report.errors:
+                aggregate_delta.replace(previous_versions[doc_id], property_data)
+                history.record(doc_id, previous_versions[doc_id], property_data)
+        record_changes(aggregate_delta, history)
+        metrics.incr('properties.processed', count)
+        metrics.incr('properties.unchanged', unchanged)
+        metrics.incr('firestore.written', write_report.written)
+        metrics.incr('firestore.write_failures', write_report.failed)
                 
-        return https_fn.Response(f"Processing complete. Processed {count} properties, {success} successful predictions")
+        return https_fn.Response(f"Processing complete. Processed {count} properties, {success} successful predictions, {unchanged} unchanged")
         
     except Exception as e:
         logging.error(f"Error in test_predictions: {e}")
@@ -72,185 +128,537 @@ def test_predictions(req: https_fn.Request) -> https_fn.Response:
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 
-# Initialize Firestore
-service_account_path = config.SERVICE_ACCOUNT_PATH
-if not firebase_admin._apps:
-    cred = credentials.Certificate(service_account_path)
-    firebase_admin.initialize_app(cred)
+_db = None
+_db_lock = threading.Lock()
 
-db = firestore.client()
+def get_db():
+    """Firestore client shared by every invocation on this instance, created on first use"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+                import config
 
-def encode_url_for_firestore(url):
-    return urllib.parse.quote(url, safe='')
+                if not firebase_admin._apps:
+                    cred = credentials.Certificate(config.SERVICE_ACCOUNT_PATH)
+                    firebase_admin.initialize_app(cred)
+                _db = firestore.client()
+    return _db
 
-def construct_detailed_url(original_url, street, city, state, zip_code):
-    # Assuming the original URL is of the format 'https://www.realtor.com/realestateandhomes-detail/2225339747'
-    # and the detailed URL should be 'https://www.realtor.com/realestateandhomes-detail/2724-Channing-Way_Berkeley_CA_94704_M22253-39747'
-    # We need to extract the last part of the original URL and append it after 'M'
-    unique_id_match = re.search(r"/(\d+)$", original_url)
-    if unique_id_match:
-        unique_id = f"M{unique_id_match.group(1)}"
-    else:
-        logging.error(f"Could not extract unique ID from URL: {original_url}")
-        return None
+def get_property_store():
+    return PropertyStore(
+        get_db(),
+        batch_size=int(os.environ.get('FIRESTORE_BATCH_SIZE', MAX_BATCH_SIZE)),
+        max_retries=int(os.environ.get('FIRESTORE_MAX_RETRIES', 3)),
+    )
 
-    # Transform the street address into the format used in the detailed URLs
-    formatted_street = street.replace(" ", "-").replace(",", "").replace(".", "")
+# The functions that score listings; query_properties and rent_trends never load the model
+PREDICTING_FUNCTIONS = ('test_predictions', 'scheduled_function', 'predict_rent')
 
-    # Construct the URL in the desired format
-    url = f"https://www.realtor.com/realestateandhomes-detail/{formatted_street}_{city}_{state}_{zip_code}_{unique_id}"
-    return url
+def _should_preload_model():
+    """PRELOAD_MODEL=1/0 forces it; by default preload only on an instance serving a predicting function.
+
+    Every 2nd gen function runs as its own Cloud Run service, which sets
+    FUNCTION_TARGET to the function it serves (K_SERVICE is set on all of
+    them). Deploy-time discovery and local imports set neither, and shouldn't
+    pay for the model.
+    """
+    setting = os.environ.get('PRELOAD_MODEL')
+    if setting is not None:
+        return setting == '1'
+    return os.environ.get('FUNCTION_TARGET') in PREDICTING_FUNCTIONS
+
+# Load the model while the container starts so the first invocation doesn't pay for it
+if _should_preload_model():
+    from ml_model.predict import warm_model
+    warm_model()
+
+_detail_scraper = None
+
+def get_detail_scraper():
+    """Shared scraper so every detail fetch in this instance reuses one keep-alive session"""
+    global _detail_scraper
+    if _detail_scraper is None:
+        from detail_scraper import DetailScraper
+        from http_cache import ResponseCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+
+        # Set DETAIL_CACHE_PATH to an empty string to turn the response cache off. The default
+        # path is on /tmp, which is memory on Cloud Functions: DETAIL_CACHE_MAX_MB comes out of
+        # the instance's memory limit, so raise it only together with the function's memory.
+        cache_path = os.environ.get('DETAIL_CACHE_PATH', DEFAULT_CACHE_PATH)
+        cache = None
+        if cache_path:
+            max_mb = os.environ.get('DETAIL_CACHE_MAX_MB')
+            cache = ResponseCache(
+                cache_path,
+                ttl=float(os.environ.get('DETAIL_CACHE_TTL', 24 * 3600)),
+                max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES,
+            )
+        _detail_scraper = DetailScraper(
+            max_workers=int(os.environ.get('DETAIL_SCRAPE_WORKERS', 8)),
+            requests_per_second=float(os.environ.get('DETAIL_SCRAPE_RPS', 4)),
+            max_retries=int(os.environ.get('DETAIL_SCRAPE_RETRIES', 2)),
+            cache=cache,
+            cache_mode=os.environ.get('DETAIL_CACHE_MODE', 'normal'),
+        )
+    return _detail_scraper
 
 def scrape_additional_details(url):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': '*/*',  # or the specific types you've seen in the network capture
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept-Language': 'en-US,en;q=0.9,es;q=0.8',
-            'Referer': 'https://www.realtor.com/',  # Adjust this based on your observation
-            'Origin': 'https://www.realtor.com',  # This might be necessary for some sites
-        }
-        with requests.get(url, headers=headers, timeout=10) as response:
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                # Extract details
-                beds_tag = soup.find('li', {'data-testid': 'property-meta-beds'})
-                baths_tag = soup.find('li', {'data-testid': 'property-meta-baths'})
-                rent_tag = soup.find('div', {'class': 'price-details'})
-
-                beds = beds_tag.find('span', {'data-testid': 'meta-value'}).get_text().strip() if beds_tag else "N/A"
-                baths = baths_tag.find('span', {'data-testid': 'meta-value'}).get_text().strip() if baths_tag else "N/A"
-                rent = rent_tag.get_text().strip() if rent_tag else "N/A"
-
-                return beds, baths, rent
-            else:
-                logging.warning(f"Unexpected status code {response.status_code} for URL: {url}")
-                return "N/A", "N/A", "N/A"
-    except requests.RequestException as e:
-        logging.error(f"Request failed for {url}: {e}")
-        return "N/A", "N/A", "N/A"
-    except Exception as e:
-        logging.error(f"Error scraping details from {url}: {e}")
-        return "N/A", "N/A", "N/A"
-    
+    return get_detail_scraper().fetch(url)
+
+def ingest_options():
+    """Pipeline settings for run_ingest.
+
+    INGEST_TIME_BUDGET (seconds) should sit below the function timeout: once it
+    runs out no new detail pages are fetched, and what's in flight is still
+    predicted and written. The scrape marks then stay where they were, so
+    the next run scrapes the deferred listings again; the same goes for
+    listings a pipeline stage failed on.
+    """
+    time_budget = os.environ.get('INGEST_TIME_BUDGET')
+    return {
+        'fetch_workers': int(os.environ.get('DETAIL_SCRAPE_WORKERS', 8)),
+        'predict_batch_size': int(os.environ.get('PREDICT_BATCH_SIZE', 256)),
+        'queue_size': int(os.environ.get('PIPELINE_QUEUE_SIZE', 64)),
+        'time_budget': float(time_budget) if time_budget else None,
+    }
+
+def delete_old_listings(on_deleted=None):
+    """Sweep listings past the retention window; on_deleted(doc_id, data) sees each deleted listing.
+
+    RETENTION_DAYS sets the window (365). RETENTION_ARCHIVE, a directory or
+    gs:// prefix, keeps a gzipped copy of everything deleted.
+    RETENTION_DRY_RUN=1 only counts.
+    """
+    from retention import Archive, RetentionSweeper
 
-def delete_old_listings():
     try:
-        db = firestore.Client()
-        one_year_ago = datetime.now() - timedelta(days=365)
-        old_listings = db.collection('properties').where('list_date', '<=', one_year_ago).stream()
-
-        batch = db.batch()
-        for listing in old_listings:
-            batch.delete(db.collection('properties').document(listing.id))
-            logging.info(f"Deleted old listing: {listing.id}")
-        batch.commit()
+        archive_location = os.environ.get('RETENTION_ARCHIVE')
+        sweeper = RetentionSweeper(
+            get_db(),
+            max_age=timedelta(days=float(os.environ.get('RETENTION_DAYS', 365))),
+            page_size=int(os.environ.get('RETENTION_PAGE_SIZE', MAX_BATCH_SIZE)),
+            chunk_size=int(os.environ.get('RETENTION_CHUNK_SIZE', 100)),
+            workers=int(os.environ.get('RETENTION_WORKERS', 4)),
+            archive=Archive(archive_location) if archive_location else None,
+        )
+        report = sweeper.sweep(dry_run=os.environ.get('RETENTION_DRY_RUN', '0') == '1', on_deleted=on_deleted)
+        metrics.current().add('retention', report)
+        return report
     except Exception as e:
         logging.error(f"Error in delete_old_listings: {e}")
+        metrics.incr('retention.errors')
+        return None
 
-def string_to_date(date_string):
-    return datetime.strptime(date_string, '%Y-%m-%d')
+def retry_scrape_property(location="Berkeley, CA", past_days=365, attempts=3, delay=5):
+    from homeharvest import scrape_property
 
-def retry_scrape_property(attempts=3, delay=5):
     for i in range(attempts):
         try:
-            return scrape_property(location="Berkeley, CA", listing_type="for_rent", past_days=365)
+            return scrape_property(location=location, listing_type="for_rent", past_days=past_days)
         except Exception as e:
-            logging.warning(f"Attempt {i+1} failed: {e}")
+            logging.warning(f"Attempt {i+1} for {location} failed: {e}")
+            metrics.incr('scrape.retries')
             if i < attempts - 1:
                 time.sleep(delay)
                 delay *= 2
             else:
                 raise
 
+def scrape_locations():
+    """Scrape every configured location (SCRAPE_LOCATIONS, ';'-separated) from its own high-water mark"""
+    from locations import FULL_SCRAPE_EVERY_DAYS, LocationScraper, parse_locations
+
+    scraper = LocationScraper(
+        get_db(),
+        retry_scrape_property,
+        locations=parse_locations(os.environ.get('SCRAPE_LOCATIONS')),
+        max_workers=int(os.environ.get('SCRAPE_WORKERS', 3)),
+        full_every=timedelta(days=float(os.environ.get('SCRAPE_FULL_EVERY_DAYS', FULL_SCRAPE_EVERY_DAYS))),
+    )
+    with metrics.span('scrape'):
+        scrape = scraper.run()
+    metrics.current().add('scrape', scrape.summary())
+    return scrape
+
 # Function to be triggered
 @pubsub_fn.on_message_published(topic="property-update-topic")
 def scheduled_function(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublishedData]):
-    logging.info("Starting scheduled function at: %s", datetime.now())
-    delete_old_listings()
+    from ml_model.predict import get_model_stats, get_prediction_cache_stats
+
+    from sharding import is_shard_message
+
+    attributes = event.data.message.attributes or {}
+    run = metrics.start_run('scheduled_function')
+    with metrics.maybe_profile('scheduled_function'):
+        if is_shard_message(attributes):
+            process_shard(attributes)
+        elif os.environ.get('SHARDED_RUN', '0') == '1':
+            coordinate_sharded_run()
+        else:
+            update_listings()
+    run.add('model_cache', get_model_stats())
+    run.add('prediction_cache', get_prediction_cache_stats())
+    if _detail_scraper is not None:
+        run.add('detail_scraper', dict(_detail_scraper.stats))
+        if _detail_scraper.cache is not None:
+            run.add('detail_cache', dict(_detail_scraper.cache.stats))
+    run.emit()
 
+def update_aggregates(aggregate_delta):
+    """Fold this run's listing changes into the dashboard aggregates"""
+    from aggregates import AggregateStore
+
+    if os.environ.get('UPDATE_AGGREGATES', '1') != '1':
+        return
+    try:
+        with metrics.span('aggregates'):
+            AggregateStore(get_db()).apply(aggregate_delta)
+    except Exception as e:
+        logging.error(f"Error updating aggregates: {e}")
+        metrics.incr('aggregates.failed')
+
+def append_history(history):
+    """Append this run's listing changes to the rent history"""
+    from rent_history import HistoryStore
+
+    if os.environ.get('RECORD_HISTORY', '1') != '1':
+        return
     try:
-        properties = retry_scrape_property()
+        with metrics.span('history'):
+            HistoryStore(get_db()).append(history)
     except Exception as e:
-        logging.error(f"Failed to scrape properties after retries: {e}")
+        logging.error(f"Error recording rent history: {e}")
+        metrics.incr('history.failed')
+
+def record_removal(aggregate_delta, history):
+    """on_deleted callback for delete_old_listings that takes the listing out of the aggregates and history"""
+    def on_deleted(doc_id, data):
+        aggregate_delta.remove(data)
+        history.record_removed(doc_id, data)
+    return on_deleted
+
+def record_changes(aggregate_delta, history):
+    """Save what this run changed: the aggregates and the rent history"""
+    update_aggregates(aggregate_delta)
+    append_history(history)
+
+def update_listings():
+    from aggregates import AggregateDelta
+    from rent_history import HistoryBatch
+    from ingest import run_ingest
+
+    logging.info("Starting scheduled function at: %s", datetime.now())
+    aggregate_delta = AggregateDelta()
+    history = HistoryBatch()
+    with metrics.span('delete_old_listings'):
+        delete_old_listings(on_deleted=record_removal(aggregate_delta, history))
+
+    scrape = scrape_locations()
+    properties = scrape.properties
+    if properties.empty and scrape.failed:
+        logging.error(f"Failed to scrape properties after retries: {', '.join(scrape.failed)}")
+        metrics.incr('scrape.failed')
+        record_changes(aggregate_delta, history)
+        return
+    if properties.empty:
+        logging.info("No new listings since the last scrape")
+        scrape.commit()
+        record_changes(aggregate_delta, history)
         return
     
     logging.info(f"Number of properties: {len(properties)}")
+    metrics.incr('listings.scraped', len(properties))
+
+    summary = run_ingest(
+        properties,
+        get_property_store(),
+        scrape_additional_details,
+        # An incremental or partly failed scrape leaves out listings that are still live
+        detect_disappeared=scrape.complete and os.environ.get('DETECT_DISAPPEARED', '1') == '1',
+        aggregate_delta=aggregate_delta,
+        history=history,
+        **ingest_options(),
+    )
+    if summary is not None:
+        metrics.current().add('ingest', summary)
+        if summary['deferred'] or summary['errors'] or summary['write_failures']:
+            # Keep the marks: the next scrape covers these listings again, and stored ones are skipped as unchanged
+            logging.warning(f"{summary['deferred']} listings deferred, {summary['errors']} failed in the pipeline and "
+                            f"{summary['write_failures']} writes failed; not advancing the scrape marks")
+        else:
+            scrape.commit()
+    record_changes(aggregate_delta, history)
+
+def get_shard_publisher():
+    """Pub/Sub in production; SHARD_QUEUE=inprocess runs every shard inline (local runs and tests)"""
+    from sharding import InProcessQueue, PubSubPublisher
+
+    if os.environ.get('SHARD_QUEUE', 'pubsub') == 'inprocess':
+        return InProcessQueue(process_shard)
+    return PubSubPublisher(os.environ.get('PUBSUB_TOPIC', 'property-update-topic'))
+
+def coordinate_sharded_run():
+    """Resume an unfinished run, or scrape the index and fan it out as shards"""
+    from aggregates import AggregateDelta
+    from listing_schema import select_listing_columns
+    from rent_history import HistoryBatch
+    from sharding import DEFAULT_RESUME_WINDOW, DEFAULT_SHARD_SIZE, RunCoordinator
+
+    logging.info("Starting sharded run at: %s", datetime.now())
+    resume_hours = os.environ.get('RUN_RESUME_HOURS')
+    coordinator = RunCoordinator(
+        get_db(),
+        get_shard_publisher(),
+        shard_size=int(os.environ.get('SHARD_SIZE', DEFAULT_SHARD_SIZE)),
+        resume_window=timedelta(hours=float(resume_hours)) if resume_hours else DEFAULT_RESUME_WINDOW,
+    )
+    with metrics.span('resume'):
+        resumed = coordinator.resume()
+    if resumed:
+        metrics.current().add('sharding', {'resumed_run': resumed})
+        return
+
+    aggregate_delta = AggregateDelta()
+    history = HistoryBatch()
+    with metrics.span('delete_old_listings'):
+        delete_old_listings(on_deleted=record_removal(aggregate_delta, history))
+    record_changes(aggregate_delta, history)
+
+    scrape = scrape_locations()
+    properties = scrape.properties
+    if properties.empty and scrape.failed:
+        logging.error(f"Failed to scrape properties after retries: {', '.join(scrape.failed)}")
+        metrics.incr('scrape.failed')
+        return
+    if properties.empty:
+        logging.info("No new listings since the last scrape")
+        scrape.commit()
+        return
+
+    logging.info(f"Number of properties: {len(properties)}")
+    metrics.incr('listings.scraped', len(properties))
+    with metrics.span('publish_shards'):
+        # Shard documents carry only the columns ingest reads. The marks are saved with the run and
+        # advance once its last shard is done, so an abandoned run's listings are scraped again
+        run_id = coordinator.start(select_listing_columns(properties), marks=scrape.marks())
+    metrics.current().add('sharding', {'run_id': run_id, 'shard_size': coordinator.shard_size})
+
+def process_shard(attributes):
+    from sharding import DEFAULT_SHARD_LEASE, ShardWorker
+
+    lease = os.environ.get('SHARD_LEASE_MINUTES')
+    lease = timedelta(minutes=float(lease)) if lease else DEFAULT_SHARD_LEASE
+    ShardWorker(get_db(), lease=lease).handle(attributes, ingest_shard)
+
+def ingest_shard(properties):
+    """Ingest one shard's listings; disappeared-listing detection needs the whole scrape, so it's off here"""
+    from aggregates import AggregateDelta
+    from rent_history import HistoryBatch
+    from ingest import run_ingest
+
+    aggregate_delta = AggregateDelta()
+    history = HistoryBatch()
+    summary = run_ingest(
+        properties,
+        get_property_store(),
+        scrape_additional_details,
+        detect_disappeared=False,
+        aggregate_delta=aggregate_delta,
+        history=history,
+        **ingest_options(),
+    )
+    if summary is None:
+        raise RuntimeError("Could not read existing listings for shard")
+    metrics.current().add('ingest', summary)
+    record_changes(aggregate_delta, history)
+    if summary['deferred']:
+        # Leave the shard unfinished so the next resume picks up what's left
+        raise RuntimeError(f"Time budget ran out with {summary['deferred']} listings of the shard left")
+    if summary['errors']:
+        raise RuntimeError(f"{summary['errors']} listings of the shard failed in the pipeline")
+    return summary
+
+_query_cache = None
+
+def get_query_cache():
+    """Responses cached per instance for QUERY_CACHE_TTL seconds (0 turns caching off)"""
+    global _query_cache
+    if _query_cache is None:
+        from property_query import TTLCache
+
+        _query_cache = TTLCache(
+            ttl=float(os.environ.get('QUERY_CACHE_TTL', 30)),
+            max_entries=int(os.environ.get('QUERY_CACHE_SIZE', 256)),
+        )
+    return _query_cache
+
+def _json_response(body, status=200, max_age=0):
+    import json
+
+    response = https_fn.Response(
+        json.dumps(body, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value)),
+        status=status,
+        mimetype='application/json',
+    )
+    if max_age:
+        response.headers['Cache-Control'] = f'public, max-age={int(max_age)}'
+    return response
+
+# The browser frontend calls these functions; CORS_ORIGINS (comma-separated) is read at deploy time
+FRONTEND_CORS = options.CorsOptions(
+    cors_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    cors_methods=['get', 'post'],
+)
+
+@https_fn.on_request(cors=FRONTEND_CORS)
+def query_properties(req: https_fn.Request) -> https_fn.Response:
+    """GET listings filtered by zip_code, beds, min/max_rent, min/max_delta and listed_after/before.
+
+    sort (list_date, rent_amount or rent_delta; '-' for descending), fields
+    (comma-separated projection), limit and cursor (next_cursor from the
+    previous page) shape the response.
+    """
+    from property_query import PropertyQuery, QueryError
+
+    if req.method != 'GET':
+        return _json_response({'error': 'use GET'}, status=405)
+    try:
+        query = PropertyQuery.from_params(req.args)
+    except QueryError as e:
+        return _json_response({'error': str(e)}, status=400)
 
-    for index, row in properties.iterrows():
+    cache = get_query_cache()
+    key = query.cache_key()
+    body = cache.get(key)
+    if body is None:
         try:
-            original_url = row['property_url']
-            encoded_url = encode_url_for_firestore(original_url)
+            with metrics.span('query'):
+                body = query.run(get_db().collection('properties'))
+        except Exception as e:
+            logging.error(f"Error in query_properties: {e}")
+            return _json_response({'error': 'query failed'}, status=500)
+        cache.put(key, body)
+        metrics.incr('query.misses')
+    else:
+        metrics.incr('query.hits')
+    return _json_response(body, max_age=cache.ttl)
 
-            # Get existing property data if it exists
-            existing_property = db.collection('properties').document(encoded_url).get()
-            property_data = existing_property.to_dict() if existing_property.exists else {}
-            
-            # Only update if no prediction exists or it failed
-            if not property_data.get('prediction_success'):
-                if not existing_property.exists:
-                    # New property - get all details
-                    street = row['street']
-                    city = row['city']
-                    state = row['state']
-                    zip_code = row['zip_code']
-
-                    detailed_url = construct_detailed_url(original_url, street, city, state, zip_code)
-                    if detailed_url:
-                        beds, baths, rent = scrape_additional_details(detailed_url)
-                    else:
-                        logging.warning(f"Skipped scraping additional details for: {original_url}")
-                        continue
+@https_fn.on_request(cors=FRONTEND_CORS)
+def rent_trends(req: https_fn.Request) -> https_fn.Response:
+    """GET daily per-ZIP count and mean of a history field (default rent_amount).
 
-                    property_data = row.to_dict()
-                    property_data['list_date'] = string_to_date(property_data['list_date'])
-                    property_data.update({'beds': beds, 'baths': baths, 'rent': rent})
+    start and end are YYYY-MM-DD (default: the last 30 days); zip_code takes
+    one or more comma-separated zips. Only the matching date/ZIP partitions
+    and the requested column are read.
+    """
+    from rent_history import HISTORY_FIELDS, HistoryStore
 
-                # Get ML prediction for new or existing property
-                try:
-                    beds = property_data.get('beds', 'N/A')
-                    baths = property_data.get('baths', 'N/A')
-                    
-                    prediction_input = {
-                        'beds': beds,
-                        'baths': float(baths.replace('N/A', '1')) if baths else 1.0,
-                        'latitude': property_data.get('latitude', 37.8715),
-                        'longitude': property_data.get('longitude', -122.2730),
-                        'neighborhood': 'Central Berkeley',
-                        'days_on_mls': property_data.get('days_on_mls', 0)
-                    }
+    if req.method != 'GET':
+        return _json_response({'error': 'use GET'}, status=405)
+    try:
+        end = datetime.fromisoformat(req.args['end']) if req.args.get('end') else datetime.now()
+        start = datetime.fromisoformat(req.args['start']) if req.args.get('start') else end - timedelta(days=30)
+    except ValueError:
+        return _json_response({'error': 'start and end must be ISO dates (YYYY-MM-DD)'}, status=400)
+    field = req.args.get('field') or 'rent_amount'
+    if field not in HISTORY_FIELDS:
+        return _json_response({'error': f"field must be one of {', '.join(HISTORY_FIELDS)}"}, status=400)
+    zip_codes = [z.strip() for z in (req.args.get('zip_code') or '').split(',') if z.strip()]
+    if len(zip_codes) > 30:
+        return _json_response({'error': 'at most 30 zip codes per query'}, status=400)
 
-                    logging.info(f"Attempting prediction for property: {encoded_url}")
-                    logging.info(f"Prediction input: {prediction_input}")
-                    
-                    prediction_result = predict_rental_price(prediction_input)
-                    
-                    if prediction_result:
-                        logging.info(f"Prediction details for {encoded_url}: {prediction_result}")
-                        property_data.update({
-                            'predicted_rent': prediction_result['predicted_rent'],
-                            'rent_prediction_range_low': prediction_result['confidence_range'][0],
-                            'rent_prediction_range_high': prediction_result['confidence_range'][1],
-                            'model_version': prediction_result['model_version'],
-                            'prediction_success': True
-                        })
-                        logging.info(f"Prediction successful for property: {encoded_url}")
-                    else:
-                        property_data['prediction_success'] = False
-                        logging.warning(f"Prediction returned None for property: {encoded_url}")
-                        
-                except Exception as e:
-                    logging.error(f"Error predicting rent for property {encoded_url}: {e}")
-                    property_data['prediction_success'] = False
-
-                # Store updated property data
-                try:
-                    db.collection('properties').document(encoded_url).set(property_data)
-                    logging.info(f"Successfully stored property: {encoded_url}")
-                except Exception as e:
-                    logging.error(f"Failed to store property {encoded_url} in database: {e}")
-                    
+    cache = get_query_cache()
+    key = f"trends:{start.date()}:{end.date()}:{field}:{','.join(zip_codes)}"
+    body = cache.get(key)
+    if body is None:
+        try:
+            with metrics.span('trends'):
+                series = HistoryStore(get_db()).trend(start, end, zip_codes, field)
         except Exception as e:
-            logging.error(f"Error processing property at index {index}: {e}")
-            continue
\ No newline at end of file
+            logging.error(f"Error in rent_trends: {e}")
+            return _json_response({'error': 'query failed'}, status=500)
+        body = {'field': field, 'start': start.date(), 'end': end.date(), 'series': series}
+        cache.put(key, body)
+    return _json_response(body, max_age=cache.ttl)
+
+_prediction_batcher = None
+_prediction_batcher_lock = threading.Lock()
+
+def get_prediction_batcher():
+    """Batcher shared by every predict_rent request on this instance.
+
+    PREDICT_BATCH_WINDOW_MS is how long the first waiting request holds the
+    batch open for others; PREDICT_MAX_BATCH caps the rows per model call.
+    """
+    global _prediction_batcher
+    if _prediction_batcher is None:
+        with _prediction_batcher_lock:
+            if _prediction_batcher is None:
+                from prediction_batcher import MicroBatcher
+
+                _prediction_batcher = MicroBatcher(
+                    window=float(os.environ.get('PREDICT_BATCH_WINDOW_MS', 5)) / 1000,
+                    max_batch=int(os.environ.get('PREDICT_MAX_BATCH', 256)),
+                )
+    return _prediction_batcher
+
+@https_fn.on_request(cors=FRONTEND_CORS)
+def predict_rent(req: https_fn.Request) -> https_fn.Response:
+    """POST a property (beds, baths, latitude, longitude, zip_code, ...) or {"properties": [...]} for predictions.
+
+    Each prediction has predict_rental_price's shape, or null where the
+    property can't be scored. Concurrent requests on an instance share one
+    model call (see prediction_batcher), and the model stays loaded between
+    requests. latency_ms is this request's time in the function. GET returns
+    the batcher's stats.
+    """
+    start = time.perf_counter()
+    batcher = get_prediction_batcher()
+    if req.method == 'GET':
+        from ml_model.predict import get_model_stats
+
+        return _json_response({'batcher': batcher.stats(), 'model_cache': get_model_stats()})
+    if req.method != 'POST':
+        return _json_response({'error': 'use POST'}, status=405)
+
+    payload = req.get_json(silent=True)
+    single = isinstance(payload, dict) and 'properties' not in payload
+    if single:
+        properties = [payload]
+    elif isinstance(payload, dict):
+        properties = payload['properties']
+    else:
+        properties = payload
+    max_properties = int(os.environ.get('PREDICT_MAX_PROPERTIES', 100))
+    if not isinstance(properties, list) or not properties or not all(isinstance(p, dict) for p in properties):
+        return _json_response({'error': 'body must be a property object, a list of them or {"properties": [...]}'},
+                              status=400)
+    if len(properties) > max_properties:
+        return _json_response({'error': f"at most {max_properties} properties per request"}, status=400)
+    # Lists or objects as field values would fail the whole shared batch, not just this request
+    for i, property_info in enumerate(properties):
+        nested = sorted(k for k, v in property_info.items() if not isinstance(v, (str, int, float, bool, type(None))))
+        if nested:
+            return _json_response({'error': f"property {i}: {', '.join(nested)} must be a string, number or null"},
+                                  status=400)
+
+    try:
+        predictions, batch = batcher.submit(properties, timeout=30)
+    except Exception as e:
+        logging.error(f"Error in predict_rent: {e}")
+        return _json_response({'error': 'prediction failed'}, status=500)
+    latency_ms = round((time.perf_counter() - start) * 1000, 3)
+    metrics.incr('predict_api.requests')
+
+    body = {'latency_ms': latency_ms, 'batch': batch}
+    if single:
+        body['prediction'] = predictions[0]
+    else:
+        body.update(predictions=predictions, count=len(predictions))
+    response = _json_response(body)
+    response.headers['Server-Timing'] = (f"queue;dur={batch['queued_ms']}, predict;dur={batch['predict_ms']}, "
+                                         f"total;dur={latency_ms}")
+    return response
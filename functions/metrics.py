@@ -0,0 +1,180 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Fraction of per-property INFO lines that actually get logged
+DEFAULT_LOG_SAMPLE_RATE = 0.01
+# Samples kept per histogram outside a run (e.g. by HTTP functions, which never start one)
+IDLE_MAX_SAMPLES = 1000
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    n = len(ordered)
+    return {
+        'count': n,
+        'total': round(sum(ordered), 6),
+        'mean': round(sum(ordered) / n, 6),
+        'p50': round(ordered[n // 2], 6),
+        'p90': round(ordered[min(n - 1, int(n * 0.9))], 6),
+        'p99': round(ordered[min(n - 1, int(n * 0.99))], 6),
+        'max': round(ordered[-1], 6),
+    }
+
+
+class StageClock:
+    """Times consecutive stages: each lap(name) records the time since the previous lap"""
+
+    def __init__(self, run, prefix):
+        self._run = run
+        self._prefix = prefix
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        elapsed, self._last = now - self._last, now
+        self._run.observe(f"{self._prefix}.{name}", elapsed, span=True)
+        return round(elapsed, 4)
+
+
+class RunMetrics:
+    """Span timers, counters and histograms for one function run, summarized as JSON at the end"""
+
+    def __init__(self, name, max_samples=None):
+        """max_samples keeps only the latest values of each histogram"""
+        self.name = name
+        self.max_samples = max_samples
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.span_names = set()
+        self.extra = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, span=True)
+
+    def stage_clock(self, prefix):
+        return StageClock(self, prefix)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, span=False):
+        with self._lock:
+            values = self.histograms.get(name)
+            if values is None:
+                values = self.histograms[name] = deque(maxlen=self.max_samples) if self.max_samples else []
+            values.append(value)
+            if span:
+                self.span_names.add(name)
+
+    def add(self, key, value):
+        """Attach extra structured data (e.g. a component's own stats) to the summary"""
+        self.extra[key] = value
+
+    def summary(self):
+        with self._lock:
+            histograms = {name: summarize(values) for name, values in self.histograms.items()}
+            return {
+                'run': self.name,
+                'started_at': self.started_at.isoformat(),
+                'duration_seconds': round(time.perf_counter() - self._start, 3),
+                'spans': {name: h for name, h in histograms.items() if name in self.span_names},
+                'histograms': {name: h for name, h in histograms.items() if name not in self.span_names},
+                'counters': dict(self.counters),
+                **self.extra,
+            }
+
+    def emit(self):
+        """Log the run summary as a single JSON line"""
+        summary = self.summary()
+        logging.info("RUN_SUMMARY " + json.dumps(summary, default=str, sort_keys=True))
+        return summary
+
+
+_current = RunMetrics('idle', max_samples=IDLE_MAX_SAMPLES)
+
+
+def start_run(name):
+    """Start collecting metrics for a new run; module-level helpers record into it"""
+    global _current
+    _current = RunMetrics(name)
+    return _current
+
+
+def current():
+    return _current
+
+
+def span(name):
+    return _current.span(name)
+
+
+def incr(name, value=1):
+    _current.incr(name, value)
+
+
+def observe(name, value):
+    _current.observe(name, value)
+
+
+def sample_log(rate=None):
+    """True for the fraction of calls (LOG_SAMPLE_RATE, default 1%) whose per-item INFO line should be logged"""
+    if rate is None:
+        rate = float(os.environ.get('LOG_SAMPLE_RATE', DEFAULT_LOG_SAMPLE_RATE))
+    return rate >= 1 or random.random() < rate
+
+
+@contextmanager
+def maybe_profile(name):
+    """Profile the block when PROFILE_RUN is 'cprofile' or 'pyinstrument'; otherwise do nothing"""
+    profiler_name = os.environ.get('PROFILE_RUN', '').lower()
+    if profiler_name not in ('cprofile', 'pyinstrument'):
+        yield
+        return
+
+    if profiler_name == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.warning("PROFILE_RUN=pyinstrument but pyinstrument isn't installed, using cProfile")
+            profiler_name = 'cprofile'
+
+    if profiler_name == 'pyinstrument':
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            logging.info(f"Profile for {name}:\n{profiler.output_text(unicode=False, color=False)}")
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+        logging.info(f"Profile for {name}:\n{output.getvalue()}")
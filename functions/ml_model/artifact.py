@@ -0,0 +1,129 @@
+"""Compact model artifact: a LightGBM text model plus a small JSON sidecar.
+
+The sidecar is the artifact's manifest. It names the model file and holds its
+sha256, the feature list, the neighborhood encoder vocabulary, the model
+version and the RMSE used for confidence ranges. Loading it needs neither
+pickle nor scikit-learn, which keeps cold starts short.
+
+Convert the legacy joblib bundle (run from functions/):
+
+    python -m ml_model.artifact ml_model/rent_prediction_model.joblib --version 2.0 --rmse 675.56
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+ARTIFACT_FORMAT = 'lightgbm-text'
+
+
+class NeighborhoodEncoder:
+    """The parts of sklearn's LabelEncoder that prediction uses, without importing sklearn"""
+
+    def __init__(self, classes):
+        self.classes_ = np.array([np.nan if c is None else c for c in classes], dtype=object)
+        self._codes = {label: code for code, label in enumerate(self.classes_) if isinstance(label, str)}
+
+    def transform(self, labels):
+        try:
+            return np.array([self._codes[label] for label in labels], dtype=int)
+        except (KeyError, TypeError):
+            unseen = [label for label in labels if not isinstance(label, str) or label not in self._codes]
+            raise ValueError(f"y contains previously unseen labels: {unseen}")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def export_artifact(booster, le_neighborhood, features, sidecar_path, version, rmse, extra=None):
+    """Write <name>.txt (the booster) and then <name>.json (the manifest).
+
+    The sidecar is written last, so a reader that sees a new sidecar also sees
+    the model file it refers to. Returns the sidecar contents.
+    """
+    model_path = os.path.splitext(sidecar_path)[0] + '.txt'
+    _write_atomic(model_path, booster.model_to_string())
+
+    classes = le_neighborhood.classes_
+    metadata = {
+        'format': ARTIFACT_FORMAT,
+        'version': str(version),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'model_file': os.path.basename(model_path),
+        'model_sha256': _sha256(model_path),
+        'features': list(features),
+        'neighborhood_classes': [c if isinstance(c, str) else None for c in classes],
+        'rmse': float(rmse),
+    }
+    if extra:
+        metadata.update(extra)
+    _write_atomic(sidecar_path, json.dumps(metadata, indent=2) + '\n')
+    return metadata
+
+
+def read_metadata(sidecar_path):
+    with open(sidecar_path) as f:
+        return json.load(f)
+
+
+def load_artifact(sidecar_path):
+    """Return (booster, encoder, features, metadata) for a sidecar written by export_artifact"""
+    import lightgbm as lgb
+
+    metadata = read_metadata(sidecar_path)
+    if metadata.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported model artifact format: {metadata.get('format')}")
+
+    model_path = os.path.join(os.path.dirname(os.path.abspath(sidecar_path)), metadata['model_file'])
+    with open(model_path, 'rb') as f:
+        model_bytes = f.read()
+    if hashlib.sha256(model_bytes).hexdigest() != metadata['model_sha256']:
+        raise ValueError(f"{model_path} doesn't match the sha256 in {sidecar_path}")
+
+    # Booster(model_file=...) fails on LightGBM 4.1's own parameters block
+    # ("unordered_map::at"); parsing from the string doesn't
+    booster = lgb.Booster(model_str=model_bytes.decode())
+    encoder = NeighborhoodEncoder(metadata['neighborhood_classes'])
+    return booster, encoder, metadata['features'], metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a joblib (model, encoder, features) bundle into a model artifact')
+    parser.add_argument('joblib_path')
+    parser.add_argument('--output', help='sidecar path (default: the joblib path with a .json suffix)')
+    parser.add_argument('--version', required=True)
+    parser.add_argument('--rmse', type=float, required=True)
+    args = parser.parse_args()
+
+    import joblib
+
+    booster, le_neighborhood, features = joblib.load(args.joblib_path)
+    output = args.output or os.path.splitext(args.joblib_path)[0] + '.json'
+    metadata = export_artifact(booster, le_neighborhood, features, output, args.version, args.rmse)
+    print(f"Wrote {output} and {metadata['model_file']} (version {metadata['version']})")
+
+
+if __name__ == '__main__':
+    main()
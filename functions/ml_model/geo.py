@@ -0,0 +1,109 @@
+"""Location features shared by serving (predict.py) and offline training.
+
+Distances are plain euclidean distances in degrees, which is what the current
+model was trained on, so don't switch to haversine without retraining.
+"""
+import numpy as np
+import pandas as pd
+
+# Points the model measures distance to; feature names are dist_to_<name>
+POINTS_OF_INTEREST = {
+    'center': (37.8715, -122.2730),
+    'uc': (37.8719, -122.2585),
+    'bart': (37.8703, -122.2677),  # Downtown Berkeley BART
+}
+
+# Every BART station near Berkeley, for a nearest-station feature
+BART_STATIONS = {
+    'Downtown Berkeley': (37.8703, -122.2677),
+    'North Berkeley': (37.8740, -122.2834),
+    'Ashby': (37.8529, -122.2700),
+    'El Cerrito Plaza': (37.9030, -122.2992),
+    'Rockridge': (37.8447, -122.2513),
+    'MacArthur': (37.8290, -122.2671),
+}
+
+ZIP_NEIGHBORHOODS = {
+    '94704': 'Southside',
+    '94703': 'South Berkeley',
+    '94702': 'West Berkeley',
+    '94709': 'North Berkeley',
+    '94710': 'Northwest Berkeley',
+    '94720': 'UC Campus',
+    '94705': 'Elmwood',
+    '94708': 'Berkeley Hills'
+}
+DEFAULT_NEIGHBORHOOD = 'Central Berkeley'
+
+
+class GeoIndex:
+    """Distance features for many coordinates at once.
+
+    `points` each give a dist_to_<name> column. `groups` map a name to a set of
+    points (e.g. BART_STATIONS) and give dist_to_nearest_<name>, answered by a
+    KD-tree built once when the index is created. Only groups import scipy;
+    the deployed model uses points alone.
+    """
+
+    def __init__(self, points=None, groups=None):
+        points = POINTS_OF_INTEREST if points is None else points
+        self.point_names = list(points)
+        self._points = np.array([points[name] for name in self.point_names], dtype=float).reshape(-1, 2)
+        self._trees = {}
+        if groups:
+            from scipy.spatial import cKDTree
+
+            self._trees = {name: cKDTree(np.array(list(members.values()), dtype=float))
+                           for name, members in groups.items()}
+
+    @property
+    def feature_names(self):
+        return [f'dist_to_{name}' for name in self.point_names] + [f'dist_to_nearest_{name}' for name in self._trees]
+
+    def distances(self, latitude, longitude):
+        """Dict of feature name -> float array; NaN coordinates give NaN distances"""
+        latitude = np.asarray(latitude, dtype=float).reshape(-1)
+        longitude = np.asarray(longitude, dtype=float).reshape(-1)
+        features = {}
+        for name, (poi_lat, poi_lon) in zip(self.point_names, self._points):
+            features[f'dist_to_{name}'] = np.sqrt((latitude - poi_lat)**2 + (longitude - poi_lon)**2)
+
+        if self._trees:
+            finite = np.isfinite(latitude) & np.isfinite(longitude)
+            coords = np.column_stack([latitude[finite], longitude[finite]])
+            for name, tree in self._trees.items():
+                nearest = np.full(len(latitude), np.nan)
+                if len(coords):
+                    nearest[finite] = tree.query(coords)[0]
+                features[f'dist_to_nearest_{name}'] = nearest
+        return features
+
+    def distances_at(self, latitude, longitude):
+        """distances() for a single coordinate, as plain floats"""
+        # np.asarray would happily parse '37.87'; the model inputs must already be numbers
+        if not all(isinstance(v, (int, float, np.number)) for v in (latitude, longitude)):
+            raise TypeError(f"Coordinates must be numbers, got {latitude!r}, {longitude!r}")
+        return {name: float(values[0]) for name, values in self.distances(latitude, longitude).items()}
+
+
+# The features the deployed model uses
+GEO_INDEX = GeoIndex()
+
+
+def neighborhood_for_zip(zip_code, default=DEFAULT_NEIGHBORHOOD):
+    return ZIP_NEIGHBORHOODS.get(zip_code, default)
+
+
+def neighborhoods_for_zips(zip_codes, default=DEFAULT_NEIGHBORHOOD):
+    """Vectorized neighborhood_for_zip; each distinct zip is looked up once"""
+    zip_codes = pd.Series(np.asarray(zip_codes, dtype=object))
+    codes, uniques = pd.factorize(zip_codes, use_na_sentinel=False)
+    labels = np.array([neighborhood_for_zip(z, default) for z in uniques], dtype=object)
+    return labels[codes]
+
+
+def add_geo_features(df, index=GEO_INDEX, latitude='latitude', longitude='longitude'):
+    """Add the distance columns to a DataFrame of listings (training data or a scoring batch)"""
+    for name, values in index.distances(df[latitude].to_numpy(), df[longitude].to_numpy()).items():
+        df[name] = values
+    return df
@@ -0,0 +1,85 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Value used when beds/baths are missing or can't be parsed
+DEFAULT_COUNT = 1
+
+
+@lru_cache(maxsize=4096)
+def _parse_count(text):
+    """Parse an already lowercased beds/baths string ("studio - 2", "1+", "2.5")"""
+    if "studio" in text:
+        return 0
+
+    if "-" in text:
+        first_part = text.split("-")[0].strip()
+        if "studio" in first_part:
+            return 0
+        try:
+            return float(first_part)
+        except ValueError:
+            return DEFAULT_COUNT
+
+    if "+" in text:
+        base = text.replace("+", "").strip()
+        if "studio" in base:
+            return 0
+        try:
+            return float(base)
+        except ValueError:
+            return DEFAULT_COUNT
+
+    try:
+        return float(text)
+    except ValueError:
+        return DEFAULT_COUNT
+
+
+def _build_token_table():
+    """Raw beds/baths strings as homeharvest and realtor.com write them, parsed ahead of time"""
+    tokens = ["N/A", "Studio", "studio", "Studio - 1", "Studio - 2", "Studio - 3", "Studio+"]
+    counts = [str(n) for n in range(0, 11)] + [f"{n}.5" for n in range(0, 10)]
+    for count in counts:
+        tokens.extend([count, f"{count}+"])
+        tokens.extend(f"{count} - {upper}" for upper in counts)
+    table = {token: _parse_count(token.lower()) for token in tokens}
+    table["N/A"] = DEFAULT_COUNT
+    return table
+
+
+TOKEN_TABLE = _build_token_table()
+
+
+def extract_first_number(value):
+    """Extract first number with better N/A handling"""
+    if type(value) is str:
+        known = TOKEN_TABLE.get(value)
+        if known is not None:
+            return known
+        return _parse_count(value.lower())
+
+    if pd.isna(value):
+        return DEFAULT_COUNT  # Default to 1 instead of None
+    return _parse_count(str(value).lower())
+
+
+def normalize_counts(values):
+    """Vectorized extract_first_number over a whole column; returns a float array.
+
+    Each distinct value is parsed once and the results are broadcast back, so
+    the cost scales with the vocabulary size rather than the row count.
+    """
+    values = pd.Series(values, dtype=object) if not isinstance(values, pd.Series) else values.astype(object)
+    try:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    except TypeError:
+        # Unhashable values (lists etc.) can't be factorized
+        return np.array([extract_first_number(v) for v in values], dtype=float)
+    parsed = np.array([extract_first_number(v) for v in uniques], dtype=float)
+    return parsed[codes]
+
+
+def cache_info():
+    return _parse_count.cache_info()
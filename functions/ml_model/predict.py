@@ -1,41 +1,15 @@
-import joblib
+import hashlib
+import os
+import threading
+import time
 import pandas as pd
 import numpy as np
 import logging
-
-def extract_first_number(value):
-    """Extract first number with better N/A handling"""
-    if pd.isna(value) or value == "N/A":
-        return 1  # Default to 1 instead of None
-        
-    value = str(value).lower()
-    
-    if "studio" in value:
-        return 0
-        
-    if "-" in value:
-        first_part = value.split("-")[0].strip()
-        if "studio" in first_part:
-            return 0
-        try:
-            return float(first_part)
-        except:
-            return 1  # Default to 1
-            
-    if "+" in value:
-        base = value.replace("+", "").strip()
-        if "studio" in base:
-            return 0
-        try:
-            return float(base)
-        except:
-            return 1  # Default to 1
-            
-    try:
-        return float(value)
-    except:
-        return 1  # Default to 1
-    
+import metrics
+from ml_model.normalize import extract_first_number, normalize_counts
+from ml_model.artifact import load_artifact
+from ml_model.prediction_cache import PredictionCache, feature_hashes
+from ml_model.geo import GEO_INDEX, ZIP_NEIGHBORHOODS, neighborhood_for_zip, neighborhoods_for_zips
 
 def get_property_defaults(property_info):
     """Get property info with default values"""
@@ -59,51 +33,221 @@ def get_property_defaults(property_info):
 
 def get_neighborhood_from_zip(zip_code):
     zip_code = zip_code.astype(str)
-    neighborhood_map = {
-        '94704': 'Southside',
-        '94703': 'South Berkeley',
-        '94702': 'West Berkeley',
-        '94709': 'North Berkeley',
-        '94710': 'Northwest Berkeley',
-        '94720': 'UC Campus',
-        '94705': 'Elmwood',
-        '94708': 'Berkeley Hills'
-    }
-    neighborhood = zip_code.map(neighborhood_map)
+    neighborhood = zip_code.map(ZIP_NEIGHBORHOODS)
     return neighborhood
 
-def load_model():
-    try:
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(current_dir, 'rent_prediction_model.joblib')
-        
-        logging.info(f"Current directory: {current_dir}")
-        logging.info(f"Looking for model at: {model_path}")
-        
-        if not os.path.exists(model_path):
-            logging.error(f"Model file not found at {model_path}")
-            logging.info(f"Directory contents: {os.listdir(current_dir)}")
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.join(MODEL_DIR, 'rent_prediction_model.json')
+LEGACY_MODEL_PATH = os.path.join(MODEL_DIR, 'rent_prediction_model.joblib')
+MODEL_PATH = os.environ.get('MODEL_PATH') or (ARTIFACT_PATH if os.path.exists(ARTIFACT_PATH) else LEGACY_MODEL_PATH)
+
+# What a legacy joblib bundle is assumed to be, since it carries no metadata
+LEGACY_METADATA = {'version': '2.0', 'rmse': 675.56}
+
+def _load_bundle(model_path):
+    """Return ((model, le_neighborhood, features), metadata) for a sidecar or a legacy joblib file"""
+    if model_path.endswith('.json'):
+        model, le_neighborhood, features, metadata = load_artifact(model_path)
+        return (model, le_neighborhood, features), metadata
+    import joblib
+    return joblib.load(model_path), dict(LEGACY_METADATA)
+
+class ModelRegistry:
+    """Process-wide model cache so a warm instance deserializes the model once.
+
+    The file's mtime and size are checked on every lookup; when they change the
+    content hash is compared and the model is reloaded only if it differs.
+    """
+
+    def __init__(self, model_path=MODEL_PATH):
+        self.model_path = model_path
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._metadata = None
+        self._stat_key = None
+        self._content_hash = None
+        self.stats = {
+            'loads': 0,
+            'cache_hits': 0,
+            'reloads': 0,
+            'load_failures': 0,
+            'last_load_seconds': None,
+            'total_load_seconds': 0.0,
+        }
+
+    def _stat_key_for_file(self):
+        stat = os.stat(self.model_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _hash_file(self):
+        digest = hashlib.sha256()
+        with open(self.model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load(self, stat_key):
+        start = time.perf_counter()
+        content_hash = self._hash_file()
+        if self._bundle is not None and content_hash == self._content_hash:
+            # Touched but not changed, keep the loaded model
+            self._stat_key = stat_key
+            return self._bundle
+
+        bundle, metadata = _load_bundle(self.model_path)
+        elapsed = time.perf_counter() - start
+
+        if self._bundle is not None:
+            self.stats['reloads'] += 1
+        self._bundle = bundle
+        self._metadata = metadata
+        self._stat_key = stat_key
+        self._content_hash = content_hash
+        self.stats['loads'] += 1
+        self.stats['last_load_seconds'] = elapsed
+        metrics.observe('model.load_seconds', elapsed)
+        self.stats['total_load_seconds'] += elapsed
+        logging.info(f"Loaded model {metadata['version']} from {self.model_path} in {elapsed:.3f}s (sha256 {content_hash[:12]})")
+        return bundle
+
+    def get(self):
+        """Return (model, le_neighborhood, features), loading only when the file changed"""
+        try:
+            stat_key = self._stat_key_for_file()
+        except OSError:
+            logging.error(f"Model file not found at {self.model_path}")
+            logging.info(f"Directory contents: {os.listdir(os.path.dirname(self.model_path))}")
+            self.stats['load_failures'] += 1
             return None, None, None
-            
-        model, le_neighborhood, features = joblib.load(model_path)
-        return model, le_neighborhood, features
-    except Exception as e:
-        logging.error(f"Error loading model: {str(e)}")
-        return None, None, None
+
+        bundle = self._bundle
+        if bundle is not None and stat_key == self._stat_key:
+            self.stats['cache_hits'] += 1
+            metrics.incr('model.cache_hits')
+            return bundle
+
+        with self._lock:
+            # Another thread may have loaded it while we waited
+            if self._bundle is not None and stat_key == self._stat_key:
+                self.stats['cache_hits'] += 1
+                return self._bundle
+            try:
+                return self._load(stat_key)
+            except Exception as e:
+                logging.error(f"Error loading model: {str(e)}")
+                self.stats['load_failures'] += 1
+                return None, None, None
+
+    @property
+    def content_hash(self):
+        return self._content_hash
+
+    @property
+    def metadata(self):
+        """Version, RMSE etc. of the loaded model; None until it has loaded"""
+        return self._metadata
+
+    def get_stats(self):
+        return dict(
+            self.stats,
+            model_path=self.model_path,
+            content_hash=self._content_hash,
+            model_version=self._metadata['version'] if self._metadata else None,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._bundle = None
+            self._metadata = None
+            self._stat_key = None
+            self._content_hash = None
+
+
+_registry = ModelRegistry()
+
+def load_model():
+    return _registry.get()
+
+def warm_model():
+    """Load the model ahead of the first request, e.g. when the container starts"""
+    model, _, _ = load_model()
+    return model is not None
+
+def get_model_stats():
+    return _registry.get_stats()
+
+def get_model_metadata():
+    """Metadata of the model load_model() last returned"""
+    return _registry.metadata or LEGACY_METADATA
+
+_prediction_cache = None
+_prediction_cache_lock = threading.Lock()
+
+def get_prediction_cache():
+    """Process-wide prediction cache, or None when PREDICTION_CACHE_SIZE is 0.
+
+    PREDICTION_CACHE_PATH adds a SQLite tier that outlives the process.
+    """
+    global _prediction_cache
+    max_entries = int(os.environ.get('PREDICTION_CACHE_SIZE', 50000))
+    if max_entries <= 0:
+        return None
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None:
+                _prediction_cache = PredictionCache(
+                    max_entries=max_entries,
+                    path=os.environ.get('PREDICTION_CACHE_PATH') or None,
+                )
+    return _prediction_cache
+
+def get_prediction_cache_stats():
+    return _prediction_cache.get_stats() if _prediction_cache is not None else None
+
+def _model_key():
+    """Identifies the loaded model; changes whenever the artifact's content does"""
+    return f"{get_model_metadata()['version']}:{_registry.content_hash}"
+
+def _predict_raw(model, X):
+    """model.predict(X) as a float array, served from the prediction cache where possible.
+
+    Only rows whose feature vectors aren't cached reach the model, and rows
+    that share a feature vector (units in the same building) are scored once.
+    """
+    cache = get_prediction_cache()
+    if cache is None or not len(X):
+        return np.asarray(model.predict(X), dtype=float)
+
+    model_key = _model_key()
+    hashes = feature_hashes(X)
+    cached = cache.get_many(model_key, hashes)
+    first_row = {}
+    for i, h in enumerate(hashes):
+        if h not in cached:
+            first_row.setdefault(h, i)
+    if first_row:
+        rows = list(first_row.values())
+        scored = np.asarray(model.predict(X.iloc[rows]), dtype=float)
+        computed = dict(zip(first_row, scored))
+        cache.put_many(model_key, computed)
+        cached.update(computed)
+    metrics.incr('predict.cache_hits', len(hashes) - len(first_row))
+    metrics.incr('predict.cache_misses', len(first_row))
+    return np.array([cached[h] for h in hashes], dtype=float)
 
 def predict_rental_price(property_info):
     try:
-        logging.info(f"Loading model...")
         model, le_neighborhood, features = load_model()
-        if not model:
+        if model is None:
             logging.error("Failed to load model")
             return None
             
         # Get property info with defaults
         property_info = get_property_defaults(property_info)
         
-        logging.info(f"Using property info with defaults: {property_info}")
+        log_details = metrics.sample_log()
+        if log_details:
+            logging.info(f"Using property info with defaults: {property_info}")
         
         # Create feature dictionary with safe values
         feature_dict = {
@@ -124,24 +268,7 @@ def predict_rental_price(property_info):
         }
         
         # Calculate distances
-        berkeley_center = (37.8715, -122.2730)
-        UC_BERKELEY = (37.8719, -122.2585)
-        DOWNTOWN_BART = (37.8703, -122.2677)
-        
-        feature_dict['dist_to_center'] = np.sqrt(
-            (feature_dict['latitude'] - berkeley_center[0])**2 +
-            (feature_dict['longitude'] - berkeley_center[1])**2
-        )
-        
-        feature_dict['dist_to_uc'] = np.sqrt(
-            (feature_dict['latitude'] - UC_BERKELEY[0])**2 +
-            (feature_dict['longitude'] - UC_BERKELEY[1])**2
-        )
-        
-        feature_dict['dist_to_bart'] = np.sqrt(
-            (feature_dict['latitude'] - DOWNTOWN_BART[0])**2 +
-            (feature_dict['longitude'] - DOWNTOWN_BART[1])**2
-        )
+        feature_dict.update(GEO_INDEX.distances_at(feature_dict['latitude'], feature_dict['longitude']))
         
         # Safe seasonal features
         try:
@@ -157,21 +284,11 @@ def predict_rental_price(property_info):
         # Create DataFrame and add neighborhood encoding
         df = pd.DataFrame([feature_dict])
                 # Get neighborhood encoding
-        zip_code = property_info.get('zip_code', '94704')
-        neighborhood_map = {
-            '94704': 'Southside',
-            '94703': 'South Berkeley',
-            '94702': 'West Berkeley',
-            '94709': 'North Berkeley',
-            '94710': 'Northwest Berkeley',
-            '94720': 'UC Campus',
-            '94705': 'Elmwood',
-            '94708': 'Berkeley Hills'
-        }
-        neighborhood = neighborhood_map.get(property_info['zip_code'], 'Central Berkeley')
+        neighborhood = neighborhood_for_zip(property_info['zip_code'])
         df['neighborhood_encoded'] = le_neighborhood.transform([neighborhood])[0]
         
-        logging.info(f"Features created: {df.columns.tolist()}")
+        if log_details:
+            logging.info(f"Features created: {df.columns.tolist()}")
         
         # Ensure all required features are present
         missing_features = set(features) - set(df.columns)
@@ -180,11 +297,11 @@ def predict_rental_price(property_info):
             return None
             
         # Make prediction using only required features
-        prediction = model.predict(df[features])[0]
+        prediction = _predict_raw(model, df[features])[0]
         prediction = round(prediction / 50) * 50
         
         # Dynamic confidence range
-        rmse = 675.56
+        rmse = get_model_metadata()['rmse']
         confidence_factor = 1.0
         if feature_dict['is_studio']:
             confidence_factor = 1.2
@@ -199,13 +316,195 @@ def predict_rental_price(property_info):
         result = {
             'predicted_rent': prediction,
             'confidence_range': confidence_range,
-            'model_version': '2.0',
+            'model_version': get_model_metadata()['version'],
             'prediction_quality': 'high' if confidence_factor == 1.0 else 'medium'
         }
-        logging.info(f"Prediction successful: {result}")
+        if log_details:
+            logging.info(f"Prediction successful: {result}")
         return result
         
     except Exception as e:
         logging.error(f"Error making prediction: {str(e)}")
         logging.error(f"Property info: {property_info}")
-        return None
\ No newline at end of file
+        return None
+
+PROPERTY_DEFAULTS = {
+    'latitude': 37.8715,
+    'longitude': -122.2730,
+    'style': 'APARTMENT',
+    'zip_code': '94704',
+    'days_on_mls': 0,
+}
+
+def _input_columns(properties):
+    """Pull the raw input columns out of a DataFrame or a list of property dicts.
+
+    Defaults only apply when a field is missing entirely, matching the
+    property_info.get(key, default) lookups of the per-row path.
+    """
+    now = pd.Timestamp.now()
+    if isinstance(properties, pd.DataFrame):
+        n = len(properties)
+        def column(name, default):
+            if name in properties.columns:
+                return properties[name].to_numpy(dtype=object)
+            return np.full(n, default, dtype=object)
+    else:
+        properties = list(properties)
+        def column(name, default):
+            values = np.empty(len(properties), dtype=object)
+            values[:] = [p.get(name, default) for p in properties]
+            return values
+
+    columns = {name: column(name, default) for name, default in PROPERTY_DEFAULTS.items()}
+    columns['beds'] = column('beds', None)
+    columns['baths'] = column('baths', None)
+    columns['list_date'] = column('list_date', now)
+    return columns
+
+def _numeric_column(values):
+    """Convert to float, flagging values the scalar path would fail on (None, strings)"""
+    is_number = np.fromiter(
+        (isinstance(v, (int, float, np.number)) for v in values), dtype=bool, count=len(values)
+    )
+    out = np.full(len(values), np.nan)
+    out[is_number] = values[is_number].astype(float)
+    return out, is_number
+
+def _map_unique(values, func):
+    """Apply func once per distinct value and broadcast the result back"""
+    cache = {}
+    out = np.empty(len(values), dtype=float)
+    for i, v in enumerate(values):
+        try:
+            out[i] = cache[v]
+        except KeyError:
+            out[i] = cache[v] = func(v)
+        except TypeError:
+            out[i] = func(v)
+    return out
+
+def _summer_flag(list_date):
+    try:
+        return 1 if pd.to_datetime(list_date).month in [6, 7, 8] else 0
+    except:
+        return 0
+
+def build_feature_frame(properties, le_neighborhood):
+    """Build the model features for many properties at once.
+
+    Returns (DataFrame of features, boolean mask of rows the model can score).
+    Rows outside the mask are the ones predict_rental_price would return None for.
+    """
+    columns = _input_columns(properties)
+    n = len(columns['style'])
+
+    beds = normalize_counts(columns['beds'])
+    baths = normalize_counts(columns['baths'])
+    latitude, lat_ok = _numeric_column(columns['latitude'])
+    longitude, lon_ok = _numeric_column(columns['longitude'])
+    days_on_mls, days_ok = _numeric_column(columns['days_on_mls'])
+    style = columns['style']
+    zip_code = columns['zip_code']
+
+    is_apartment = (style == 'APARTMENT')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_on_market_log = np.log1p(days_on_mls)
+        bed_bath_ratio = np.where(baths > 0, beds / np.where(baths > 0, baths, 1), 1.0)
+
+    df = pd.DataFrame({
+        'beds': beds,
+        'baths': baths,
+        'is_studio': (beds == 0).astype(int),
+        'total_rooms': beds + baths,
+        'latitude': latitude,
+        'longitude': longitude,
+        'days_on_market_log': days_on_market_log,
+        'is_apartment': is_apartment.astype(int),
+        'is_house': (style == 'SINGLE_FAMILY').astype(int),
+        'has_sqft': np.zeros(n, dtype=int),
+        'is_student_housing': np.isin(zip_code, ['94704', '94720']).astype(int),
+        'is_luxury': ((beds >= 2) & is_apartment).astype(int),
+        'price_per_room': np.zeros(n, dtype=int),
+    })
+
+    for name, values in GEO_INDEX.distances(latitude, longitude).items():
+        df[name] = values
+
+    df['is_summer'] = _map_unique(columns['list_date'], _summer_flag).astype(int)
+    df['bed_bath_ratio'] = bed_bath_ratio
+
+    # Neighborhoods the encoder never saw (including the 'Central Berkeley'
+    # fallback) can't be scored, same as le_neighborhood.transform raising
+    neighborhood = pd.Series(neighborhoods_for_zips(zip_code))
+    codes = {label: code for code, label in enumerate(le_neighborhood.classes_) if isinstance(label, str)}
+    encoded = neighborhood.map(codes)
+    neighborhood_ok = encoded.notna().to_numpy()
+    df['neighborhood_encoded'] = encoded.fillna(-1).astype(int).to_numpy()
+
+    valid = lat_ok & lon_ok & days_ok & neighborhood_ok
+    return df, valid
+
+def predict_rental_prices_batch(properties):
+    """Vectorized predict_rental_price for a DataFrame or list of property dicts.
+
+    Calls model.predict at most once, for the rows the prediction cache
+    doesn't already hold, and returns a dict of arrays:
+    'predicted_rent', 'confidence_range' (n x 2), 'prediction_quality' and
+    'success'. Rows where success is False hold NaN. Returns None if the model
+    can't be loaded.
+    """
+    model, le_neighborhood, features = load_model()
+    if model is None:
+        logging.error("Failed to load model")
+        return None
+
+    with metrics.span('predict.features'):
+        df, valid = build_feature_frame(properties, le_neighborhood)
+    n = len(df)
+
+    missing_features = set(features) - set(df.columns)
+    if missing_features:
+        logging.error(f"Missing features: {missing_features}")
+        valid = np.zeros(n, dtype=bool)
+
+    predicted_rent = np.full(n, np.nan)
+    if valid.any():
+        with metrics.span('predict.model'):
+            raw = _predict_raw(model, df.loc[valid, features])
+        predicted_rent[valid] = np.round(raw / 50) * 50
+
+    confidence_factor = np.where(
+        df['is_studio'].to_numpy() == 1, 1.2, np.where(df['beds'].to_numpy() >= 3, 1.3, 1.0)
+    )
+    metadata = get_model_metadata()
+    margin = metadata['rmse'] * confidence_factor
+    confidence_range = np.column_stack([
+        np.maximum(0, predicted_rent - margin),
+        predicted_rent + margin,
+    ])
+    prediction_quality = np.where(confidence_factor == 1.0, 'high', 'medium')
+
+    logging.info(f"Batch prediction: {int(valid.sum())}/{n} properties scored")
+    metrics.observe('predict.batch_size', n)
+    metrics.incr('predict.rows_scored', int(valid.sum()))
+    metrics.incr('predict.rows_unscorable', n - int(valid.sum()))
+    return {
+        'predicted_rent': predicted_rent,
+        'confidence_range': confidence_range,
+        'prediction_quality': prediction_quality,
+        'success': valid,
+        'model_version': metadata['version'],
+    }
+
+def batch_result_at(batch_result, i):
+    """Return row i of a batch result in the same shape as predict_rental_price"""
+    if batch_result is None or not batch_result['success'][i]:
+        return None
+    low, high = batch_result['confidence_range'][i]
+    return {
+        'predicted_rent': int(batch_result['predicted_rent'][i]),
+        'confidence_range': (float(low) if low > 0 else 0, float(high)),
+        'model_version': batch_result['model_version'],
+        'prediction_quality': str(batch_result['prediction_quality'][i]),
+    }
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def feature_hashes(X):
+    """16-byte digest of each row's feature vector (float64, in the model's feature order)"""
+    values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in values]
+
+
+class PredictionCache:
+    """Raw model outputs keyed by (model key, feature hash).
+
+    An in-process LRU of `max_entries` sits in front of an optional SQLite
+    table at `path`, which survives across warm invocations and restarts that
+    keep the file. Entries only ever belong to one model: the first lookup
+    with a different model key drops everything cached for the previous one.
+    """
+
+    def __init__(self, max_entries=50000, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._model_key = None
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                ' model_key TEXT NOT NULL, feature_hash BLOB NOT NULL, value REAL NOT NULL,'
+                ' created_at REAL NOT NULL, PRIMARY KEY (model_key, feature_hash))'
+            )
+            self._conn.commit()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _use_model(self, model_key):
+        if model_key == self._model_key:
+            return
+        dropped = len(self._entries)
+        self._entries.clear()
+        if self._conn is not None:
+            dropped += self._conn.execute('DELETE FROM predictions WHERE model_key != ?', (model_key,)).rowcount
+            self._conn.commit()
+        if self._model_key is not None or dropped:
+            self.stats['invalidations'] += 1
+            logging.info(f"Prediction cache: model is now {model_key}, dropped {dropped} entries for older models")
+        self._model_key = model_key
+
+    def get_many(self, model_key, hashes):
+        """{feature hash: cached value} for the hashes that are cached"""
+        found = {}
+        with self._lock:
+            self._use_model(model_key)
+            missing = []
+            for h in dict.fromkeys(hashes):
+                value = self._entries.get(h)
+                if value is None:
+                    missing.append(h)
+                else:
+                    self._entries.move_to_end(h)
+                    found[h] = value
+
+            if missing and self._conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._conn.execute(
+                        'SELECT feature_hash, value FROM predictions WHERE model_key = ?'
+                        f' AND feature_hash IN ({",".join("?" * len(chunk))})',
+                        [model_key] + chunk,
+                    ).fetchall()
+                    for h, value in rows:
+                        found[h] = value
+                        self._remember(h, value)
+                        self.stats['disk_hits'] += 1
+
+            hits = sum(1 for h in hashes if h in found)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(hashes) - hits
+        return found
+
+    def put_many(self, model_key, values):
+        """Store {feature hash: value} computed by the model identified by model_key"""
+        with self._lock:
+            self._use_model(model_key)
+            for h, value in values.items():
+                self._remember(h, value)
+            if self._conn is not None:
+                now = time.time()
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO predictions (model_key, feature_hash, value, created_at) VALUES (?, ?, ?, ?)',
+                    [(model_key, h, float(value), now) for h, value in values.items()],
+                )
+                self._conn.commit()
+            self.stats['stores'] += len(values)
+
+    def _remember(self, h, value):
+        self._entries[h] = float(value)
+        self._entries.move_to_end(h)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_rate=round(self.stats['hits'] / lookups, 4) if lookups else None,
+                model_key=self._model_key,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM predictions')
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
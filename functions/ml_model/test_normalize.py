@@ -0,0 +1,83 @@
+# test_normalize.py
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# normalize.py is imported as ml_model.normalize from functions/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_model.normalize import TOKEN_TABLE, cache_info, extract_first_number, normalize_counts
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'current_properties.json')
+
+
+def reference_extract_first_number(value):
+    """The original per-value parser from predict.py, kept as the source of truth"""
+    if pd.isna(value) or value == "N/A":
+        return 1
+
+    value = str(value).lower()
+
+    if "studio" in value:
+        return 0
+
+    if "-" in value:
+        first_part = value.split("-")[0].strip()
+        if "studio" in first_part:
+            return 0
+        try:
+            return float(first_part)
+        except:
+            return 1
+
+    if "+" in value:
+        base = value.replace("+", "").strip()
+        if "studio" in base:
+            return 0
+        try:
+            return float(base)
+        except:
+            return 1
+
+    try:
+        return float(value)
+    except:
+        return 1
+
+
+def distinct_values():
+    """Every distinct beds/baths value in current_properties.json, plus awkward extras"""
+    with open(FIXTURE) as f:
+        records = json.load(f)
+    values = {record.get(field) for record in records for field in ('beds', 'baths')}
+    values.update([None, float('nan'), 2, 2.5, np.float64(3.0), 'STUDIO', ' 2 ', '1 -', '+', 'abc', '', '3 Beds'])
+    return list(values) + list(TOKEN_TABLE)
+
+
+def same(a, b):
+    return type(a) is type(b) and (a == b or (math.isnan(a) and math.isnan(b)))
+
+
+def test_scalar_matches_reference():
+    for value in distinct_values():
+        expected = reference_extract_first_number(value)
+        assert same(extract_first_number(value), expected), (value, extract_first_number(value), expected)
+        # Second call is served from the table or the LRU and must agree too
+        assert same(extract_first_number(value), expected), value
+
+
+def test_vectorized_matches_reference():
+    values = distinct_values() * 3
+    expected = np.array([reference_extract_first_number(v) for v in values], dtype=float)
+    np.testing.assert_array_equal(normalize_counts(values), expected)
+    np.testing.assert_array_equal(normalize_counts(pd.Series(values)), expected)
+    np.testing.assert_array_equal(normalize_counts(np.array(values, dtype=object)), expected)
+
+
+if __name__ == '__main__':
+    test_scalar_matches_reference()
+    test_vectorized_matches_reference()
+    print(f"{len(distinct_values())} distinct values match the reference parser; parser cache {cache_info()}")
@@ -1,5 +1,10 @@
 # test_predict.py
 import logging
+import os
+import sys
+
+# predict.py imports shared modules from functions/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from predict import predict_rental_price
 
 # Set up logging
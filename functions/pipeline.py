@@ -0,0 +1,162 @@
+"""A small staged streaming pipeline: worker threads connected by bounded queues.
+
+Each Stage takes items from its input queue and passes its results to the
+next stage, so a listing can be written while later ones are still being
+fetched. Because the queues are bounded, a slow stage makes the stages before
+it wait (backpressure) rather than piling up work in memory. A run then takes
+about as long as its slowest stage, not the sum of all of them.
+
+With a deadline, the pipeline drains instead of stopping mid-item. Items not
+yet started by a stop_at_deadline stage are skipped, and everything already
+past that stage still goes through the rest of the pipeline.
+"""
+import logging
+import queue
+import threading
+import time
+
+import metrics
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline step.
+
+    Without batch_size, handler(item) returns the item for the next stage, or
+    None to drop it. With batch_size, handler(items) gets up to batch_size
+    items (fewer if max_wait seconds pass first) and returns a list.
+    """
+
+    def __init__(self, name, handler, workers=1, batch_size=None, max_wait=0.05, stop_at_deadline=False):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.stop_at_deadline = stop_at_deadline
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=64, deadline=None, clock=time.monotonic):
+        """deadline is a clock() value after which the pipeline drains"""
+        self.stages = stages
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.stats = {
+            stage.name: {'in': 0, 'out': 0, 'skipped': 0, 'errors': 0, 'busy_seconds': 0.0,
+                         'batches': 0, 'workers': stage.workers}
+            for stage in stages
+        }
+        self.timed_out = False
+
+    def _past_deadline(self):
+        if self.deadline is not None and self._clock() >= self.deadline:
+            if not self.timed_out:
+                self.timed_out = True
+                logging.warning("Pipeline deadline reached, draining in-flight items")
+                metrics.incr('pipeline.timeouts')
+            return True
+        return False
+
+    def _count(self, stage, **changes):
+        with self._lock:
+            stats = self.stats[stage.name]
+            for key, value in changes.items():
+                stats[key] += value
+
+    def _next_batch(self, stage, inbox):
+        """Up to batch_size items, waiting at most max_wait after the first; (items, saw_done)"""
+        first = inbox.get()
+        if first is _DONE:
+            return [], True
+        items = [first]
+        size = stage.batch_size or 1
+        until = time.monotonic() + stage.max_wait
+        while len(items) < size:
+            remaining = until - time.monotonic()
+            try:
+                item = inbox.get(timeout=remaining) if remaining > 0 else inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _work(self, stage, inbox, outbox, results, finished):
+        while True:
+            items, done = self._next_batch(stage, inbox)
+            if items:
+                self._count(stage, **{'in': len(items)})
+                if stage.stop_at_deadline and self._past_deadline():
+                    self._count(stage, skipped=len(items))
+                    items = []
+            if items:
+                start = time.perf_counter()
+                try:
+                    if stage.batch_size:
+                        outputs = stage.handler(items) or []
+                    else:
+                        outputs = [stage.handler(items[0])]
+                except Exception as e:
+                    logging.error(f"Pipeline stage {stage.name} failed on {len(items)} items: {e}")
+                    self._count(stage, errors=len(items))
+                    outputs = []
+                elapsed = time.perf_counter() - start
+                outputs = [output for output in outputs if output is not None]
+                self._count(stage, out=len(outputs), busy_seconds=elapsed, batches=1)
+                for output in outputs:
+                    if outbox is None:
+                        results.append(output)
+                    else:
+                        outbox.put(output)
+            if done:
+                # Let this stage's other workers see the end too; the last one out tells the next stage
+                inbox.put(_DONE)
+                with self._lock:
+                    finished[stage.name] += 1
+                    last = finished[stage.name] == stage.workers
+                if last and outbox is not None:
+                    outbox.put(_DONE)
+                return
+
+    def run(self, items):
+        """Feed items through every stage; returns the last stage's outputs"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        finished = {stage.name: 0 for stage in self.stages}
+        threads = []
+        for index, stage in enumerate(self.stages):
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage, queues[index], outbox, results, finished),
+                                          name=f"pipeline-{stage.name}-{worker}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            if self._past_deadline():
+                self._count(first, **{'in': 1, 'skipped': 1})
+                continue
+            # Blocks while the first stage is behind
+            queues[0].put(item)
+        queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+        for name, stats in self.stats.items():
+            stats['busy_seconds'] = round(stats['busy_seconds'], 4)
+        return results
+
+    @property
+    def skipped(self):
+        return sum(stats['skipped'] for stats in self.stats.values())
+
+    @property
+    def errors(self):
+        """Items dropped because a stage handler raised on them"""
+        return sum(stats['errors'] for stats in self.stats.values())
@@ -0,0 +1,150 @@
+"""Coalescing concurrent prediction requests into one vectorized model call.
+
+Every model.predict call has a fixed cost (building the feature frame,
+LightGBM's own setup) that dwarfs the per-row work, so scoring requests one
+at a time wastes most of it. Callers hand their properties to submit() and
+wait. One worker thread takes the first waiting request plus whatever else
+arrives within `window` seconds, up to max_batch rows. It scores them all
+with a single predict_rental_prices_batch call, then gives each caller back
+its own rows. An idle instance adds at most `window` to a request. A busy
+one (a 2nd gen function serving several requests at once) shares the call.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import metrics
+
+DEFAULT_WINDOW = 0.005
+DEFAULT_MAX_BATCH = 256
+# Recent batches kept for stats()
+STATS_HISTORY = 1000
+
+
+def predict_rows(properties):
+    """predict_rental_price's result (or None) for each property dict, from one batch call"""
+    from ml_model.predict import predict_rental_prices_batch, batch_result_at
+
+    batch_result = predict_rental_prices_batch(properties)
+    return [batch_result_at(batch_result, i) for i in range(len(properties))]
+
+
+class MicroBatcher:
+    def __init__(self, predict=predict_rows, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH):
+        """predict maps a list of property dicts to one result per property"""
+        self.predict = predict
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._batches = deque(maxlen=STATS_HISTORY)
+        # errors counts failed requests
+        self.totals = {'requests': 0, 'rows': 0, 'batches': 0, 'errors': 0}
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                    self._worker.start()
+
+    def submit(self, properties, timeout=None):
+        """Results for `properties` (one per property, None where it can't be scored) and its batch's info.
+
+        Blocks until the batch holding this request has been scored. If the
+        batch call fails, each request is retried alone and only the ones
+        that still fail raise.
+        """
+        properties = list(properties)
+        if not properties:
+            return [], {'requests': 0, 'rows': 0, 'queued_ms': 0.0, 'predict_ms': 0.0}
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((properties, future, time.perf_counter()))
+        return future.result(timeout=timeout)
+
+    def _next_batch(self):
+        """The first waiting request plus those arriving within the window, up to max_batch rows"""
+        first = self._queue.get()
+        requests = [first]
+        rows = len(first[0])
+        until = time.monotonic() + self.window
+        while rows < self.max_batch:
+            remaining = until - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            requests.append(request)
+            rows += len(request[0])
+        return requests, rows
+
+    def _predict_each(self, requests):
+        """Score each request of a failed batch on its own, so only the bad ones fail; (results, error) per request"""
+        outcomes = []
+        for request_properties, _, _ in requests:
+            try:
+                outcomes.append((self.predict(request_properties), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def _run(self):
+        while True:
+            requests, rows = self._next_batch()
+            started = time.perf_counter()
+            properties = [p for request_properties, _, _ in requests for p in request_properties]
+            try:
+                results = self.predict(properties)
+                outcomes, offset = [], 0
+                for request_properties, _, _ in requests:
+                    outcomes.append((results[offset:offset + len(request_properties)], None))
+                    offset += len(request_properties)
+            except Exception as e:
+                logging.error(f"Batched prediction of {rows} properties failed, scoring its {len(requests)} "
+                              f"requests one by one: {e}")
+                outcomes = self._predict_each(requests)
+            predict_ms = (time.perf_counter() - started) * 1000
+            errors = sum(1 for _, error in outcomes if error is not None)
+
+            with self._lock:
+                self.totals['requests'] += len(requests)
+                self.totals['rows'] += rows
+                self.totals['batches'] += 1
+                self.totals['errors'] += errors
+                self._batches.append((len(requests), rows, predict_ms))
+            metrics.incr('predict_api.batches')
+            metrics.incr('predict_api.rows', rows)
+
+            for (_, future, queued_at), (results, error) in zip(requests, outcomes):
+                if error is not None:
+                    future.set_exception(error)
+                    continue
+                future.set_result((results, {
+                    'requests': len(requests),
+                    'rows': rows,
+                    'queued_ms': round((started - queued_at) * 1000, 3),
+                    'predict_ms': round(predict_ms, 3),
+                }))
+
+    def stats(self):
+        """Totals plus request/row counts per batch and predict time over the recent batches"""
+        with self._lock:
+            batches = list(self._batches)
+            totals = dict(self.totals)
+        summary = {
+            **totals,
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+        }
+        if batches:
+            summary['recent'] = {
+                'requests_per_batch': metrics.summarize([b[0] for b in batches]),
+                'rows_per_batch': metrics.summarize([b[1] for b in batches]),
+                'predict_ms': metrics.summarize([b[2] for b in batches]),
+            }
+        return summary
@@ -0,0 +1,238 @@
+"""Filtered, cursor-paginated reads of the properties collection.
+
+Listings store beds and rent as display strings ('2', '$2,495/mo'), which
+Firestore can't range-filter, so ingest also writes the typed QUERY_FIELDS
+below. Queries combine equality filters on zip_code and beds_count with at
+most one range filter (rent, delta or list date). Results are sorted on that
+range field, or on the requested sort field, with the document id as a
+tie-breaker. Every combination has a composite index in
+firestore.indexes.json.
+
+Cursors are opaque: base64 JSON of the last row's sort value and id.
+"""
+import base64
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Typed copies of display fields, written alongside them for querying
+QUERY_FIELDS = ('rent_amount', 'beds_count', 'rent_delta')
+SORT_FIELDS = ('list_date', 'rent_amount', 'rent_delta')
+# Query parameter pairs -> the field they bound
+RANGE_PARAMS = {
+    'rent_amount': ('min_rent', 'max_rent'),
+    'rent_delta': ('min_delta', 'max_delta'),
+    'list_date': ('listed_after', 'listed_before'),
+}
+DEFAULT_SORT = '-list_date'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Firestore allows at most 30 values in an 'in' filter
+MAX_ZIP_CODES = 30
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class QueryError(ValueError):
+    """A request the API can't serve; reported to the caller as a 400"""
+
+
+def query_fields(property_data):
+    """QUERY_FIELDS for a listing; None where the display value is missing"""
+    from aggregates import parse_rent
+    from ml_model.normalize import extract_first_number
+
+    rent = parse_rent(property_data.get('rent'))
+    if rent is None:
+        rent = parse_rent(property_data.get('list_price'))
+    beds = property_data.get('beds')
+    beds_count = None
+    if beds is not None and beds != 'N/A' and not (isinstance(beds, float) and math.isnan(beds)):
+        beds_count = int(extract_first_number(beds))
+    predicted = property_data.get('predicted_rent') if property_data.get('prediction_success') else None
+    return {
+        'rent_amount': rent,
+        'beds_count': beds_count,
+        'rent_delta': round(rent - predicted, 2) if rent is not None and predicted is not None else None,
+    }
+
+
+def _number(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+    if not math.isfinite(number):
+        raise QueryError(f"{name} must be a number")
+    return number
+
+
+def _integer(params, name):
+    number = _number(params, name)
+    if number is not None and not number.is_integer():
+        raise QueryError(f"{name} must be a whole number")
+    return None if number is None else int(number)
+
+
+def _date(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an ISO date (YYYY-MM-DD)")
+
+
+def encode_cursor(value, doc_id):
+    if isinstance(value, datetime):
+        value = {'datetime': value.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([value, doc_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['datetime'])
+    except Exception:
+        raise QueryError("invalid cursor")
+    return value, doc_id
+
+
+class PropertyQuery:
+    """A validated query, parsed from request parameters"""
+
+    def __init__(self, zip_codes=(), beds=None, ranges=None, sort=DEFAULT_SORT, fields=None,
+                 limit=DEFAULT_LIMIT, cursor=None):
+        self.zip_codes = list(zip_codes)
+        self.beds = beds
+        self.ranges = ranges or {}
+        self.sort_field = sort.lstrip('-')
+        self.descending = sort.startswith('-')
+        self.fields = fields
+        self.limit = limit
+        self.cursor = cursor
+
+        if self.sort_field not in SORT_FIELDS:
+            raise QueryError(f"sort must be one of {', '.join(SORT_FIELDS)} (prefix '-' for descending)")
+        if len(self.ranges) > 1:
+            raise QueryError(f"only one range filter per query; got {', '.join(sorted(self.ranges))}")
+        if self.ranges:
+            (range_field,) = self.ranges
+            # Firestore needs the first sort to be on the range-filtered field
+            if self.sort_field != range_field:
+                raise QueryError(f"a {range_field} range filter needs sort={range_field} or -{range_field}")
+        if len(self.zip_codes) > MAX_ZIP_CODES:
+            raise QueryError(f"at most {MAX_ZIP_CODES} zip codes per query")
+
+    @classmethod
+    def from_params(cls, params):
+        """Build a query from URL parameters (a dict or werkzeug MultiDict)"""
+        zip_codes = [z.strip() for z in (params.get('zip_code') or '').split(',') if z.strip()]
+        beds = _integer(params, 'beds')
+        ranges = {}
+        for field, (low_name, high_name) in RANGE_PARAMS.items():
+            parse = _date if field == 'list_date' else _number
+            low, high = parse(params, low_name), parse(params, high_name)
+            if low is not None or high is not None:
+                ranges[field] = (low, high)
+
+        fields = None
+        if params.get('fields'):
+            fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+            invalid = [f for f in fields if not FIELD_NAME.match(f)]
+            if invalid:
+                raise QueryError(f"invalid field names: {', '.join(invalid)}")
+
+        limit = _integer(params, 'limit')
+        limit = DEFAULT_LIMIT if limit is None else limit
+        if not 1 <= limit <= MAX_LIMIT:
+            raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+
+        range_field = next(iter(ranges), None)
+        sort = params.get('sort') or (range_field if range_field else DEFAULT_SORT)
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        return cls(zip_codes, beds, ranges, sort, fields, limit, cursor)
+
+    def cache_key(self):
+        return json.dumps([self.zip_codes, self.beds, sorted(self.ranges.items()), self.sort_field,
+                           self.descending, self.fields, self.limit, self.cursor], default=str)
+
+    def build(self, collection):
+        """The Firestore query for one page (one row extra, to tell whether there's a next page)"""
+        query = collection
+        if len(self.zip_codes) == 1:
+            query = query.where('zip_code', '==', self.zip_codes[0])
+        elif self.zip_codes:
+            query = query.where('zip_code', 'in', self.zip_codes)
+        if self.beds is not None:
+            query = query.where('beds_count', '==', self.beds)
+        for field, (low, high) in self.ranges.items():
+            if low is not None:
+                query = query.where(field, '>=', low)
+            if high is not None:
+                query = query.where(field, '<=', high)
+
+        direction = 'DESCENDING' if self.descending else 'ASCENDING'
+        query = query.order_by(self.sort_field, direction=direction).order_by('__name__', direction=direction)
+        if self.fields is not None:
+            # The sort field is needed for the next page's cursor
+            query = query.select(list(dict.fromkeys(self.fields + [self.sort_field])))
+        if self.cursor is not None:
+            value, doc_id = self.cursor
+            query = query.start_after({self.sort_field: value, '__name__': doc_id})
+        return query.limit(self.limit + 1)
+
+    def run(self, collection):
+        """{'properties': [...], 'next_cursor': str or None}"""
+        snapshots = list(self.build(collection).stream())
+        page = snapshots[:self.limit]
+        properties = []
+        for snapshot in page:
+            data = snapshot.to_dict() or {}
+            if self.fields is not None:
+                data = {f: data[f] for f in self.fields if f in data}
+            properties.append({'id': snapshot.id, **data})
+        next_cursor = None
+        if len(snapshots) > self.limit:
+            last = page[-1]
+            next_cursor = encode_cursor(last.get(self.sort_field), last.id)
+        return {'properties': properties, 'count': len(properties), 'next_cursor': next_cursor}
+
+
+class TTLCache:
+    """Small in-memory LRU whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl=30.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
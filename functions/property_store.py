@@ -0,0 +1,158 @@
+import logging
+import random
+import time
+
+import metrics
+
+# Firestore rejects write batches with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+
+class WriteReport:
+    """Outcome of a flush: how many documents were written and which ones failed"""
+
+    def __init__(self):
+        self.written = 0
+        self.commits = 0
+        self.retries = 0
+        self.errors = {}
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def as_dict(self):
+        return {
+            'written': self.written,
+            'failed': self.failed,
+            'commits': self.commits,
+            'retries': self.retries,
+        }
+
+    def __repr__(self):
+        return f"WriteReport({self.as_dict()})"
+
+
+class PropertyStore:
+    """Bulk reads and batched writes for the properties collection.
+
+    Reads go through chunked get_all calls instead of one document().get() per
+    listing, and writes are queued and committed in batches of up to
+    batch_size operations with retry and exponential backoff. If a batch still
+    fails after its retries, its documents are written one at a time so the
+    report can say exactly which ones failed.
+    """
+
+    def __init__(self, db, collection='properties', batch_size=MAX_BATCH_SIZE,
+                 read_chunk_size=300, max_retries=3, backoff=1.0):
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}, got {batch_size}")
+        self.db = db
+        self.collection = collection
+        self.batch_size = batch_size
+        self.read_chunk_size = read_chunk_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._pending = []
+        self._retries = 0
+        self._sleep = time.sleep
+
+    def _ref(self, doc_id):
+        return self.db.collection(self.collection).document(doc_id)
+
+    def prefetch(self, doc_ids):
+        """Fetch existing documents for doc_ids.
+
+        Returns a dict of doc_id -> document data for the ids that exist; ids
+        that don't exist are left out.
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        existing = {}
+        for start in range(0, len(doc_ids), self.read_chunk_size):
+            chunk = doc_ids[start:start + self.read_chunk_size]
+            refs = [self._ref(doc_id) for doc_id in chunk]
+            with metrics.span('firestore.get_all'):
+                snapshots = self._with_retries(lambda: list(self.db.get_all(refs)), f"get_all of {len(refs)} documents")
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    existing[snapshot.id] = snapshot.to_dict()
+        logging.info(f"Prefetched {len(doc_ids)} property ids, {len(existing)} already stored")
+        return existing
+
+    def list_ids(self):
+        """Ids of every document in the collection, fetched without their fields"""
+        query = self.db.collection(self.collection).select(['__name__'])
+        return {snapshot.id for snapshot in self._with_retries(lambda: list(query.stream()), "listing document ids")}
+
+    def set(self, doc_id, data):
+        """Queue a full document write; it is committed on the next flush"""
+        self._pending.append(('set', doc_id, data))
+
+    def update(self, doc_id, fields):
+        """Queue a merge of fields into an existing document; it is committed on the next flush"""
+        self._pending.append(('merge', doc_id, fields))
+
+    def delete(self, doc_id):
+        """Queue a document delete; it is committed on the next flush"""
+        self._pending.append(('delete', doc_id, None))
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Commit all queued writes and return a WriteReport"""
+        report = WriteReport()
+        retries_before = self._retries
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.batch_size):
+            self._commit_chunk(pending[start:start + self.batch_size], report)
+        report.retries = self._retries - retries_before
+        logging.info(f"Flushed {len(pending)} property writes: {report}")
+        for doc_id, error in report.errors.items():
+            logging.error(f"Failed to store property {doc_id} in database: {error}")
+        return report
+
+    def _commit_chunk(self, chunk, report):
+        def commit():
+            batch = self.db.batch()
+            for op, doc_id, data in chunk:
+                if op == 'delete':
+                    batch.delete(self._ref(doc_id))
+                else:
+                    batch.set(self._ref(doc_id), data, merge=(op == 'merge'))
+            batch.commit()
+
+        try:
+            with metrics.span('firestore.commit'):
+                self._with_retries(commit, f"batch of {len(chunk)} writes")
+            report.commits += 1
+            report.written += len(chunk)
+            return
+        except Exception as e:
+            logging.warning(f"Batch commit failed after retries, writing {len(chunk)} documents individually: {e}")
+
+        for op, doc_id, data in chunk:
+            try:
+                if op == 'delete':
+                    self._ref(doc_id).delete()
+                else:
+                    self._ref(doc_id).set(data, merge=(op == 'merge'))
+                report.commits += 1
+                report.written += 1
+            except Exception as e:
+                report.errors[doc_id] = e
+
+    def _with_retries(self, operation, description):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                return operation()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                self._retries += 1
+                metrics.incr('firestore.retries')
+                logging.warning(f"Attempt {attempt + 1} for {description} failed: {e}")
+                # Jitter so parallel instances don't retry in lockstep
+                self._sleep(delay * (1 + random.random() * 0.5))
+                delay *= 2
@@ -0,0 +1,180 @@
+"""Append-only history of listing values, one compact snapshot per run.
+
+ingest overwrites each properties document, so the history keeps what
+changed. Each run appends, per (date, zip code), a document in
+`rent_history` that stores its rows column by column:
+
+    date, zip_code, recorded_at, rows, fields
+    listing_id: [...], event: ['new' | 'changed' | 'removed', ...]
+    changed:    [bitmask of HISTORY_FIELDS that changed in that row, ...]
+    <field>:    [value, or None where it didn't change, ...]   (only for fields that changed in some row)
+
+Documents are never updated, and only date and zip_code are indexed (the
+column arrays are exempt in firestore.indexes.json). A time-range or per-ZIP
+query reads only the partitions for those dates and zips, and projects only
+the columns it asks for. Rows for one listing in date order rebuild its
+history: the latest value of each field is the most recent row whose
+`changed` bit is set.
+"""
+import logging
+import math
+import uuid
+from datetime import date, datetime
+
+import metrics
+
+HISTORY_COLLECTION = 'rent_history'
+HISTORY_FIELDS = (
+    'rent_amount', 'predicted_rent', 'rent_delta', 'days_on_mls',
+    'status', 'beds_count', 'list_price', 'model_version',
+)
+BASE_COLUMNS = ('date', 'zip_code', 'recorded_at', 'listing_id', 'event', 'changed')
+# Keeps each partition document far below Firestore's 1 MiB limit
+MAX_ROWS_PER_DOCUMENT = 2000
+
+
+def _value(value):
+    """Firestore-storable form of a field value; NaN and numpy scalars included"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def changed_fields(old, new):
+    """{field: new value} for the HISTORY_FIELDS that differ between two versions of a listing"""
+    old = old or {}
+    changes = {}
+    for field in HISTORY_FIELDS:
+        value = _value(new.get(field))
+        if value != _value(old.get(field)):
+            changes[field] = value
+    return changes
+
+
+def _date_key(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+class HistoryBatch:
+    """The history rows one run produced, grouped into (date, zip code) partitions"""
+
+    def __init__(self, recorded_at=None):
+        self.recorded_at = recorded_at or datetime.now()
+        self.date = _date_key(self.recorded_at)
+        self.partitions = {}
+
+    def _append(self, listing_id, zip_code, event, changes):
+        partition = self.partitions.setdefault(str(zip_code or 'unknown'), [])
+        partition.append((listing_id, event, changes))
+
+    def record(self, listing_id, old, new):
+        """A listing version was written; old is the version it replaced, or None if it's new"""
+        changes = changed_fields(old, new)
+        if old is not None and not changes:
+            return
+        self._append(listing_id, new.get('zip_code'), 'changed' if old is not None else 'new', changes)
+
+    def record_removed(self, listing_id, old):
+        self._append(listing_id, old.get('zip_code'), 'removed', {})
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.partitions.values())
+
+    def documents(self):
+        """(document id, data) for every partition document of this run"""
+        run = f"{self.recorded_at.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        for zip_code, rows in sorted(self.partitions.items()):
+            for part, start in enumerate(range(0, len(rows), MAX_ROWS_PER_DOCUMENT)):
+                chunk = rows[start:start + MAX_ROWS_PER_DOCUMENT]
+                fields = [f for f in HISTORY_FIELDS if any(f in changes for _, _, changes in chunk)]
+                data = {
+                    'date': self.date,
+                    'zip_code': zip_code,
+                    'recorded_at': self.recorded_at,
+                    'rows': len(chunk),
+                    'fields': fields,
+                    'listing_id': [listing_id for listing_id, _, _ in chunk],
+                    'event': [event for _, event, _ in chunk],
+                    'changed': [sum(1 << i for i, f in enumerate(HISTORY_FIELDS) if f in changes)
+                                for _, _, changes in chunk],
+                }
+                for field in fields:
+                    data[field] = [changes.get(field) for _, _, changes in chunk]
+                yield f"{self.date}_{zip_code}_{run}_{part}", data
+
+
+class HistoryStore:
+    """Appends HistoryBatches to the rent_history collection and reads them back by date and zip"""
+
+    def __init__(self, db, collection=HISTORY_COLLECTION):
+        self.db = db
+        self.collection = collection
+
+    def append(self, batch):
+        """Write a run's partitions; returns the number of documents written"""
+        if not len(batch):
+            return 0
+        collection = self.db.collection(self.collection)
+        write_batch, queued, written = self.db.batch(), 0, 0
+        for doc_id, data in batch.documents():
+            write_batch.set(collection.document(doc_id), data)
+            queued += 1
+            if queued == 100:
+                write_batch.commit()
+                written += queued
+                write_batch, queued = self.db.batch(), 0
+        if queued:
+            write_batch.commit()
+            written += queued
+        metrics.incr('history.rows', len(batch))
+        metrics.incr('history.documents', written)
+        logging.info(f"Recorded {len(batch)} history rows in {written} partition documents")
+        return written
+
+    def partitions(self, start, end, zip_codes=None, fields=None):
+        """Partition documents with start <= date <= end (dates or 'YYYY-MM-DD'), projected to `fields`"""
+        query = self.db.collection(self.collection)
+        if zip_codes:
+            zip_codes = [str(z) for z in zip_codes]
+            query = query.where('zip_code', '==', zip_codes[0]) if len(zip_codes) == 1 else query.where('zip_code', 'in', zip_codes)
+        query = query.where('date', '>=', _date_key(start)).where('date', '<=', _date_key(end))
+        if fields is not None:
+            unknown = set(fields) - set(HISTORY_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown history fields: {', '.join(sorted(unknown))}")
+            query = query.select(list(BASE_COLUMNS) + list(fields))
+        return query.stream()
+
+    def rows(self, start, end, zip_codes=None, fields=None):
+        """History rows as dicts, holding only the fields that changed in each row"""
+        wanted = list(fields) if fields is not None else list(HISTORY_FIELDS)
+        for snapshot in self.partitions(start, end, zip_codes, fields):
+            data = snapshot.to_dict()
+            columns = [f for f in wanted if f in data]
+            for i, listing_id in enumerate(data.get('listing_id', [])):
+                row = {'date': data['date'], 'zip_code': data['zip_code'], 'recorded_at': data.get('recorded_at'),
+                       'listing_id': listing_id, 'event': data['event'][i]}
+                mask = data['changed'][i]
+                for field in columns:
+                    if mask & (1 << HISTORY_FIELDS.index(field)):
+                        row[field] = data[field][i]
+                yield row
+
+    def trend(self, start, end, zip_codes=None, field='rent_amount'):
+        """Per-day, per-zip count and mean of `field` over the listings recorded with a new value for it"""
+        sums = {}
+        for row in self.rows(start, end, zip_codes, [field]):
+            value = row.get(field)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            key = (row['date'], row['zip_code'])
+            count, total = sums.get(key, (0, 0.0))
+            sums[key] = (count + 1, total + value)
+        return [
+            {'date': day, 'zip_code': zip_code, 'count': count, 'mean': round(total / count, 2)}
+            for (day, zip_code), (count, total) in sorted(sums.items())
+        ]
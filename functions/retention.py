@@ -0,0 +1,157 @@
+"""Deleting listings past the retention window, a page at a time.
+
+The sweeper pages through expired listings (list_date at or before the
+cutoff) with limit and a cursor, so memory holds at most one page plus the
+chunks being deleted. Each page is optionally archived first, as one
+gzipped JSON-lines part per page in a local directory or a gs:// prefix.
+The page is then deleted in chunks, committed in parallel through
+PropertyStore, which brings batching, retries and per-document fallback.
+dry_run only counts.
+"""
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import metrics
+from property_store import MAX_BATCH_SIZE, PropertyStore
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class Archive:
+    """Writes pages of expired documents as gzipped JSON-lines parts under a directory or gs:// prefix"""
+
+    def __init__(self, location, run_id=None):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.location = location.rstrip('/')
+        self.parts = 0
+        self.bytes = 0
+        self._bucket = None
+        if self.location.startswith('gs://'):
+            from google.cloud import storage
+
+            bucket, _, self.prefix = self.location[len('gs://'):].partition('/')
+            self._bucket = storage.Client().bucket(bucket)
+        else:
+            os.makedirs(os.path.join(self.location, self.run_id), exist_ok=True)
+
+    def write(self, snapshots):
+        """Store one page; returns only once the part is durable, so deleting afterwards is safe"""
+        lines = ''.join(
+            json.dumps({'id': snapshot.id, 'data': snapshot.to_dict()}, default=_json_default) + '\n'
+            for snapshot in snapshots
+        )
+        body = gzip.compress(lines.encode(), compresslevel=6)
+        name = f"{self.run_id}/part-{self.parts:05d}.jsonl.gz"
+        if self._bucket is not None:
+            blob_name = f"{self.prefix}/{name}" if self.prefix else name
+            self._bucket.blob(blob_name).upload_from_string(body, content_type='application/gzip')
+        else:
+            path = os.path.join(self.location, name)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        self.parts += 1
+        self.bytes += len(body)
+
+
+class RetentionSweeper:
+    def __init__(self, db, collection='properties', date_field='list_date', max_age=timedelta(days=365),
+                 page_size=MAX_BATCH_SIZE, chunk_size=100, workers=4, archive=None):
+        self.db = db
+        self.collection = collection
+        self.date_field = date_field
+        self.max_age = max_age
+        self.page_size = page_size
+        self.chunk_size = min(chunk_size, MAX_BATCH_SIZE)
+        self.workers = max(1, workers)
+        self.archive = archive
+
+    def _pages(self, cutoff, fields=None):
+        query = (self.db.collection(self.collection)
+                 .where(self.date_field, '<=', cutoff)
+                 .order_by(self.date_field))
+        if fields is not None:
+            query = query.select(fields)
+        cursor = None
+        while True:
+            page_query = query.limit(self.page_size)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            with metrics.span('retention.read'):
+                page = list(page_query.stream())
+            if not page:
+                return
+            yield page
+            if len(page) < self.page_size:
+                return
+            cursor = page[-1]
+
+    def _delete_chunk(self, snapshots):
+        store = PropertyStore(self.db, collection=self.collection, batch_size=len(snapshots))
+        for snapshot in snapshots:
+            store.delete(snapshot.id)
+        return snapshots, store.flush()
+
+    def sweep(self, now=None, dry_run=False, on_deleted=None):
+        """Delete (or with dry_run, count) expired documents.
+
+        on_deleted(doc_id, data) is called, from this thread, for every
+        document once its delete is committed. Returns a report dict.
+        """
+        cutoff = (now or datetime.now()) - self.max_age
+        report = {'cutoff': cutoff, 'dry_run': dry_run, 'matched': 0, 'deleted': 0, 'failed': 0, 'pages': 0}
+        start = time.perf_counter()
+
+        if dry_run:
+            for page in self._pages(cutoff, fields=[self.date_field]):
+                report['pages'] += 1
+                report['matched'] += len(page)
+            report['seconds'] = round(time.perf_counter() - start, 3)
+            logging.info(f"Retention dry run: {report['matched']} listings older than {cutoff:%Y-%m-%d}")
+            return report
+
+        def collect(futures):
+            for future in futures:
+                snapshots, write_report = future.result()
+                report['deleted'] += write_report.written
+                report['failed'] += write_report.failed
+                for snapshot in snapshots:
+                    if snapshot.id not in write_report.errors and on_deleted is not None:
+                        on_deleted(snapshot.id, snapshot.to_dict())
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page in self._pages(cutoff):
+                report['pages'] += 1
+                report['matched'] += len(page)
+                if self.archive is not None:
+                    with metrics.span('retention.archive'):
+                        self.archive.write(page)
+                for offset in range(0, len(page), self.chunk_size):
+                    # Bound memory: at most `workers` chunks waiting on a commit
+                    while len(in_flight) >= self.workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight.add(executor.submit(self._delete_chunk, page[offset:offset + self.chunk_size]))
+            collect(in_flight)
+
+        elapsed = time.perf_counter() - start
+        report['seconds'] = round(elapsed, 3)
+        report['deleted_per_sec'] = round(report['deleted'] / elapsed, 1) if elapsed else None
+        if self.archive is not None:
+            report['archive'] = {'location': self.archive.location, 'run_id': self.archive.run_id,
+                                 'parts': self.archive.parts, 'bytes': self.archive.bytes}
+        metrics.incr('retention.deleted', report['deleted'])
+        metrics.incr('retention.failed', report['failed'])
+        logging.info(f"Retention sweep deleted {report['deleted']} of {report['matched']} listings older than "
+                     f"{cutoff:%Y-%m-%d} in {report['seconds']}s ({report['failed']} failed)")
+        return report
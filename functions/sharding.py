@@ -0,0 +1,274 @@
+"""Coordinator/worker split of the scheduled run.
+
+The coordinator scrapes the listing index, stores it as shards of
+`shard_size` listings in the `ingest_shards` collection and publishes one
+message per shard. Each worker invocation loads its shard, ingests it and
+marks it done. Shard status lives in Firestore. A worker claims its shard in
+a transaction and holds it for a lease (`claimed_until`), so a redelivered
+message for a finished shard, or for one another worker is still running, is
+skipped. If the run times out, the next coordinator trigger republishes only
+the shards that are pending or whose lease expired, instead of scraping again.
+The scrape's high-water marks are saved with the run and only advanced once
+every shard is done.
+
+Messages carry no payload, only attributes ({'kind': 'shard', 'run_id', 'shard'}).
+Locally, InProcessQueue stands in for Pub/Sub and runs the workers inline.
+"""
+import io
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+
+import metrics
+from locations import commit_marks
+
+RUNS_COLLECTION = 'ingest_runs'
+SHARDS_COLLECTION = 'ingest_shards'
+SHARD_KIND = 'shard'
+DEFAULT_SHARD_SIZE = 100
+# Shard documents hold up to shard_size listings each; stay well under the 10 MB request limit
+SHARD_WRITE_BATCH = 10
+# How long a claimed shard is left to its worker; longer than a worker invocation can run
+DEFAULT_SHARD_LEASE = timedelta(minutes=15)
+# The coordinator runs daily: a run can be resumed until the next trigger after it, with slack for jitter
+DEFAULT_RESUME_WINDOW = timedelta(hours=26)
+
+
+def is_shard_message(attributes):
+    return (attributes or {}).get('kind') == SHARD_KIND
+
+
+def shard_id(run_id, shard):
+    return f"{run_id}-{shard:04d}"
+
+
+def complete_run(db, run_id):
+    """Mark a run complete and advance the scrape marks saved with it"""
+    ref = db.collection(RUNS_COLLECTION).document(run_id)
+    marks = (ref.get().to_dict() or {}).get('scrape_marks')
+    if marks:
+        commit_marks(db, marks)
+    ref.set({'status': 'complete', 'finished_at': datetime.now()}, merge=True)
+
+
+def lease_held(data, now):
+    """Whether a running shard's worker still holds it"""
+    claimed_until = data.get('claimed_until')
+    return (data.get('status') == 'running' and isinstance(claimed_until, datetime)
+            and claimed_until.replace(tzinfo=None) > now)
+
+
+class InProcessQueue:
+    """Pub/Sub stand-in for local runs and tests: publish() queues, flush() runs the handler on everything queued.
+
+    Like separate worker invocations, a failing message is logged and doesn't
+    stop the others; its shard stays unfinished until the next resume.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.published = 0
+        self.failed = 0
+        self._messages = deque()
+
+    def publish(self, attributes):
+        self._messages.append(dict(attributes))
+        self.published += 1
+
+    def flush(self):
+        while self._messages:
+            attributes = self._messages.popleft()
+            try:
+                self.handler(attributes)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Shard message {attributes} failed: {e}")
+
+
+class PubSubPublisher:
+    """Publishes attribute-only messages to a Pub/Sub topic"""
+
+    def __init__(self, topic, project=None):
+        from google.cloud import pubsub_v1
+
+        project = project or os.environ.get('GOOGLE_CLOUD_PROJECT') or os.environ.get('GCLOUD_PROJECT')
+        self._client = pubsub_v1.PublisherClient()
+        self.topic_path = self._client.topic_path(project, topic)
+        self.published = 0
+        self._futures = []
+
+    def publish(self, attributes):
+        self._futures.append(self._client.publish(self.topic_path, b'', **{k: str(v) for k, v in attributes.items()}))
+        self.published += 1
+
+    def flush(self):
+        """Wait until every message has been accepted; raises if any publish failed"""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+
+def _rows_to_json(properties):
+    return properties.to_json(orient='records', date_format='iso', default_handler=str)
+
+
+def _rows_from_json(rows_json):
+    import pandas as pd
+
+    # Keep values as written (e.g. list_date stays a 'YYYY-MM-DD' string)
+    return pd.read_json(io.StringIO(rows_json), orient='records', dtype=False, convert_dates=False)
+
+
+class RunCoordinator:
+    """Splits a scrape into shards, records them and publishes one message per shard"""
+
+    def __init__(self, db, publisher, shard_size=DEFAULT_SHARD_SIZE, resume_window=DEFAULT_RESUME_WINDOW):
+        self.db = db
+        self.publisher = publisher
+        self.shard_size = shard_size
+        self.resume_window = resume_window
+
+    def _shards(self, run_id):
+        return list(self.db.collection(SHARDS_COLLECTION).where('run_id', '==', run_id)
+                    .select(['shard', 'status', 'claimed_until']).stream())
+
+    def _publish(self, run_id, shards):
+        for shard in shards:
+            self.publisher.publish({'kind': SHARD_KIND, 'run_id': run_id, 'shard': str(shard)})
+        self.publisher.flush()
+        metrics.incr('shards.published', len(shards))
+
+    def resume(self, now=None):
+        """Republish the pending or expired shards of a recent run; returns its run_id, or None to start a new run"""
+        now = now or datetime.now()
+        running = [snapshot for snapshot in self.db.collection(RUNS_COLLECTION).where('status', '==', 'running').stream()]
+        resumed = None
+        for snapshot in sorted(running, key=lambda s: str(s.get('created_at')), reverse=True):
+            run_id = snapshot.id
+            created_at = snapshot.get('created_at')
+            if resumed is not None or not isinstance(created_at, datetime) or now - created_at.replace(tzinfo=None) > self.resume_window:
+                self.db.collection(RUNS_COLLECTION).document(run_id).set({'status': 'abandoned'}, merge=True)
+                logging.warning(f"Abandoning unfinished ingest run {run_id}")
+                continue
+
+            unfinished = [s.to_dict() for s in self._shards(run_id) if s.get('status') != 'done']
+            if not unfinished:
+                complete_run(self.db, run_id)
+                continue
+            # Shards a worker still holds are left to it
+            pending = [data['shard'] for data in unfinished if not lease_held(data, now)]
+            logging.info(f"Resuming ingest run {run_id}: republishing {len(pending)} of "
+                         f"{len(unfinished)} unfinished shards")
+            if pending:
+                self._publish(run_id, pending)
+            resumed = run_id
+        return resumed
+
+    def start(self, properties, now=None, marks=None):
+        """Store the scrape as shards and publish them; returns the new run_id.
+
+        marks (LocationScrape.marks()) are committed when the run completes.
+        """
+        now = now or datetime.now()
+        run_id = now.strftime('%Y%m%dT%H%M%S')
+        total = (len(properties) + self.shard_size - 1) // self.shard_size
+        self.db.collection(RUNS_COLLECTION).document(run_id).set({
+            'status': 'running',
+            'created_at': now,
+            'listings': len(properties),
+            'total_shards': total,
+            'shard_size': self.shard_size,
+            'scrape_marks': marks or {},
+        })
+
+        batch, queued = self.db.batch(), 0
+        for shard in range(total):
+            rows = properties.iloc[shard * self.shard_size:(shard + 1) * self.shard_size]
+            batch.set(self.db.collection(SHARDS_COLLECTION).document(shard_id(run_id, shard)), {
+                'run_id': run_id,
+                'shard': shard,
+                'status': 'pending',
+                'attempts': 0,
+                'listings': len(rows),
+                'rows_json': _rows_to_json(rows),
+            })
+            queued += 1
+            if queued == SHARD_WRITE_BATCH:
+                batch.commit()
+                batch, queued = self.db.batch(), 0
+        if queued:
+            batch.commit()
+
+        logging.info(f"Ingest run {run_id}: {len(properties)} listings in {total} shards of {self.shard_size}")
+        self._publish(run_id, range(total))
+        return run_id
+
+
+class ShardWorker:
+    """Processes one shard message; safe to call again for a shard that is done or claimed by another worker"""
+
+    def __init__(self, db, lease=DEFAULT_SHARD_LEASE):
+        self.db = db
+        self.lease = lease
+
+    def _claim(self, ref, now):
+        """The shard's data if this worker claimed it, else None with the reason it's skipped"""
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None, 'missing'
+            data = snapshot.to_dict()
+            if data.get('status') == 'done':
+                return None, 'done'
+            if lease_held(data, now):
+                return None, 'claimed'
+            transaction.update(ref, {
+                'status': 'running',
+                'attempts': data.get('attempts', 0) + 1,
+                'started_at': now,
+                'claimed_until': now + self.lease,
+            })
+            return data, None
+
+        return claim(self.db.transaction())
+
+    def handle(self, attributes, process):
+        """Run process(properties DataFrame) -> summary dict for the shard, unless it's done or claimed"""
+        run_id, shard = attributes['run_id'], int(attributes['shard'])
+        ref = self.db.collection(SHARDS_COLLECTION).document(shard_id(run_id, shard))
+        data, skipped = self._claim(ref, datetime.now())
+        if skipped == 'missing':
+            logging.error(f"Shard {shard} of run {run_id} not found")
+            return None
+        if skipped:
+            logging.info(f"Shard {shard} of run {run_id} already {skipped}, skipping redelivery")
+            metrics.incr('shards.duplicates')
+            return None
+
+        try:
+            summary = process(_rows_from_json(data['rows_json']))
+        except Exception:
+            # Hand the shard back, so a redelivery or the next resume retries it without waiting out the lease
+            ref.set({'status': 'pending', 'claimed_until': None}, merge=True)
+            raise
+        ref.set({
+            'status': 'done',
+            'finished_at': datetime.now(),
+            'claimed_until': None,
+            'summary': json.loads(json.dumps(summary, default=str)) if summary else None,
+        }, merge=True)
+        metrics.incr('shards.done')
+        self._complete_run_if_finished(run_id)
+        return summary
+
+    def _complete_run_if_finished(self, run_id):
+        statuses = [s.get('status') for s in self.db.collection(SHARDS_COLLECTION)
+                    .where('run_id', '==', run_id).select(['status']).stream()]
+        if statuses and all(status == 'done' for status in statuses):
+            complete_run(self.db, run_id)
+            logging.info(f"Ingest run {run_id} complete ({len(statuses)} shards)")
@@ -0,0 +1,23 @@
+"""Tests for the modules in functions/, with an in-memory Firestore (fake_firestore.py).
+
+Run from functions/, e.g. `python -m pytest tests` or `python -m tests.test_sharding`.
+"""
+import os
+
+# The listings snapshot at the repo root
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'current_properties.json')
+
+
+def scraped_listings(count):
+    """The fixture as scrape_property output: only the scraped columns, list_date as a plain date"""
+    import json
+
+    import pandas as pd
+
+    from listing_schema import LISTING_COLUMNS
+
+    with open(FIXTURE) as f:
+        records = json.load(f)[:count]
+    properties = pd.DataFrame([{k: v for k, v in r.items() if k in LISTING_COLUMNS} for r in records])
+    properties['list_date'] = properties['list_date'].astype(str).str[:10]
+    return properties
@@ -0,0 +1,246 @@
+"""In-memory stand-in for the parts of the Firestore client the pipeline uses.
+
+Every round trip (get, get_all, commit, stream) can be given a fixed latency
+so benchmarks see the cost of RPCs, not just Python overhead. Calls are
+counted in `rpc_counts`. Transactions work with google.cloud.firestore's
+transactional decorator and run one at a time.
+"""
+import copy
+import threading
+import time
+from collections import Counter
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.reference = None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self, transaction=None):
+        self._collection._db._rpc('get')
+        return FakeSnapshot(self.id, copy.deepcopy(self._collection._docs.get(self.id)))
+
+    def set(self, data, merge=False):
+        self._collection._db._rpc('commit')
+        self._collection._apply_set(self.id, data, merge)
+
+    def delete(self):
+        self._collection._db._rpc('commit')
+        self._collection._docs.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=(), limit=None, start_after=None, fields=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, order=self._order, limit=self._limit,
+                     start_after=self._start_after, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(order=self._order + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(start_after=snapshot)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def _sort_key(self, item):
+        doc_id, data = item
+        key = []
+        for field, _ in self._order:
+            value = doc_id if field == '__name__' else data.get(field)
+            key.append((value is not None, value))
+        key.append((True, doc_id))
+        return key
+
+    def stream(self):
+        self._collection._db._rpc('stream')
+        ops = {
+            '==': lambda a, b: a == b,
+            '<': lambda a, b: a is not None and a < b,
+            '<=': lambda a, b: a is not None and a <= b,
+            '>': lambda a, b: a is not None and a > b,
+            '>=': lambda a, b: a is not None and a >= b,
+            'in': lambda a, b: a in b,
+        }
+        items = [
+            (doc_id, data) for doc_id, data in list(self._collection._docs.items())
+            if all(ops[op](data.get(field), value) for field, op, value in self._filters)
+        ]
+        items.sort(key=self._sort_key)
+        if any(direction == 'DESCENDING' for _, direction in self._order[:1]):
+            items.reverse()
+        if self._start_after is not None:
+            # A snapshot, or a {field: value, '__name__': doc id} cursor; compared by
+            # value, so it works even if the cursor document is gone
+            if isinstance(self._start_after, dict):
+                cursor = (self._start_after.get('__name__'), self._start_after)
+            else:
+                cursor = (self._start_after.id, self._start_after._data or {})
+            cursor_key = self._sort_key(cursor)
+            descending = any(direction == 'DESCENDING' for _, direction in self._order[:1])
+            items = [item for item in items
+                     if (self._sort_key(item) < cursor_key if descending else self._sort_key(item) > cursor_key)]
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield FakeSnapshot(doc_id, copy.deepcopy(data))
+
+
+def _merge(target, data):
+    """set(merge=True) semantics: nested maps merge, Increment transforms add"""
+    for key, value in data.items():
+        if type(value).__name__ == 'Increment':
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name):
+        self._db = db
+        self.name = name
+        self._docs = {}
+        super().__init__(self)
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self, doc_id)
+
+    def _apply_set(self, doc_id, data, merge):
+        if not merge or doc_id not in self._docs:
+            self._docs[doc_id] = {}
+        if isinstance(merge, (list, tuple)):
+            # merge=[field, ...]: those top-level fields are replaced whole, the rest of the document kept
+            for field in merge:
+                self._docs[doc_id].pop(field, None)
+            data = {field: data[field] for field in merge if field in data}
+        _merge(self._docs[doc_id], data)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref, data, merge))
+
+    def delete(self, ref):
+        self._ops.append(('delete', ref, None, False))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("maximum 500 writes allowed per request")
+        self._db._rpc('commit')
+        with self._db._lock:
+            for op, ref, data, merge in self._ops:
+                if op == 'delete':
+                    ref._collection._docs.pop(ref.id, None)
+                else:
+                    ref._collection._apply_set(ref.id, data, merge)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """What firestore.transactional drives: begin, the wrapped reads and writes, then commit or rollback"""
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._id = None
+
+    def update(self, ref, data):
+        if ref.id not in ref._collection._docs:
+            raise KeyError(f"No document to update: {ref.id}")
+        self._ops.append(('set', ref, data, True))
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        # Transactions are serialized, which is all the isolation the callers need
+        self._db._transaction_lock.acquire()
+        self._id = b'fake-transaction'
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self):
+        self._ops = []
+        self._release()
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._db._transaction_lock.release()
+
+
+class FakeFirestore:
+    def __init__(self, rpc_latency=0.0):
+        self.rpc_latency = rpc_latency
+        self.rpc_counts = Counter()
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._transaction_lock = threading.Lock()
+
+    def _rpc(self, kind):
+        self.rpc_counts[kind] += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def collection(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def get_all(self, refs):
+        self._rpc('get_all')
+        for ref in refs:
+            yield FakeSnapshot(ref.id, copy.deepcopy(ref._collection._docs.get(ref.id)))
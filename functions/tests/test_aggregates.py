@@ -0,0 +1,120 @@
+# test_aggregates.py
+import json
+import logging
+import math
+
+from aggregates import AGGREGATES_COLLECTION, DIMENSIONS, AggregateDelta, AggregateStore
+from tests import FIXTURE
+from tests.fake_firestore import FakeFirestore
+
+
+def fixture_listings(count=200):
+    with open(FIXTURE) as f:
+        records = json.load(f)[:count]
+    return {f"listing-{i}": record for i, record in enumerate(records)}
+
+
+def seeded_db(listings):
+    db = FakeFirestore()
+    collection = db.collection('properties')
+    for doc_id, data in listings.items():
+        collection.document(doc_id).set(dict(data))
+    return db
+
+
+def approx_equal(a, b, path=''):
+    """Recursive comparison with a relative tolerance for the float sums"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        assert set(a) == set(b), f"{path}: keys differ {set(a) ^ set(b)}"
+        for key in a:
+            approx_equal(a[key], b[key], f"{path}.{key}")
+    elif isinstance(a, float) or isinstance(b, float):
+        assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6), f"{path}: {a} != {b}"
+    else:
+        assert a == b, f"{path}: {a} != {b}"
+
+
+def stored_summaries(db):
+    """The summary map of each aggregates document, as clients read it"""
+    collection = db.collection(AGGREGATES_COLLECTION)
+    return {dimension: collection.document(dimension).get().to_dict()['summary'] for dimension in DIMENSIONS}
+
+
+def rebuilt_summaries(db):
+    """What rebuild() stores from the properties the db holds now, computed on a copy"""
+    listings = {s.id: s.to_dict() for s in db.collection('properties').stream()}
+    copy = seeded_db(listings)
+    AggregateStore(copy).rebuild()
+    return stored_summaries(copy)
+
+
+def test_incremental_matches_rebuild():
+    listings = fixture_listings()
+    db = seeded_db(listings)
+    store = AggregateStore(db)
+    # No aggregates yet: apply builds them from every listing
+    store.apply(AggregateDelta())
+
+    # One run's worth of changes: rewritten, new and removed listings
+    delta = AggregateDelta()
+    properties = db.collection('properties')
+    for i, (doc_id, old) in enumerate(list(listings.items())[:40]):
+        new = dict(old, rent=f"${2000 + 25 * i:,}/mo", predicted_rent=1900 + 10 * i, prediction_success=True)
+        properties.document(doc_id).set(new)
+        delta.replace(old, new)
+    for doc_id, old in list(listings.items())[40:60]:
+        properties.document(doc_id).delete()
+        delta.remove(old)
+    for i in range(15):
+        new = dict(listings['listing-0'], zip_code='94710', rent='$3,100/mo', beds=str(i % 4))
+        properties.document(f"new-{i}").set(new)
+        delta.replace(None, new)
+
+    store.apply(delta)
+    approx_equal(stored_summaries(db), rebuilt_summaries(db))
+
+
+def test_emptied_group_drops_out_of_the_summary():
+    listings = fixture_listings(50)
+    db = seeded_db(listings)
+    store = AggregateStore(db)
+    store.apply(AggregateDelta())
+    properties = db.collection('properties')
+
+    lone = dict(listings['listing-0'], zip_code='94999', rent='$2,750/mo')
+    properties.document('lone').set(lone)
+    delta = AggregateDelta()
+    delta.replace(None, lone)
+    store.apply(delta)
+    assert '94999' in stored_summaries(db)['by_zip']
+
+    properties.document('lone').delete()
+    delta = AggregateDelta()
+    delta.remove(lone)
+    store.apply(delta)
+    assert '94999' not in stored_summaries(db)['by_zip']
+    approx_equal(stored_summaries(db), rebuilt_summaries(db))
+
+
+def test_prediction_refresh_keeps_aggregates_in_step():
+    import main
+
+    listings = fixture_listings()
+    # Stale predictions, so update_all_predictions rewrites them
+    for data in listings.values():
+        data.update(predicted_rent=999, prediction_success=True)
+    db = seeded_db(listings)
+    AggregateStore(db).apply(AggregateDelta())
+
+    main.get_db = lambda: db
+    response = main.update_all_predictions()
+    assert response.status_code == 200, response.get_data()
+    approx_equal(stored_summaries(db), rebuilt_summaries(db))
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    test_incremental_matches_rebuild()
+    test_emptied_group_drops_out_of_the_summary()
+    test_prediction_refresh_keeps_aggregates_in_step()
+    print("incremental aggregates match rebuild()")
@@ -0,0 +1,32 @@
+# test_ingest.py
+import logging
+
+import numpy as np
+
+from ingest import run_ingest
+from property_store import PropertyStore
+from tests import scraped_listings
+from tests.fake_firestore import FakeFirestore
+
+
+def test_missing_days_on_mls_is_still_scored():
+    properties = scraped_listings(20)
+    # homeharvest leaves days_on_mls empty for some listings
+    properties['days_on_mls'] = properties['days_on_mls'].astype(float)
+    properties.loc[:4, 'days_on_mls'] = np.nan
+    db = FakeFirestore()
+
+    summary = run_ingest(properties, PropertyStore(db), lambda url: ('2', '1', '$2,500/mo'))
+    stored = [s.to_dict() for s in db.collection('properties').stream()]
+
+    assert summary['written'] == len(stored) > 0, summary
+    missing = [data for data in stored if data['days_on_mls'] is None]
+    assert missing, "the fixture rows should keep their missing days_on_mls"
+    assert all(data['prediction_success'] for data in stored), [d['property_url'] for d in stored
+                                                                 if not d['prediction_success']]
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    test_missing_days_on_mls_is_still_scored()
+    print("ingest tests passed")
@@ -0,0 +1,88 @@
+# test_prediction_batcher.py
+import threading
+
+from prediction_batcher import MicroBatcher
+
+
+class FakePredict:
+    """Stands in for predict_rows: records each call, fails on any property holding a list"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, properties):
+        self.calls.append(len(properties))
+        if any(isinstance(v, list) for p in properties for v in p.values()):
+            raise ValueError("bad property")
+        return [{'predicted_rent': p['beds'] * 1000} for p in properties]
+
+
+def submit_concurrently(batcher, requests):
+    """{name: (results, batch info) or the exception} for requests submitted at the same time"""
+    outcomes = {}
+    barrier = threading.Barrier(len(requests))
+
+    def run(name, properties):
+        barrier.wait()
+        try:
+            outcomes[name] = batcher.submit(properties, timeout=5)
+        except Exception as e:
+            outcomes[name] = e
+
+    threads = [threading.Thread(target=run, args=item) for item in requests.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_concurrent_requests_share_one_call():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, window=0.2)
+    requests = {f"r{i}": [{'beds': i}, {'beds': i + 1}] for i in range(8)}
+    outcomes = submit_concurrently(batcher, requests)
+
+    assert predict.calls == [16], predict.calls
+    for name, properties in requests.items():
+        results, batch = outcomes[name]
+        assert results == [{'predicted_rent': p['beds'] * 1000} for p in properties]
+        assert batch['requests'] == 8 and batch['rows'] == 16
+    assert batcher.stats()['batches'] == 1
+
+
+def test_max_batch_splits_calls():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, window=0.2, max_batch=4)
+    outcomes = submit_concurrently(batcher, {f"r{i}": [{'beds': i}] for i in range(8)})
+    assert all(not isinstance(o, Exception) for o in outcomes.values())
+    assert max(predict.calls) <= 4 and sum(predict.calls) == 8, predict.calls
+
+
+def test_failing_request_only_fails_itself():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, window=0.2)
+    outcomes = submit_concurrently(batcher, {
+        'good': [{'beds': 1}],
+        'bad': [{'beds': [1, 2]}],
+        'also_good': [{'beds': 3}],
+    })
+
+    assert isinstance(outcomes['bad'], ValueError)
+    assert outcomes['good'][0] == [{'predicted_rent': 1000}]
+    assert outcomes['also_good'][0] == [{'predicted_rent': 3000}]
+    assert batcher.stats()['errors'] == 1
+
+
+def test_empty_request_skips_the_model():
+    predict = FakePredict()
+    assert MicroBatcher(predict).submit([])[0] == []
+    assert predict.calls == []
+
+
+if __name__ == '__main__':
+    test_concurrent_requests_share_one_call()
+    test_max_batch_splits_calls()
+    test_failing_request_only_fails_itself()
+    test_empty_request_skips_the_model()
+    print("prediction batcher tests passed")
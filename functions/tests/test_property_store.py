@@ -0,0 +1,64 @@
+# test_property_store.py
+import logging
+
+from property_store import PropertyStore
+from tests.fake_firestore import FakeFirestore
+
+
+class FailingBatchFirestore(FakeFirestore):
+    """Every batch commit fails; single-document writes fail only for bad_ids"""
+
+    def __init__(self, bad_ids=()):
+        super().__init__()
+        self.bad_ids = set(bad_ids)
+        self.batch_commits = 0
+        properties = self.collection('properties')
+        apply_set = properties._apply_set
+
+        def set_unless_bad(doc_id, data, merge):
+            if doc_id in self.bad_ids:
+                raise ValueError(f"cannot write {doc_id}")
+            apply_set(doc_id, data, merge)
+        properties._apply_set = set_unless_bad
+
+    def batch(self):
+        batch = super().batch()
+
+        def commit():
+            self.batch_commits += 1
+            raise RuntimeError("batch commit failed")
+        batch.commit = commit
+        return batch
+
+
+def test_failed_batch_falls_back_to_single_writes():
+    db = FailingBatchFirestore(bad_ids={'bad'})
+    properties = db.collection('properties')
+    properties.document('kept').set({'rent': '$2,000/mo'})
+    properties.document('gone').set({'rent': '$1,500/mo'})
+
+    store = PropertyStore(db, max_retries=1)
+    store._sleep = lambda seconds: None
+    for doc_id in ('a', 'bad', 'b'):
+        store.set(doc_id, {'rent': f'{doc_id} rent'})
+    store.update('kept', {'predicted_rent': 2100})
+    store.delete('gone')
+    report = store.flush()
+
+    # One retry of the batch, then every document on its own
+    assert db.batch_commits == 2 and report.retries == 1
+    assert report.written == 4 and report.commits == 4, report
+    assert list(report.errors) == ['bad'] and isinstance(report.errors['bad'], ValueError)
+    stored = {s.id: s.to_dict() for s in properties.stream()}
+    assert stored == {
+        'a': {'rent': 'a rent'},
+        'b': {'rent': 'b rent'},
+        'kept': {'rent': '$2,000/mo', 'predicted_rent': 2100},
+    }, stored
+    assert store.pending_count() == 0
+
+
+if __name__ == '__main__':
+    logging.disable(logging.ERROR)
+    test_failed_batch_falls_back_to_single_writes()
+    print("property store tests passed")
@@ -0,0 +1,99 @@
+# test_sharding.py
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from locations import STATE_COLLECTION
+from sharding import SHARDS_COLLECTION, InProcessQueue, RunCoordinator, ShardWorker, shard_id
+from tests.fake_firestore import FakeFirestore
+
+LISTINGS = pd.DataFrame({'property_url': [f"https://example.com/{i}" for i in range(6)]})
+
+
+def started_run(db, now):
+    """A run of three shards whose messages were published but not yet handled"""
+    return RunCoordinator(db, InProcessQueue(lambda attributes: None), shard_size=2).start(LISTINGS, now=now)
+
+
+def test_claimed_shard_is_skipped():
+    db = FakeFirestore()
+    run_id = started_run(db, datetime.now())
+    attributes = {'kind': 'shard', 'run_id': run_id, 'shard': '0'}
+    worker = ShardWorker(db)
+    processed = []
+
+    def process(properties):
+        # A redelivery while this worker holds the lease must not run the shard again
+        assert worker.handle(attributes, lambda p: processed.append('again')) is None
+        processed.append(len(properties))
+        return {'written': len(properties)}
+
+    assert worker.handle(attributes, process) == {'written': 2}
+    assert processed == [2]
+    data = db.collection(SHARDS_COLLECTION).document(shard_id(run_id, 0)).get().to_dict()
+    assert data['status'] == 'done' and data['attempts'] == 1 and data['claimed_until'] is None
+    # ... and neither must a redelivery after it's done
+    assert worker.handle(attributes, process) is None
+    assert processed == [2]
+
+
+def test_failed_shard_is_handed_back():
+    db = FakeFirestore()
+    run_id = started_run(db, datetime.now())
+    attributes = {'kind': 'shard', 'run_id': run_id, 'shard': '1'}
+
+    def fail(properties):
+        raise TimeoutError("out of time")
+
+    try:
+        ShardWorker(db).handle(attributes, fail)
+        raise AssertionError("the failure should propagate")
+    except TimeoutError:
+        pass
+    data = db.collection(SHARDS_COLLECTION).document(shard_id(run_id, 1)).get().to_dict()
+    assert data['status'] == 'pending' and data['claimed_until'] is None
+    assert ShardWorker(db).handle(attributes, lambda p: {}) == {}
+
+
+def test_resume_skips_live_leases():
+    db = FakeFirestore()
+    start = datetime.now() - timedelta(hours=1)
+    run_id = started_run(db, start)
+    shards = db.collection(SHARDS_COLLECTION)
+    # Shard 0 is done, shard 1 is held by a live worker, shard 2's worker died an hour ago
+    shards.document(shard_id(run_id, 0)).set({'status': 'done'}, merge=True)
+    shards.document(shard_id(run_id, 1)).set(
+        {'status': 'running', 'claimed_until': datetime.now() + timedelta(minutes=5)}, merge=True)
+    shards.document(shard_id(run_id, 2)).set(
+        {'status': 'running', 'claimed_until': start + timedelta(minutes=15)}, merge=True)
+
+    republished = []
+    assert RunCoordinator(db, InProcessQueue(republished.append)).resume() == run_id
+    assert [m['shard'] for m in republished] == ['2']
+
+    # With only the live lease left, the run is still resumed but nothing is republished
+    shards.document(shard_id(run_id, 2)).set({'status': 'done'}, merge=True)
+    queue = InProcessQueue(lambda attributes: None)
+    assert RunCoordinator(db, queue).resume() == run_id
+    assert queue.published == 0
+
+
+def test_marks_advance_when_the_run_completes():
+    db = FakeFirestore()
+    marks = {'94704': {'location': '94704', 'last_success': datetime.now(), 'last_count': 6}}
+    run_id = RunCoordinator(db, InProcessQueue(lambda attributes: None), shard_size=2).start(LISTINGS, marks=marks)
+    worker = ShardWorker(db)
+    for shard in range(3):
+        assert not list(db.collection(STATE_COLLECTION).stream())
+        worker.handle({'kind': 'shard', 'run_id': run_id, 'shard': str(shard)}, lambda p: {})
+    assert db.collection(STATE_COLLECTION).document('94704').get().to_dict()['last_count'] == 6
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    test_claimed_shard_is_skipped()
+    test_failed_shard_is_handed_back()
+    test_resume_skips_live_leases()
+    test_marks_advance_when_the_run_completes()
+    print("sharding tests passed")
@@ -1,53 +1,278 @@
 # firestore_download.py
 import firebase_admin
 from firebase_admin import credentials, firestore
-import pandas as pd
-import os
+from datetime import datetime
+import argparse
 import json
+import os
 
 # Get the directory where this script is located
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 FUNCTIONS_DIR = os.path.join(CURRENT_DIR, 'functions')
 SERVICE_ACCOUNT_PATH = os.path.join(FUNCTIONS_DIR, 'berkeley-housing-app-firebase-adminsdk-2oetp-5419402200.json')
 
-def download_firestore_data():
+PAGE_SIZE = 500
+
+# Column types for the export: the fields ingest stores (functions/listing_schema.py)
+# plus the detail-scrape, prediction and query fields (property_query.QUERY_FIELDS).
+# Only these columns are exported, so every page has the same schema; add new
+# document fields here.
+COLUMN_TYPES = {
+    'id': 'string',
+    'property_url': 'string',
+    'mls_id': 'string',
+    'status': 'string',
+    'style': 'string',
+    'street': 'string',
+    'unit': 'string',
+    'city': 'string',
+    'state': 'string',
+    'zip_code': 'string',
+    'beds': 'string',
+    'baths': 'string',
+    'rent': 'string',
+    'full_baths': 'int64',
+    'half_baths': 'int64',
+    'sqft': 'int64',
+    'year_built': 'int64',
+    'list_price': 'int64',
+    'days_on_mls': 'int64',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'list_date': 'timestamp',
+    'primary_photo': 'string',
+    'predicted_rent': 'float64',
+    'rent_prediction_range_low': 'float64',
+    'rent_prediction_range_high': 'float64',
+    'model_version': 'string',
+    'prediction_quality': 'string',
+    'prediction_success': 'bool',
+    'rent_amount': 'float64',
+    'beds_count': 'int64',
+    'rent_delta': 'float64',
+    'content_fingerprint': 'string',
+}
+
+
+def _coerce(value, column_type):
+    if value is None:
+        return None
+    try:
+        if column_type == 'int64':
+            return int(value)
+        if column_type == 'float64':
+            return float(value)
+        if column_type == 'bool':
+            return bool(value)
+        if column_type == 'timestamp':
+            if hasattr(value, 'timestamp'):
+                return value.strftime('%Y-%m-%d %H:%M:%S')
+            return str(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def to_record(doc):
+    """Flatten a property document into a typed export record"""
+    data = doc.to_dict()
+    data['id'] = doc.id
+    return {column: _coerce(data.get(column), column_type) for column, column_type in COLUMN_TYPES.items()}
+
+
+class JsonLinesWriter:
+    def __init__(self, path, append=False):
+        self.file = open(path, 'a' if append else 'w')
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record))
+            self.file.write('\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonArrayWriter:
+    """Writes the legacy current_properties.json layout (one JSON array) without holding it in memory"""
+
+    def __init__(self, path, append=False):
+        if append:
+            raise ValueError("The json format can't be resumed, use jsonl or parquet")
+        self.file = open(path, 'w')
+        self.file.write('[')
+        self.first = True
+
+    def write(self, records):
+        for record in records:
+            if not self.first:
+                self.file.write(', ')
+            self.file.write(json.dumps(record))
+            self.first = False
+        self.file.flush()
+
+    def close(self):
+        self.file.write(']')
+        self.file.close()
+
+
+class ParquetWriter:
+    """One row group per page; resumed exports go to a new part file next to the first"""
+
+    def __init__(self, path, append=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+        arrow_types = {
+            'string': pa.string(),
+            'int64': pa.int64(),
+            'float64': pa.float64(),
+            'bool': pa.bool_(),
+            'timestamp': pa.timestamp('s'),
+        }
+        self.pa = pa
+        self.schema = pa.schema([(column, arrow_types[t]) for column, t in COLUMN_TYPES.items()])
+        if append and os.path.exists(path):
+            stem, ext = os.path.splitext(path)
+            part = 1
+            while os.path.exists(f"{stem}.part{part}{ext}"):
+                part += 1
+            path = f"{stem}.part{part}{ext}"
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, records):
+        columns = {}
+        for column, column_type in COLUMN_TYPES.items():
+            values = [record[column] for record in records]
+            if column_type == 'timestamp':
+                values = [datetime.strptime(v[:19], '%Y-%m-%d %H:%M:%S') if v and len(v) >= 19
+                          else (datetime.strptime(v, '%Y-%m-%d') if v else None) for v in values]
+            columns[column] = values
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    'jsonl': JsonLinesWriter,
+    'json': JsonArrayWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def _cursor_path(output):
+    return output + '.cursor'
+
+
+def _read_cursor(output):
+    try:
+        with open(_cursor_path(output)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_cursor(output, cursor):
+    tmp = _cursor_path(output) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cursor, f)
+    os.replace(tmp, _cursor_path(output))
+
+
+def iter_property_pages(db, page_size=PAGE_SIZE, since=None, start_after_id=None):
+    """Yield pages of property snapshots, ordered so a cursor can pick up where a page ended"""
+    collection = db.collection('properties')
+    if since is not None:
+        query = collection.where('list_date', '>=', since).order_by('list_date').order_by('__name__')
+    else:
+        query = collection.order_by('__name__')
+
+    cursor = None
+    if start_after_id:
+        cursor = collection.document(start_after_id).get()
+        if not cursor.exists:
+            raise SystemExit(f"Cursor document {start_after_id} no longer exists, start a fresh export")
+
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        page = list(page_query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+def download_firestore_data(output='current_properties.jsonl', fmt='jsonl', page_size=PAGE_SIZE,
+                            since=None, resume=False):
+    """Stream the properties collection to `output` one page at a time.
+
+    Memory stays at one page regardless of collection size. After every page
+    the last document id is saved next to the output, so --resume continues
+    from there after an interruption. With `since`, only listings whose
+    list_date is on or after it are exported.
+    """
     # Initialize Firebase if not already initialized
     if not firebase_admin._apps:
         cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
         firebase_admin.initialize_app(cred)
 
     db = firestore.client()
-    
-    # Get all properties
-    properties_ref = db.collection('properties')
-    docs = properties_ref.stream()
-    
-    # Convert to list of dictionaries
-    properties = []
-    for doc in docs:
-        data = doc.to_dict()
-        # Convert timestamp to string if present
-        if 'list_date' in data and hasattr(data['list_date'], 'timestamp'):
-            data['list_date'] = data['list_date'].strftime('%Y-%m-%d %H:%M:%S')
-        properties.append(data)
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(properties)
-    
-    # Save both CSV and JSON versions
-    df.to_csv('current_properties.csv', index=False)
-    
-    # Save raw JSON for backup
-    with open('current_properties.json', 'w') as f:
-        json.dump(properties, f)
-    
-    print(f"Downloaded {len(properties)} properties")
-    print("\nDataset Info:")
-    print(df.info())
-    print("\nSample Data:")
-    print(df[['beds', 'baths', 'rent', 'neighborhood']].head())
-    
-    return df
+
+    start_after_id = None
+    count = 0
+    if resume:
+        state = _read_cursor(output)
+        if state:
+            if state.get('since') != (since.isoformat() if since else None):
+                raise SystemExit("The saved cursor was written with a different --since, start a fresh export")
+            start_after_id = state['last_id']
+            count = state['count']
+            print(f"Resuming after {start_after_id} ({count} properties already exported)")
+
+    writer = WRITERS[fmt](output, append=start_after_id is not None)
+    try:
+        for page in iter_property_pages(db, page_size, since, start_after_id):
+            writer.write([to_record(doc) for doc in page])
+            count += len(page)
+            _write_cursor(output, {
+                'last_id': page[-1].id,
+                'count': count,
+                'since': since.isoformat() if since else None,
+            })
+            print(f"Exported {count} properties")
+    finally:
+        writer.close()
+
+    # The export finished, so the cursor is no longer needed
+    if os.path.exists(_cursor_path(output)):
+        os.remove(_cursor_path(output))
+
+    print(f"Downloaded {count} properties to {output}")
+    return count
+
 
 if __name__ == "__main__":
-    df = download_firestore_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Export the Firestore properties collection")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl')
+    parser.add_argument('--output', help="defaults to current_properties.<format>")
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--since', type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+                        help="only export listings with list_date on or after YYYY-MM-DD")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted export")
+    args = parser.parse_args()
+
+    download_firestore_data(
+        output=args.output or f"current_properties.{args.format}",
+        fmt=args.format,
+        page_size=args.page_size,
+        since=args.since,
+        resume=args.resume,
+    )
@@ -0,0 +1,203 @@
+"""Train the rent model and write a versioned artifact for functions/ml_model.
+
+Features are built by the serving code itself (predict.build_feature_frame),
+so training and prediction can't drift apart. Training data can be the
+original cleaned_data.csv, an export of current_properties.json, or both.
+
+    python ml_model/train.py --n-jobs 4
+    python ml_model/train.py --data current_properties.json --version 3.0 --output functions/ml_model/rent_prediction_model.json
+
+The feature matrix for each input file is cached under --cache-dir, keyed by
+the file's content and the feature code, so repeated searches skip rebuilding it.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(ML_DIR)
+FUNCTIONS_DIR = os.path.join(REPO_DIR, 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from aggregates import parse_rent  # noqa: E402
+from ml_model.artifact import NeighborhoodEncoder, export_artifact  # noqa: E402
+from ml_model.geo import neighborhoods_for_zips  # noqa: E402
+from ml_model.predict import build_feature_frame  # noqa: E402
+
+DEFAULT_DATA = [os.path.join(ML_DIR, 'cleaned_data.csv'), os.path.join(REPO_DIR, 'current_properties.json')]
+DEFAULT_CACHE_DIR = os.path.join(ML_DIR, '.feature_cache')
+DEFAULT_OUTPUT_DIR = os.path.join(ML_DIR, 'artifacts')
+
+# Source files whose changes invalidate cached feature matrices
+FEATURE_SOURCES = [
+    os.path.join(FUNCTIONS_DIR, 'ml_model', name) for name in ('predict.py', 'normalize.py', 'geo.py')
+] + [os.path.join(FUNCTIONS_DIR, 'aggregates.py'), os.path.abspath(__file__)]
+
+# cleaned_data.csv has neighborhood names but no zip codes; map them onto the
+# zips serving derives neighborhoods from. Anything else gets the default.
+CSV_NEIGHBORHOOD_ZIPS = {
+    'Southside': '94704',
+    'West Berkeley': '94702',
+    'North Berkeley': '94709',
+    'Berkeley Hills': '94708',
+    'Claremont Elmwood': '94705',
+    'Thousand Oaks': '94707',
+    'Albany': '94706',
+    'University of California, Berkeley': '94720',
+}
+
+PARAM_GRID = {
+    'n_estimators': [100, 200, 400, 800],
+    'learning_rate': [0.02, 0.05, 0.1],
+    'num_leaves': [7, 15, 31],
+    'min_child_samples': [5, 10, 20],
+    'subsample': [0.7, 0.85, 1.0],
+    'subsample_freq': [1],
+    'colsample_bytree': [0.7, 0.85, 1.0],
+    'reg_lambda': [0.0, 1.0, 5.0],
+}
+
+
+def load_listings(path):
+    """Raw listing rows (the columns predict_rental_price reads) plus a 'rent' target"""
+    if path.endswith('.csv'):
+        df = pd.read_csv(path)
+        df['zip_code'] = df['neighborhood'].map(CSV_NEIGHBORHOOD_ZIPS)
+        # No listing dates in the CSV; is_summer comes out 0 like any unparseable date
+        df['list_date'] = None
+    else:
+        with open(path) as f:
+            df = pd.DataFrame(json.load(f))
+        # The same rent the aggregates and the query API read; None where there's no usable price
+        rent = df['rent'].map(parse_rent).astype(float)
+        if 'list_price' in df:
+            rent = rent.fillna(df['list_price'].map(parse_rent).astype(float))
+        df['rent'] = rent
+        df['list_date'] = df['list_date'].astype(str).str[:10]
+    if 'style' not in df:
+        df['style'] = 'APARTMENT'
+    df['days_on_mls'] = pd.to_numeric(df['days_on_mls'], errors='coerce').fillna(0)
+    df = df[df['rent'].notna() & (df['rent'] > 0)]
+    columns = ['beds', 'baths', 'latitude', 'longitude', 'style', 'zip_code', 'days_on_mls', 'list_date', 'rent']
+    return df[columns].reset_index(drop=True)
+
+
+def _file_hash(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def feature_matrix(path, encoder, cache_dir):
+    """(features DataFrame, rent array) for one data file, from the cache when possible"""
+    key = hashlib.sha256(
+        (_file_hash([path]) + _file_hash(FEATURE_SOURCES) + json.dumps(list(encoder.classes_), default=str)).encode()
+    ).hexdigest()[:24]
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(path)}.{key}.pkl") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        logging.info(f"Using cached features {cache_path}")
+        cached = pd.read_pickle(cache_path)
+        return cached.drop(columns='rent'), cached['rent'].to_numpy()
+
+    listings = load_listings(path)
+    features, valid = build_feature_frame(listings.drop(columns='rent'), encoder)
+    features = features[valid].reset_index(drop=True)
+    rent = listings['rent'].to_numpy()[valid]
+    logging.info(f"{path}: {len(features)} trainable rows of {len(listings)}")
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        features.assign(rent=rent).to_pickle(cache_path)
+    return features, rent
+
+
+def fit_encoder(paths):
+    """Neighborhood vocabulary, from the same zip mapping serving uses"""
+    labels = set()
+    for path in paths:
+        labels.update(neighborhoods_for_zips(load_listings(path)['zip_code'].to_numpy()))
+    return NeighborhoodEncoder(sorted(labels))
+
+
+def train(args):
+    from lightgbm import LGBMRegressor
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    from sklearn.model_selection import KFold, RandomizedSearchCV, train_test_split
+
+    encoder = fit_encoder(args.data)
+    matrices = [feature_matrix(path, encoder, args.cache_dir) for path in args.data]
+    X = pd.concat([m[0] for m in matrices], ignore_index=True)
+    y = np.concatenate([m[1] for m in matrices])
+    features = list(X.columns)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=args.seed)
+
+    # Parallelism is across candidate fits (processes); each fit stays single-threaded
+    search = RandomizedSearchCV(
+        LGBMRegressor(random_state=args.seed, n_jobs=1, verbose=-1),
+        PARAM_GRID,
+        n_iter=args.n_iter,
+        cv=KFold(n_splits=5, shuffle=True, random_state=args.seed),
+        scoring='neg_root_mean_squared_error',
+        n_jobs=args.n_jobs,
+        random_state=args.seed,
+    )
+    start = time.perf_counter()
+    search.fit(X_train, y_train)
+    logging.info(f"Search over {args.n_iter} candidates took {time.perf_counter() - start:.1f}s")
+
+    predictions = search.best_estimator_.predict(X_test)
+    scores = {
+        'rmse': float(np.sqrt(mean_squared_error(y_test, predictions))),
+        'mae': float(mean_absolute_error(y_test, predictions)),
+        'r2': float(r2_score(y_test, predictions)),
+        'cv_rmse': float(-search.best_score_),
+    }
+
+    version = args.version or datetime.now().strftime('%Y.%m.%d.%H%M')
+    output = args.output or os.path.join(args.output_dir, f'rent_prediction_model-{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    metadata = export_artifact(
+        search.best_estimator_.booster_, encoder, features, output, version, scores['rmse'],
+        extra={
+            'metrics': scores,
+            'params': search.best_params_,
+            'training_data': {os.path.basename(p): _file_hash([p]) for p in args.data},
+            'train_rows': len(X_train),
+            'test_rows': len(X_test),
+            'seed': args.seed,
+        },
+    )
+    return output, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', action='append', help='CSV or properties JSON; repeat for several (default: both bundled files)')
+    parser.add_argument('--version', help='model version (default: the current date and time)')
+    parser.add_argument('--output', help='sidecar path (default: <output-dir>/rent_prediction_model-<version>.json)')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="feature cache; '' turns it off")
+    parser.add_argument('--n-iter', type=int, default=40, help='hyperparameter candidates to try')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='parallel worker processes for the search')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    args.data = args.data or DEFAULT_DATA
+
+    logging.basicConfig(level=logging.INFO)
+    output, metadata = train(args)
+    scores = metadata['metrics']
+    print(f"Wrote {output} (version {metadata['version']}): test RMSE {scores['rmse']:.2f}, "
+          f"MAE {scores['mae']:.2f}, R2 {scores['r2']:.3f}, CV RMSE {scores['cv_rmse']:.2f}")
+
+
+if __name__ == '__main__':
+    main()